@@ -0,0 +1,72 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the scripts import their siblings as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "rest_apis"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "combine_feedbacks"))
+import app
+import config
+from client import get_client
+from moodle_stub import INTERNSHIPS_CATEGORY, TOKEN, MoodleStub, Scale
+from throttle import Throttle
+
+
+@pytest.fixture(scope="session")
+def stub():
+    with MoodleStub(Scale(courses=40, attempts=20, users=200)) as stub:
+        yield stub
+
+
+@pytest.fixture
+def moodle(stub, monkeypatch):
+    """point rest_apis and combine_feedbacks at the stub"""
+    url = stub.url + "/webservice/rest/server.php"
+    monkeypatch.setattr(config, "url", url)
+    monkeypatch.setattr(config, "token", TOKEN)
+    monkeypatch.setitem(app.conf, "DOMAIN", stub.url)
+    monkeypatch.setitem(app.conf, "URL", url)
+    monkeypatch.setitem(app.conf, "TOKEN", TOKEN)
+    monkeypatch.setitem(app.conf, "CATEGORY", str(INTERNSHIPS_CATEGORY))
+    monkeypatch.setitem(app.conf, "IGNORED_COURSES", "")
+    monkeypatch.delitem(app.conf, "DEBUG", raising=False)
+    client = get_client(url, TOKEN)
+    # time the scripts, not the rate limiter or a cache
+    client.throttle = Throttle(rate=0)
+    client.cache = None
+    stub.requests.clear()
+    return stub
+
+
+@pytest.fixture
+def bench(benchmark, moodle):
+    """benchmark a function against the stub, recording the requests each
+    round makes so throughput can be compared as requests per second"""
+
+    def run(fn, *args, **kwargs):
+        def round():
+            moodle.requests.clear()
+            return fn(*args, **kwargs)
+
+        result = benchmark(round)
+        benchmark.extra_info["requests"] = sum(moodle.requests.values())
+        return result
+
+    return run
+
+
+@pytest.fixture
+def bench_rows(benchmark):
+    """benchmark a function that processes `rows` input rows, recording the
+    rows per second"""
+
+    def run(rows, fn, *args, **kwargs):
+        result = benchmark(fn, *args, **kwargs)
+        benchmark.extra_info["rows"] = rows
+        if benchmark.stats:
+            benchmark.extra_info["rows_per_second"] = rows / benchmark.stats.stats.mean
+        return result
+
+    return run
@@ -0,0 +1,236 @@
+"""Generate realistic enroll inputs at any size.
+
+- Workday "Students for Internship Review" XLSX reports for interns.py
+- new student CSVs for nso.py
+- IXD intern CSVs for ixd_interns.py
+
+Rows are drawn from a seeded random generator with a realistic mix of
+programs, class standings, record statuses, international students, and
+students missing a CCA email, so the same arguments always produce the same
+file.
+
+    uv run python benchmarks/enroll_data.py workday -n 100000 -o data/report.xlsx
+    uv run python benchmarks/enroll_data.py nso -n 1M -o data/incoming.csv
+"""
+
+import csv
+import random
+from pathlib import Path
+from typing import Any, Iterator
+
+import click
+from openpyxl import Workbook
+
+TITLE: str = "Students for Internship Review"
+WORKDAY_HEADER: list[str] = [
+    "Student",
+    "Student ID",
+    "CCA Email",
+    "Primary Program of Study",
+    "Primary Program of Study Record Status",
+    "Latest Class Standing",
+    "Is International Student",
+    "Expected Completion Date",
+]
+# (program, weight), most students are in programs without an internship
+PROGRAMS: list[tuple[str, int]] = [
+    ("Architecture", 10),
+    ("Graduate Architecture", 4),
+    ("Graphic Design", 10),
+    ("Industrial Design", 6),
+    ("Interaction Design", 6),
+    ("Interior Design", 6),
+    ("Animation", 10),
+    ("Fine Arts", 12),
+    ("Illustration", 12),
+    ("Photography", 6),
+    ("Writing and Literature", 6),
+    ("Fashion Design", 6),
+    ("Furniture", 6),
+]
+STANDINGS: list[tuple[str, int]] = [
+    ("First Year", 25),
+    ("Second Year", 25),
+    ("Third Year", 25),
+    ("Fourth Year", 20),
+    ("Fifth Year", 5),
+]
+STATUSES: list[tuple[str, int]] = [
+    ("In Progress", 90),
+    ("Completed", 4),
+    ("Withdrawn", 3),
+    ("Suspended", 3),
+]
+APPLICANT_TYPES: list[tuple[str, int]] = [
+    ("First Year", 55),
+    ("Transfer", 25),
+    ("Graduate", 15),
+    ("Second Degree", 5),
+]
+FIRST_NAMES: list[str] = ["Ada", "Bo", "Cruz", "Dana", "Eun", "Femi", "Gus", "Hana"]
+LAST_NAMES: list[str] = ["Ito", "Jones", "Khan", "Lopez", "Moss", "Ng", "Okafor"]
+SIZES: dict[str, int] = {"k": 1_000, "m": 1_000_000}
+
+
+def row_count(value: str) -> int:
+    """parse row counts like 1000, 100k, or 1M"""
+    value = value.strip().lower()
+    if value[-1:] in SIZES:
+        return int(float(value[:-1]) * SIZES[value[-1]])
+    return int(value)
+
+
+class Students:
+    """seeded source of fake student attributes
+
+    Args:
+        seed (int): random seed
+        intl_ratio (float): fraction of international students
+        missing_email_ratio (float): fraction of students without a CCA email
+    """
+
+    def __init__(
+        self, seed: int = 0, intl_ratio: float = 0.1, missing_email_ratio: float = 0.02
+    ):
+        self.random = random.Random(seed)
+        self.intl_ratio: float = intl_ratio
+        self.missing_email_ratio: float = missing_email_ratio
+
+    def pick(self, choices: list[tuple[str, int]], n: int) -> list[str]:
+        values, weights = zip(*choices)
+        return self.random.choices(values, weights, k=n)
+
+    def names(self, n: int) -> list[str]:
+        return [
+            f"{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}"
+            for _ in range(n)
+        ]
+
+    def emails(self, start: int, n: int) -> list[str]:
+        """CCA emails, with a personal address or nothing for students who
+        haven't set up their CCA account yet"""
+        emails: list[str] = []
+        for i in range(start, start + n):
+            if self.random.random() < self.missing_email_ratio:
+                emails.append(
+                    "" if self.random.random() < 0.5 else f"student{i}@gmail.com"
+                )
+            else:
+                emails.append(f"student{i}@cca.edu")
+        return emails
+
+    def intl(self, n: int) -> list[str]:
+        return [
+            "Yes" if self.random.random() < self.intl_ratio else "No" for _ in range(n)
+        ]
+
+
+def chunks(rows: int, size: int = 10_000) -> Iterator[tuple[int, int]]:
+    """(start, count) pairs so columns are generated a chunk at a time"""
+    for start in range(0, rows, size):
+        yield start, min(size, rows - start)
+
+
+def workday_rows(students: Students, rows: int) -> Iterator[list[Any]]:
+    for start, n in chunks(rows):
+        yield from zip(
+            students.names(n),
+            [str(100000 + i) for i in range(start, start + n)],
+            students.emails(start, n),
+            students.pick(PROGRAMS, n),
+            students.pick(STATUSES, n),
+            students.pick(STANDINGS, n),
+            students.intl(n),
+            ["2027-05-15"] * n,
+        )
+
+
+def write_workday(
+    path: Path, rows: int, students: Students | None = None, title: bool = True
+) -> None:
+    """write a Workday report XLSX with `rows` students
+
+    Args:
+        title (bool): start with the report's title row like Workday does
+    """
+    students = students or Students()
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    if title:
+        sheet.append([TITLE])
+    sheet.append(WORKDAY_HEADER)
+    for row in workday_rows(students, rows):
+        sheet.append(list(row))
+    workbook.save(path)
+
+
+def write_nso(path: Path, rows: int, students: Students | None = None) -> None:
+    """write a new students CSV with nso.py's default column names"""
+    students = students or Students()
+    with open(path, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(
+            ["Student", "CCA email", "Applicant Type", "Is International Student"]
+        )
+        for start, n in chunks(rows):
+            writer.writerows(
+                zip(
+                    students.names(n),
+                    students.emails(start, n),
+                    students.pick(APPLICANT_TYPES, n),
+                    # blank rather than "No", like the real export
+                    [i if i == "Yes" else "" for i in students.intl(n)],
+                )
+            )
+
+
+def write_ixd(path: Path, rows: int, students: Students | None = None) -> None:
+    """write an IXD interns CSV with email and international columns"""
+    students = students or Students()
+    with open(path, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["name", "email", "international"])
+        for start, n in chunks(rows):
+            writer.writerows(
+                zip(students.names(n), students.emails(start, n), students.intl(n))
+            )
+
+
+writers = {"workday": write_workday, "nso": write_nso, "ixd": write_ixd}
+
+
+@click.command(help="Generate synthetic enroll input files.")
+@click.help_option("-h", "--help")
+@click.argument("kind", type=click.Choice(list(writers)))
+@click.option(
+    "-n",
+    "--rows",
+    default="1k",
+    help="Number of students, e.g. 1000, 100k, 1M (default: 1k)",
+)
+@click.option(
+    "-o",
+    "--outfile",
+    required=True,
+    help="File to write (XLSX for workday, CSV otherwise)",
+    type=click.Path(dir_okay=False, path_type=Path),
+)
+@click.option("--seed", default=0, help="Random seed (default: 0)")
+@click.option(
+    "--intl-ratio",
+    default=0.1,
+    help="Fraction of international students (default: 0.1)",
+)
+@click.option(
+    "--missing-email-ratio",
+    default=0.02,
+    help="Fraction of students without a CCA email (default: 0.02)",
+)
+def main(kind, rows, outfile, seed, intl_ratio, missing_email_ratio):
+    students = Students(seed, intl_ratio, missing_email_ratio)
+    writers[kind](outfile, row_count(rows), students)
+    click.echo(f"Wrote {row_count(rows)} {kind} rows to {outfile}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Measure rows/sec and peak memory of each enroll entry point.
+
+Each script runs in its own process on generated inputs (see enroll_data.py)
+so its peak RSS isn't mixed up with the generator's or another script's.
+Times include starting Python and importing the script, which only matters
+for the smallest size.
+
+    uv run python benchmarks/enroll_throughput.py --sizes 1k,100k,1M --json results.json
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import click
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from enroll_data import Students, row_count, write_ixd, write_nso, write_workday
+
+project_root: Path = Path(__file__).resolve().parent.parent
+SEMESTER: str = "Fall 2025"
+
+
+def inputs(data_dir: Path, rows: int, seed: int) -> dict[str, Path]:
+    """generate (or reuse) the input files for a size"""
+    paths: dict[str, Path] = {
+        "workday": data_dir / f"workday-{rows}.xlsx",
+        "nso": data_dir / f"nso-{rows}.csv",
+        "ixd": data_dir / f"ixd-{rows}.csv",
+    }
+    for kind, write in (
+        ("workday", write_workday),
+        ("nso", write_nso),
+        ("ixd", write_ixd),
+    ):
+        if not paths[kind].exists():
+            write(paths[kind], rows, Students(seed))
+    sources: Path = data_dir / f"sources-{rows}.toml"
+    sources.write_text(
+        f'semester = "{SEMESTER}"\n'
+        f'[[workday]]\npath = "{paths["workday"]}"\n'
+        f'[[ixd]]\npath = "{paths["ixd"]}"\n'
+        f'[[nso]]\npath = "{paths["nso"]}"\ncourse = "NSO-{{type}}-2025FA"\n'
+    )
+    paths["pipeline"] = sources
+    return paths
+
+
+def commands(paths: dict[str, Path], out: Path) -> dict[str, list[str]]:
+    """enroll module and arguments of each entry point, interns writes
+    enrollments.csv to the working directory"""
+    return {
+        "interns": ["interns", "-r", str(paths["workday"]), "-s", SEMESTER],
+        "nso": ["nso", str(paths["nso"]), "-o", str(out), "-c", "NSO-{type}-2025FA"],
+        "ixd_interns": [
+            "ixd_interns",
+            "-i",
+            str(paths["ixd"]),
+            "-s",
+            SEMESTER,
+            "-o",
+            str(out),
+        ],
+        "pipeline": ["pipeline", str(paths["pipeline"]), "-o", str(out)],
+    }
+
+
+def run(args: list[str], cwd: Path) -> tuple[float, int]:
+    """run an enroll script, returning its wall time and peak RSS in bytes"""
+    start: float = time.perf_counter()
+    # the scripts are run as modules of the enroll package, from cwd
+    process = subprocess.Popen(
+        [sys.executable, "-m", f"enroll.{args[0]}", *args[1:]],
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": str(project_root)},
+        stdout=subprocess.DEVNULL,
+    )
+    # wait4 gives this child's own resource usage
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds: float = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode:
+        raise click.ClickException(f"{' '.join(args)} exited {process.returncode}")
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return seconds, usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+@click.command(help="Benchmark the enroll scripts on generated inputs.")
+@click.help_option("-h", "--help")
+@click.option(
+    "--sizes",
+    default="1k,100k",
+    help="Comma-separated input sizes (default: 1k,100k)",
+)
+@click.option(
+    "--data-dir",
+    help="Keep generated inputs here to reuse them (default: a temp directory)",
+    type=click.Path(file_okay=False, path_type=Path),
+)
+@click.option("--seed", default=0, help="Random seed for the inputs (default: 0)")
+@click.option(
+    "--json",
+    "json_path",
+    help="Also save the results to this JSON file",
+    type=click.Path(dir_okay=False, path_type=Path),
+)
+def main(sizes: str, data_dir: Path | None, seed: int, json_path: Path | None):
+    results: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = data_dir or Path(tmp)
+        data_dir.mkdir(parents=True, exist_ok=True)
+        click.echo(
+            f"{'entry point':<14} {'rows':>9} {'seconds':>9} {'rows/s':>10} {'peak RSS':>10}"
+        )
+        for size in sizes.split(","):
+            rows: int = row_count(size)
+            paths: dict[str, Path] = inputs(data_dir.resolve(), rows, seed)
+            for name, args in commands(paths, Path(tmp) / "out.csv").items():
+                seconds, rss = run(args, Path(tmp))
+                # the pipeline reads all three inputs
+                total: int = rows * 3 if name == "pipeline" else rows
+                results.append(
+                    {
+                        "entry_point": name,
+                        "rows": total,
+                        "seconds": seconds,
+                        "rows_per_second": total / seconds,
+                        "peak_rss": rss,
+                    }
+                )
+                click.echo(
+                    f"{name:<14} {total:>9} {seconds:>9.2f} {total / seconds:>10.0f} "
+                    f"{rss / 1024 / 1024:>8.1f}MB"
+                )
+    if json_path:
+        with open(json_path, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,605 @@
+"""Local stand-in for Moodle's REST web service API.
+
+Serves synthetic, deterministic data for the web service functions our
+scripts call so they can be tested and timed without production Moodle:
+
+- core_course_get_categories
+- core_course_get_courses
+- core_course_get_courses_by_field
+- core_enrol_get_enrolled_users
+- core_group_get_course_groups
+- core_user_get_users_by_field
+- mod_feedback_get_feedbacks_by_courses
+- mod_feedback_get_responses_analysis
+
+It records the enrollments and groups made with enrol_manual_enrol_users,
+core_group_create_groups, and core_group_add_group_members so they show up in
+later rosters. The size of the fake site is set with Scale, and latency, HTTP
+503s, and Moodle's transient HTTP 200 exceptions can be injected to exercise
+retries.
+
+Run it standalone and point a script's --domain at it:
+
+    uv run python benchmarks/moodle_stub.py --courses 500 --port 8000
+    uv run python combine_feedbacks/app.py -d http://127.0.0.1:8000 -t stub -c 1
+"""
+
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+import click
+
+TOKEN: str = "stub"
+# category ids: the internships category, then a category per term with a
+# child category per department
+INTERNSHIPS_CATEGORY: int = 1
+TERMS: list[str] = ["2025FA", "2026SP"]
+DEPARTMENTS: list[str] = ["ANIMA", "ARCHT", "GRAPH", "INTER", "PHOTO"]
+INTERNSHIP_COURSES: list[str] = ["BARCH-INTRN", "GRAPH-INTRN", "INTER-INTRN"]
+FEEDBACK_NAMES: list[str] = [
+    "Submit Employer and Intern Information",
+    "Midterm Evaluation",
+    "Final Evaluation",
+    "Course Survey",
+]
+# every username is a user except these
+MISSING_USER_PREFIX: str = "nobody"
+# every course has this group, with the course's id, and half of its
+# generated users are in it
+SEMESTER_GROUP: str = "Fall 2025"
+QUESTIONS: list[str] = [
+    "(Name) Your name",
+    "(Email) Your email",
+    "(Employer) Company name",
+    "(Connection) How did you find this internship?",
+    "(Hours) Hours per week",
+    "(Comments) Anything else?",
+]
+
+
+@dataclass
+class Scale:
+    """size of the fake Moodle site
+
+    Args:
+        courses (int): courses in each term department and in the internships
+            category
+        attempts (int): responses to each feedback
+        users (int): users enrolled in each course
+        seed (int): seed for the generated data
+    """
+
+    courses: int = 20
+    attempts: int = 10
+    users: int = 30
+    seed: int = 0
+
+
+def php_arrays(query: dict[str, list[str]]) -> dict[str, Any]:
+    """undo PHP array flattening, {"a[0][key]": ["x"]} -> {"a": {"0": {"key": "x"}}}"""
+    params: dict[str, Any] = {}
+    for key, values in query.items():
+        parts: list[str] = key.replace("]", "").split("[")
+        node: dict[str, Any] = params
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = values[-1]
+    return params
+
+
+def listed(value: Any) -> list[Any]:
+    """a PHP array that was parsed into a dict keyed by index"""
+    if isinstance(value, dict):
+        return [value[k] for k in sorted(value, key=int)]
+    return [] if value is None else [value]
+
+
+class MoodleData:
+    """synthetic Moodle site, responses are generated on request from ids so
+    memory doesn't grow with the number of attempts or users
+
+    Users looked up by username get ids in the order they're first looked up,
+    and only those users can be enrolled or added to groups.
+    """
+
+    def __init__(self, scale: Scale):
+        self.scale: Scale = scale
+        self.lock = threading.Lock()
+        self.user_ids: dict[str, int] = {}
+        self.usernames: dict[int, str] = {}
+        # course id -> user ids enrolled with enrol_manual_enrol_users
+        self.enrolments: dict[int, set[int]] = {}
+        self.categories: list[dict[str, Any]] = [
+            self.category(INTERNSHIPS_CATEGORY, "Internships", 0)
+        ]
+        self.courses: list[dict[str, Any]] = []
+        id: int = 2
+        for term in TERMS:
+            term_id: int = id
+            self.categories.append(self.category(term_id, term, 0))
+            id += 1
+            for department in DEPARTMENTS:
+                self.categories.append(self.category(id, department, term_id))
+                for n in range(scale.courses):
+                    self.add_course(f"{department}-{1000 + n}-1-{term}", id)
+                id += 1
+        for shortname in INTERNSHIP_COURSES:
+            self.add_course(shortname, INTERNSHIPS_CATEGORY)
+        for n in range(scale.courses - len(INTERNSHIP_COURSES)):
+            self.add_course(f"INTRN-{n}", INTERNSHIPS_CATEGORY)
+        self.by_id: dict[int, dict[str, Any]] = {c["id"]: c for c in self.courses}
+        self.by_shortname: dict[str, dict[str, Any]] = {
+            c["shortname"]: c for c in self.courses
+        }
+        # course id -> group name -> group
+        self.groups: dict[int, dict[str, dict[str, Any]]] = {
+            id: {SEMESTER_GROUP: self.group(id, id, SEMESTER_GROUP)}
+            for id in self.by_id
+        }
+        # group id -> (course id, user ids added with core_group_add_group_members)
+        self.members: dict[int, tuple[int, set[int]]] = {
+            id: (id, set()) for id in self.by_id
+        }
+
+    def category(self, id: int, name: str, parent: int) -> dict[str, Any]:
+        path: str = f"/{parent}/{id}" if parent else f"/{id}"
+        return {
+            "id": id,
+            "name": name,
+            "idnumber": "",
+            "description": "",
+            "parent": parent,
+            "coursecount": 0,
+            "visible": 1,
+            "timemodified": 1700000000,
+            "depth": path.count("/"),
+            "path": path,
+        }
+
+    def group(self, id: int, course: int, name: str) -> dict[str, Any]:
+        return {"id": id, "courseid": course, "name": name, "description": ""}
+
+    def add_course(self, shortname: str, category: int) -> None:
+        id: int = len(self.courses) + 100
+        self.courses.append(
+            {
+                "id": id,
+                "shortname": shortname,
+                "fullname": f"{shortname} Course",
+                "categoryid": category,
+                "summary": f"<p>Synthetic course {shortname} &amp; friends</p>",
+                "visible": 1,
+                "startdate": 1700000000,
+                "enddate": 1710000000,
+            }
+        )
+
+    def get_categories(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        criteria: list[dict[str, str]] = listed(params.get("criteria"))
+        if not criteria:
+            return self.categories
+        paths: list[str] = [
+            c["path"]
+            for c in self.categories
+            if all(str(c.get(k["key"])) == k["value"] for k in criteria)
+        ]
+        # matching categories and all their children
+        return [
+            c
+            for c in self.categories
+            if any(c["path"] == p or c["path"].startswith(p + "/") for p in paths)
+        ]
+
+    def get_courses_by_field(self, params: dict[str, Any]) -> dict[str, Any]:
+        field: str = params.get("field", "")
+        value: str = params.get("value", "")
+        if field == "category":
+            courses = [c for c in self.courses if str(c["categoryid"]) == value]
+        elif field == "shortname":
+            courses = [self.by_shortname[value]] if value in self.by_shortname else []
+        elif field == "id":
+            courses = [self.by_id[int(value)]] if int(value) in self.by_id else []
+        elif field == "ids":
+            courses = [
+                self.by_id[int(i)] for i in value.split(",") if int(i) in self.by_id
+            ]
+        else:
+            courses = self.courses
+        return {"courses": courses, "warnings": []}
+
+    def get_feedbacks_by_courses(self, params: dict[str, Any]) -> dict[str, Any]:
+        feedbacks: list[dict[str, Any]] = []
+        for courseid in listed(params.get("courseids")):
+            course: int = int(courseid)
+            if course not in self.by_id:
+                continue
+            for n, name in enumerate(FEEDBACK_NAMES):
+                feedbacks.append(
+                    {
+                        "id": course * 10 + n,
+                        "course": course,
+                        "coursemodule": course * 100 + n,
+                        "name": name,
+                        "intro": "",
+                        "anonymous": 1,
+                    }
+                )
+        return {"feedbacks": feedbacks, "warnings": []}
+
+    def get_responses_analysis(self, params: dict[str, Any]) -> dict[str, Any]:
+        feedbackid: int = int(params["feedbackid"])
+        rng = random.Random(self.scale.seed * 1_000_003 + feedbackid)
+        attempts: list[dict[str, Any]] = []
+        for n in range(self.scale.attempts):
+            responses: list[dict[str, Any]] = []
+            for q, question in enumerate(QUESTIONS):
+                value: str = f"{question.split(')')[0][1:]} {feedbackid}-{n} & co"
+                responses.append(
+                    {
+                        "id": feedbackid * 100 + q,
+                        "name": question,
+                        "printval": value.replace("&", "&amp;"),
+                        "rawval": str(rng.randint(1, 5)) if q == 3 else value,
+                    }
+                )
+            attempts.append(
+                {
+                    "id": feedbackid * 1000 + n,
+                    "courseid": 0,
+                    "userid": 0,
+                    "timemodified": 1700000000 + n,
+                    "fullname": "",
+                    "responses": responses,
+                }
+            )
+        # perpage 0 is every attempt
+        perpage: int = int(params.get("perpage", 0))
+        start: int = int(params.get("page", 0)) * perpage
+        return {
+            "attempts": [],
+            "totalattempts": 0,
+            "anonattempts": attempts[start : start + perpage] if perpage else attempts,
+            "totalanonattempts": len(attempts),
+            "warnings": [],
+        }
+
+    def user(self, course: int, n: int) -> dict[str, Any]:
+        """a full user profile, as big as Moodle's (other enrollments and all)"""
+        username: str = f"user{(course * 7919 + n) % 100000}"
+        return {
+            "id": course * 100000 + n,
+            "username": username,
+            "fullname": f"User {n}",
+            "email": f"{username}@cca.edu",
+            "department": "",
+            "firstaccess": 1700000000,
+            "lastaccess": 1700000000,
+            "preferences": [{"name": f"pref{p}", "value": "1"} for p in range(10)],
+            "roles": [{"roleid": 5, "name": "", "shortname": "student"}],
+            "groups": [{"id": course, "name": SEMESTER_GROUP, "description": ""}]
+            if n % 2
+            else [],
+            "enrolledcourses": [
+                {"id": c, "fullname": f"Course {c}", "shortname": f"C{c}"}
+                for c in range(course, course + 5)
+            ],
+        }
+
+    def enrolled_user(self, course: int, userid: int) -> dict[str, Any]:
+        """a user we enrolled, with the groups we added them to"""
+        username: str = self.usernames[userid]
+        return {
+            "id": userid,
+            "username": username,
+            "fullname": username.title(),
+            "email": f"{username}@cca.edu",
+            "roles": [{"roleid": 5, "name": "", "shortname": "student"}],
+            "groups": [
+                {"id": g["id"], "name": g["name"], "description": ""}
+                for g in self.groups[course].values()
+                if userid in self.members[g["id"]][1]
+            ],
+        }
+
+    def get_enrolled_users(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        course: int = int(params["courseid"])
+        if course not in self.by_id:
+            raise StubError("invalidrecord", "Can't find data record in database.")
+        options: dict[str, str] = {
+            o["name"]: o["value"] for o in listed(params.get("options"))
+        }
+        with self.lock:
+            enrolled: list[int] = sorted(self.enrolments.get(course, ()))
+        total: int = self.scale.users + len(enrolled)
+        start: int = int(options.get("limitfrom", 0))
+        limit: int = int(options.get("limitnumber", 0))
+        stop: int = min(total, start + limit) if limit else total
+        users: list[dict[str, Any]] = [
+            self.user(course, n) for n in range(start, min(stop, self.scale.users))
+        ]
+        with self.lock:
+            users += [
+                self.enrolled_user(course, userid)
+                for userid in enrolled[
+                    max(0, start - self.scale.users) : max(0, stop - self.scale.users)
+                ]
+            ]
+        if "userfields" in options:
+            fields: set[str] = {"id", *options["userfields"].split(",")}
+            users = [{k: v for k, v in u.items() if k in fields} for u in users]
+        return users
+
+    def get_users_by_field(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        if params.get("field") != "username":
+            raise StubError("invalidparameter", "Invalid parameter value detected")
+        users: list[dict[str, Any]] = []
+        with self.lock:
+            for username in listed(params.get("values")):
+                if username.startswith(MISSING_USER_PREFIX):
+                    continue
+                if username not in self.user_ids:
+                    userid: int = 10_000_000 + len(self.user_ids)
+                    self.user_ids[username] = userid
+                    self.usernames[userid] = username
+                users.append(
+                    {
+                        "id": self.user_ids[username],
+                        "username": username,
+                        "fullname": username.title(),
+                        "email": f"{username}@cca.edu",
+                    }
+                )
+        return users
+
+    def enrol_users(self, params: dict[str, Any]) -> None:
+        enrolments: list[dict[str, str]] = listed(params.get("enrolments"))
+        with self.lock:
+            # Moodle checks the whole batch before enrolling anyone
+            for enrolment in enrolments:
+                if int(enrolment["courseid"]) not in self.by_id:
+                    raise StubError("invalidrecord", "Can't find course record.")
+                if int(enrolment["userid"]) not in self.usernames:
+                    raise StubError("invalidrecord", "Can't find user record.")
+            for enrolment in enrolments:
+                self.enrolments.setdefault(int(enrolment["courseid"]), set()).add(
+                    int(enrolment["userid"])
+                )
+
+    def get_course_groups(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        course: int = int(params["courseid"])
+        if course not in self.by_id:
+            raise StubError("invalidrecord", "Can't find data record in database.")
+        with self.lock:
+            return list(self.groups[course].values())
+
+    def create_groups(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        groups: list[dict[str, str]] = listed(params.get("groups"))
+        with self.lock:
+            names: set[tuple[int, str]] = set()
+            for group in groups:
+                course: int = int(group["courseid"])
+                if course not in self.by_id:
+                    raise StubError("invalidrecord", "Can't find course record.")
+                name: str = group["name"]
+                if name in self.groups[course] or (course, name) in names:
+                    raise StubError("invalidparameter", f"Group {name} already exists")
+                names.add((course, name))
+            created: list[dict[str, Any]] = []
+            for group in groups:
+                # after the semester groups' ids, which are course ids
+                id: int = 1_000_000 + len(self.members)
+                course = int(group["courseid"])
+                created.append(self.group(id, course, group["name"]))
+                self.groups[course][group["name"]] = created[-1]
+                self.members[id] = (course, set())
+        return created
+
+    def add_group_members(self, params: dict[str, Any]) -> None:
+        members: list[dict[str, str]] = listed(params.get("members"))
+        with self.lock:
+            for member in members:
+                groupid, userid = int(member["groupid"]), int(member["userid"])
+                if groupid not in self.members:
+                    raise StubError("invalidrecord", "Can't find group record.")
+                if userid not in self.enrolments.get(self.members[groupid][0], ()):
+                    raise StubError("userisnotaparticipant", "The user is not enrolled")
+            for member in members:
+                self.members[int(member["groupid"])][1].add(int(member["userid"]))
+
+    def call(self, wsfunction: str, params: dict[str, Any]) -> Any:
+        if wsfunction == "core_course_get_categories":
+            return self.get_categories(params)
+        if wsfunction == "core_course_get_courses":
+            return self.courses
+        if wsfunction == "core_course_get_courses_by_field":
+            return self.get_courses_by_field(params)
+        if wsfunction == "core_enrol_get_enrolled_users":
+            return self.get_enrolled_users(params)
+        if wsfunction == "core_group_add_group_members":
+            return self.add_group_members(params)
+        if wsfunction == "core_group_create_groups":
+            return self.create_groups(params)
+        if wsfunction == "core_group_get_course_groups":
+            return self.get_course_groups(params)
+        if wsfunction == "core_user_get_users_by_field":
+            return self.get_users_by_field(params)
+        if wsfunction == "enrol_manual_enrol_users":
+            return self.enrol_users(params)
+        if wsfunction == "mod_feedback_get_feedbacks_by_courses":
+            return self.get_feedbacks_by_courses(params)
+        if wsfunction == "mod_feedback_get_responses_analysis":
+            return self.get_responses_analysis(params)
+        raise StubError("invalidrecord", f"Can't find function {wsfunction}")
+
+
+class StubError(Exception):
+    """becomes one of Moodle's HTTP 200 exception payloads"""
+
+    def __init__(self, errorcode: str, message: str):
+        self.errorcode: str = errorcode
+        self.message: str = message
+        super().__init__(message)
+
+
+class StubServer(ThreadingHTTPServer):
+    # queue bursts of new connections like a real web server does, with the
+    # default backlog of 5 an async client opening dozens of connections at
+    # once has SYNs dropped and stalls for a second
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class MoodleStub:
+    """threaded HTTP server answering Moodle web service requests
+
+    Args:
+        scale (Scale): size of the fake site (default: Scale())
+        latency (float): seconds to wait before each response
+        error_rate (float): fraction of requests answered with HTTP 503
+        moodle_error_rate (float): fraction answered with a transient
+            dmlreadexception payload
+        port (int): port to listen on, 0 for any free port
+    """
+
+    def __init__(
+        self,
+        scale: Scale | None = None,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        moodle_error_rate: float = 0.0,
+        port: int = 0,
+    ):
+        self.data: MoodleData = MoodleData(scale or Scale())
+        self.latency: float = latency
+        self.error_rate: float = error_rate
+        self.moodle_error_rate: float = moodle_error_rate
+        self.requests: dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.random = random.Random((scale or Scale()).seed)
+        self.server = StubServer(("127.0.0.1", port), self.handler())
+        self.thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """domain to configure scripts with (no trailing slash)"""
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self) -> "MoodleStub":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def start(self) -> str:
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, query: dict[str, list[str]]) -> tuple[int, Any]:
+        """HTTP status and JSON body for a request's parameters"""
+        params: dict[str, Any] = php_arrays(query)
+        wsfunction: str = params.get("wsfunction", "")
+        with self.lock:
+            self.requests[wsfunction] = self.requests.get(wsfunction, 0) + 1
+            roll: float = self.random.random()
+        if self.latency:
+            time.sleep(self.latency)
+        if roll < self.error_rate:
+            return 503, ""
+        if roll < self.error_rate + self.moodle_error_rate:
+            return 200, {
+                "exception": "dml_read_exception",
+                "errorcode": "dmlreadexception",
+                "message": "Error reading from database",
+            }
+        if params.get("wstoken") != TOKEN:
+            return 200, {
+                "exception": "moodle_exception",
+                "errorcode": "invalidtoken",
+                "message": "Invalid token - token not found",
+            }
+        try:
+            return 200, self.data.call(wsfunction, params)
+        except StubError as e:
+            return 200, {
+                "exception": "moodle_exception",
+                "errorcode": e.errorcode,
+                "message": e.message,
+            }
+
+    def handler(self) -> type[BaseHTTPRequestHandler]:
+        stub: MoodleStub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # send headers and body in one packet, otherwise Nagle's algorithm
+            # and delayed ACKs add 40ms to every keep-alive request
+            wbufsize = 64 * 1024
+
+            def do_GET(self):
+                self.reply(parse_qs(urlparse(self.path).query))
+
+            def do_POST(self):
+                length: int = int(self.headers.get("Content-Length", 0))
+                self.reply(parse_qs(self.rfile.read(length).decode()))
+
+            def reply(self, query: dict[str, list[str]]) -> None:
+                status, data = stub.respond(query)
+                # void wsfunctions answer with a JSON null, 503s with nothing
+                body: bytes = b"" if data == "" else json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
+
+
+@click.command(help="Serve a synthetic Moodle web service API for testing.")
+@click.help_option("-h", "--help")
+@click.option("--port", "-p", default=8000, help="Port to listen on (default: 8000)")
+@click.option("--courses", default=20, help="Courses per category (default: 20)")
+@click.option("--attempts", default=10, help="Responses per feedback (default: 10)")
+@click.option("--users", default=30, help="Users per course (default: 30)")
+@click.option("--latency", default=0.0, help="Seconds of latency per request")
+@click.option("--error-rate", default=0.0, help="Fraction of HTTP 503 responses")
+@click.option(
+    "--moodle-error-rate",
+    default=0.0,
+    help="Fraction of transient Moodle exception responses",
+)
+def main(port, courses, attempts, users, latency, error_rate, moodle_error_rate):
+    stub = MoodleStub(
+        Scale(courses, attempts, users),
+        latency,
+        error_rate,
+        moodle_error_rate,
+        port,
+    )
+    click.echo(
+        f"Serving {len(stub.data.courses)} courses at {stub.url} "
+        f"(token {TOKEN}, internships category {INTERNSHIPS_CATEGORY})"
+    )
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
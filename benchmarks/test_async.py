@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from click.testing import CliRunner
+
+import app
+import config
+import enrol_get_enrolled_users
+from async_client import AsyncMoodleClient
+from client import POOL_SIZE, get_client
+from moodle_stub import TOKEN
+from throttle import Throttle
+
+# seconds the stub waits before each response, like a real network round trip
+LATENCY = 0.02
+
+
+def unthrottled(url, token, max_connections=POOL_SIZE, **kwargs):
+    """async client without a rate limit, like the `moodle` fixture's client"""
+    limits = Throttle(rate=0, max_limit=max_connections)
+    return AsyncMoodleClient(url, token, max_connections, throttle=limits, **kwargs)
+
+
+@pytest.fixture
+def slow(moodle, monkeypatch):
+    monkeypatch.setattr(moodle, "latency", LATENCY)
+    monkeypatch.setattr(app, "AsyncMoodleClient", unthrottled)
+    monkeypatch.setattr(enrol_get_enrolled_users, "AsyncMoodleClient", unthrottled)
+    return moodle
+
+
+@pytest.mark.parametrize("mode", ["threads", "async"])
+@pytest.mark.parametrize("concurrency", [8, 32])
+def test_get_responses(bench, slow, mode, concurrency):
+    """the same 120 analyses fetched by a thread pool and by asyncio tasks"""
+    feedbacks = app.get_feedbacks(app.get_courses())
+    if mode == "threads":
+        get_client(config.url, TOKEN).throttle = Throttle(rate=0, max_limit=concurrency)
+        internships, evaluations = bench(app.get_responses, feedbacks, concurrency)
+    else:
+
+        async def get_responses():
+            async with unthrottled(config.url, TOKEN, concurrency) as client:
+                return await app.get_responses_async(client, feedbacks, concurrency)
+
+        internships, evaluations = bench(lambda: asyncio.run(get_responses()))
+    assert len(internships) == 40 and len(evaluations) == 80
+    assert [i["anonattempts"][0]["id"] for i in internships] == sorted(
+        i["anonattempts"][0]["id"] for i in internships
+    )
+
+
+@pytest.mark.parametrize(
+    "categories", [[], ["-c", "1", "-c", "2", "-r", "--per-category"]]
+)
+def test_combine_feedbacks_async(bench, slow, tmp_path, categories):
+    runner = CliRunner()
+    args = ["-n", "16", "--no-cache", *categories]
+    result = runner.invoke(app.main, ["-o", str(tmp_path / "threads"), *args])
+    assert result.exit_code == 0, result.output
+    result = bench(
+        runner.invoke, app.main, ["-o", str(tmp_path / "async"), "--async", *args]
+    )
+    assert result.exit_code == 0, result.output
+    paths = sorted((tmp_path / "threads").glob("*.csv"))
+    assert len(paths) == 4 if categories else 2
+    for path in paths:
+        assert (tmp_path / "async" / path.name).read_text() == path.read_text()
+
+
+def test_enrol_get_enrolled_users_async(bench, slow):
+    courseids = [str(c["id"]) for c in slow.data.courses[:20]]
+    args = [*courseids, "--fields", "username,groups", "-n", "8"]
+    runner = CliRunner()
+    threads = runner.invoke(enrol_get_enrolled_users.main, args)
+    result = bench(runner.invoke, enrol_get_enrolled_users.main, [*args, "--async"])
+    assert result.exit_code == 0, result.output
+    assert result.output == threads.output
@@ -0,0 +1,261 @@
+import csv
+import sqlite3
+import tracemalloc
+from dataclasses import replace
+
+import pytest
+from click.testing import CliRunner
+
+import app
+import warehouse
+from moodle_stub import MoodleData, Scale
+
+
+@pytest.mark.parametrize("concurrency", [1, 8])
+def test_combine_feedbacks(bench, moodle, tmp_path, concurrency):
+    args = ["-o", str(tmp_path), "-n", str(concurrency), "--no-cache"]
+    result = bench(CliRunner().invoke, app.main, args)
+    assert result.exit_code == 0, result.output
+
+    rows = {}
+    for path in tmp_path.glob("*-responses.csv"):
+        with open(path) as fh:
+            rows[path.name.split("-")[3]] = list(csv.reader(fh))
+    # 40 courses with an internship feedback and 2 evaluations, 20 attempts each
+    assert len(rows["internships"]) == 1 + 40 * 20
+    assert len(rows["evaluations"]) == 1 + 40 * 2 * 20
+    assert rows["internships"][0][:2] == ["Name", "Email"]
+    assert moodle.requests["mod_feedback_get_responses_analysis"] == 40 * 3
+
+
+def test_combine_feedbacks_categories(bench, moodle, tmp_path):
+    """the internships category and the 2025FA term, whose department
+    categories are also given, are only fetched once"""
+    args = ["-o", str(tmp_path), "-n", "8", "--no-cache", "-r", "--per-category"]
+    args += ["-c", "1", "-c", "2", "-c", "3"]
+    result = bench(CliRunner().invoke, app.main, args)
+    assert result.exit_code == 0, result.output
+
+    lines = {
+        path.name[11:]: len(path.read_text().splitlines())
+        for path in tmp_path.glob("*-responses.csv")
+    }
+    # 40 courses in the internships category, 5 departments of 40 in 2025FA
+    assert lines == {
+        "category1-internships-responses.csv": 1 + 40 * 20,
+        "category1-evaluations-responses.csv": 1 + 40 * 2 * 20,
+        "category2-internships-responses.csv": 1 + 200 * 20,
+        "category2-evaluations-responses.csv": 1 + 200 * 2 * 20,
+    }
+    assert moodle.requests["core_course_get_categories"] == 1
+    # the 2 roots and 5 department categories
+    assert moodle.requests["core_course_get_courses_by_field"] == 7
+    assert moodle.requests["mod_feedback_get_responses_analysis"] == 240 * 3
+
+
+def test_combine_feedbacks_incremental(moodle, monkeypatch, tmp_path):
+    args = ["-o", str(tmp_path), "-n", "8", "--no-cache", "--incremental"]
+
+    def lines():
+        return {
+            path.name: len(path.read_text().splitlines())
+            for path in tmp_path.glob("*-responses.csv")
+        }
+
+    result = CliRunner().invoke(app.main, args)
+    assert result.exit_code == 0, result.output
+    assert lines() == {
+        "internships-responses.csv": 1 + 40 * 20,
+        "evaluations-responses.csv": 1 + 40 * 2 * 20,
+    }
+
+    # nothing new, so only the one attempt probes are made
+    moodle.requests.clear()
+    result = CliRunner().invoke(app.main, args)
+    assert result.exit_code == 0, result.output
+    assert moodle.requests["mod_feedback_get_responses_analysis"] == 40 * 3
+    assert lines() == {
+        "internships-responses.csv": 1 + 40 * 20,
+        "evaluations-responses.csv": 1 + 40 * 2 * 20,
+    }
+
+    # 5 more attempts on every feedback are appended to the same files
+    monkeypatch.setattr(moodle.data, "scale", replace(moodle.data.scale, attempts=25))
+    moodle.requests.clear()
+    result = CliRunner().invoke(app.main, args)
+    assert result.exit_code == 0, result.output
+    assert moodle.requests["mod_feedback_get_responses_analysis"] == 40 * 3 * 2
+    assert lines() == {
+        "internships-responses.csv": 1 + 40 * 25,
+        "evaluations-responses.csv": 1 + 40 * 2 * 25,
+    }
+
+
+def analyses(count, attempts):
+    """`count` synthetic analyses, each generated as it's consumed like the
+    ones iter_responses() fetches"""
+    data = MoodleData(Scale(attempts=attempts))
+    return (data.get_responses_analysis({"feedbackid": 10 * n}) for n in range(count))
+
+
+def test_write_csv_memory(benchmark, tmp_path):
+    """peak memory writing analyses is bounded by one payload, not by how
+    many analyses there are"""
+
+    def peak(count):
+        tracemalloc.start()
+        try:
+            app.write_csv(analyses(count, 50), f"{count}", tmp_path)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    few = peak(10)
+    many = benchmark.pedantic(peak, (200,), rounds=1, iterations=1)
+    benchmark.extra_info["peak_bytes"] = many
+    lines = (tmp_path / "200-responses.csv").read_text().splitlines()
+    assert len(lines) == 1 + 200 * 50
+    # 20 times the analyses, within noise of the same peak
+    assert many < few * 1.5
+
+
+def test_responses_csv_throughput(bench_rows, tmp_path):
+    """100k attempts, a 1k attempt analysis written 100 times so the input
+    doesn't have to be held in memory"""
+    (analysis,) = analyses(1, 1000)
+
+    def write():
+        with app.ResponsesCSV("throughput", tmp_path) as responses:
+            for _ in range(100):
+                responses.write(analysis)
+        return responses.count
+
+    assert bench_rows(100_000, write) == 100_000
+    with open(tmp_path / "throughput-responses.csv") as fh:
+        header, row = next(csv.reader(fh)), next(csv.reader(fh))
+    assert dict(zip(header, row))["Name"] == "Name 0-0 & co"
+
+
+def test_warehouse_sync(bench, moodle, tmp_path):
+    db = tmp_path / "moodle.db"
+    args = ["sync", "--db", str(db), "-n", "8", "--no-cache"]
+    result = bench(CliRunner().invoke, warehouse.cli, args)
+    assert result.exit_code == 0, result.output
+
+    connection = sqlite3.connect(db)
+    counts = {
+        table: connection.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+        for table in ["courses", "enrolments", "feedbacks", "attempts", "responses"]
+    }
+    connection.close()
+    # every round upserts the same rows, 40 courses with 200 users and 4
+    # feedbacks, 3 of them with 20 attempts of 6 questions
+    assert counts == {
+        "courses": 40,
+        "enrolments": 40 * 200,
+        "feedbacks": 40 * 4,
+        "attempts": 40 * 3 * 20,
+        "responses": 40 * 3 * 20 * 6,
+    }
+    assert moodle.requests["core_enrol_get_enrolled_users"] == 40
+
+
+def test_warehouse_export(moodle, tmp_path):
+    db = tmp_path / "moodle.db"
+    result = CliRunner().invoke(warehouse.cli, ["sync", "--db", str(db), "-n", "8"])
+    assert result.exit_code == 0, result.output
+    result = CliRunner().invoke(app.main, ["-o", str(tmp_path / "app"), "-n", "8"])
+    assert result.exit_code == 0, result.output
+
+    # exports don't make any requests
+    moodle.requests.clear()
+    args = ["export", "--db", str(db), "-o", str(tmp_path / "warehouse")]
+    result = CliRunner().invoke(warehouse.cli, args)
+    assert result.exit_code == 0, result.output
+    assert sum(moodle.requests.values()) == 0
+
+    exported = {p.name for p in (tmp_path / "warehouse").glob("*.csv")}
+    assert len(exported) == 4
+    for path in (tmp_path / "app").glob("*-responses.csv"):
+        assert path.read_text() == (tmp_path / "warehouse" / path.name).read_text()
+    enrolments = next((tmp_path / "warehouse").glob("*-enrolments.csv"))
+    assert len(enrolments.read_text().splitlines()) == 1 + 40 * 200
+
+
+def test_warehouse_export_categories(moodle, tmp_path):
+    """categories synced one at a time export like app.py given all of them"""
+    db = tmp_path / "moodle.db"
+    for category in ("1", "2"):
+        args = ["sync", "--db", str(db), "-n", "8", "-r", "-c", category]
+        result = CliRunner().invoke(warehouse.cli, args)
+        assert result.exit_code == 0, result.output
+    args = ["-o", str(tmp_path / "app"), "-n", "8", "-r", "-c", "1", "-c", "2"]
+    result = CliRunner().invoke(app.main, args)
+    assert result.exit_code == 0, result.output
+
+    args = ["export", "responses", "--db", str(db), "-o", str(tmp_path / "warehouse")]
+    result = CliRunner().invoke(warehouse.cli, args)
+    assert result.exit_code == 0, result.output
+    paths = sorted((tmp_path / "app").glob("*-responses.csv"))
+    assert len(paths) == 2
+    for path in paths:
+        assert path.read_text() == (tmp_path / "warehouse" / path.name).read_text()
+    internships = (tmp_path / "app" / paths[1].name).read_text().splitlines()
+    assert len(internships) == 1 + 240 * 20
+
+
+def test_warehouse_sync_empty_roster(moodle, tmp_path, monkeypatch):
+    """a course everyone left has no users to group by, its enrolments still go"""
+    db = tmp_path / "moodle.db"
+    args = ["sync", "--db", str(db), "-n", "8", "--no-cache"]
+    result = CliRunner().invoke(warehouse.cli, args)
+    assert result.exit_code == 0, result.output
+
+    iter_course_users = warehouse.iter_course_users
+    connection = sqlite3.connect(db)
+    emptied = connection.execute("SELECT min(id) FROM courses").fetchone()[0]
+    monkeypatch.setattr(
+        warehouse,
+        "iter_course_users",
+        lambda *args, **kwargs: (
+            u
+            for u in iter_course_users(*args, **kwargs)
+            if int(u["courseid"]) != emptied
+        ),
+    )
+    result = CliRunner().invoke(warehouse.cli, args)
+    assert result.exit_code == 0, result.output
+    assert connection.execute(
+        "SELECT courseid, count(*) FROM enrolments GROUP BY courseid"
+    ).fetchall() == [
+        (id, 200)
+        for (id,) in connection.execute(
+            "SELECT id FROM courses WHERE id != ? ORDER BY id", (emptied,)
+        )
+    ]
+    connection.close()
+
+
+def test_warehouse_sync_removed_question(moodle, tmp_path, monkeypatch):
+    """answers to a question removed from a feedback go when it's synced again"""
+    db = tmp_path / "moodle.db"
+    args = ["sync", "--db", str(db), "-n", "8", "--no-cache", "--no-enrolments"]
+    result = CliRunner().invoke(warehouse.cli, args)
+    assert result.exit_code == 0, result.output
+
+    iter_responses = app.iter_responses
+
+    def without_last_question(*args, **kwargs):
+        for type, fdbk, data in iter_responses(*args, **kwargs):
+            for attempt in data["anonattempts"]:
+                attempt["responses"] = attempt["responses"][:-1]
+            yield type, fdbk, data
+
+    monkeypatch.setattr(app, "iter_responses", without_last_question)
+    result = CliRunner().invoke(warehouse.cli, args)
+    assert result.exit_code == 0, result.output
+    connection = sqlite3.connect(db)
+    assert connection.execute("SELECT count(*) FROM responses").fetchone() == (
+        40 * 3 * 20 * 5,
+    )
+    connection.close()
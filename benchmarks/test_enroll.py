@@ -0,0 +1,245 @@
+import csv
+import re
+import warnings
+
+import pytest
+from click.testing import CliRunner
+from openpyxl import load_workbook
+
+from enroll import apply, delta, interns, ixd_interns, nso, xlsx
+from enroll_data import (
+    WORKDAY_HEADER,
+    Students,
+    row_count,
+    workday_rows,
+    write_ixd,
+    write_nso,
+    write_workday,
+)
+from moodle_stub import INTERNSHIP_COURSES, MoodleData
+
+
+def test_current_memberships(bench, moodle):
+    memberships = bench(delta.current_memberships, INTERNSHIP_COURSES, concurrency=4)
+    # 200 users in each course, half of them in the Fall 2025 group
+    assert len(memberships) == 3 * 100
+
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory):
+    """1k rows of each enroll input"""
+    data = tmp_path_factory.mktemp("enroll")
+    write_workday(data / "report.xlsx", 1000)
+    write_nso(data / "nso.csv", 1000)
+    write_ixd(data / "ixd.csv", 1000)
+    return data
+
+
+def test_row_count():
+    assert [row_count(n) for n in ["1000", "1k", "100K", "1M", "2.5k"]] == [
+        1000,
+        1000,
+        100_000,
+        1_000_000,
+        2500,
+    ]
+
+
+def test_workday_report(inputs):
+    students = list(interns.read_report(inputs / "report.xlsx"))
+    assert len(students) == 1000
+    assert list(students[0]) == WORKDAY_HEADER
+    # same seed, same students
+    assert students == list(interns.read_report(inputs / "report.xlsx"))
+    intl = sum(s["Is International Student"] == "Yes" for s in students)
+    missing = sum(not (s["CCA Email"] or "").endswith("@cca.edu") for s in students)
+    assert 50 < intl < 150 and 5 < missing < 40
+
+
+@pytest.fixture(scope="module")
+def large_report(request, tmp_path_factory):
+    """a 100k row Workday report when timing, 1k when the benchmarks run once
+    as tests, generating and reading 100k rows with openpyxl takes a minute"""
+    rows = 100_000 if request.config.getoption("benchmark_enable") else 1000
+    path = tmp_path_factory.mktemp("report") / "report.xlsx"
+    write_workday(path, rows)
+    return path, rows
+
+
+def openpyxl_rows(path):
+    """how interns.py read the report before xlsx.py, openpyxl's full object
+    model of the workbook"""
+    with warnings.catch_warnings(record=True):
+        warnings.simplefilter("always")
+        workbook = load_workbook(path)
+    return workbook.worksheets[0].iter_rows(values_only=True)
+
+
+@pytest.mark.parametrize(
+    "iter_rows", [xlsx.iter_rows, openpyxl_rows], ids=["xlsx", "openpyxl"]
+)
+def test_read_report(bench_rows, large_report, iter_rows):
+    path, rows = large_report
+    # the title and header rows
+    assert bench_rows(rows, lambda: sum(1 for _ in iter_rows(path))) == rows + 2
+
+
+def test_wd_report_to_enroll_csv(bench_rows, inputs, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    bench_rows(
+        1000,
+        interns.wd_report_to_enroll_csv,
+        inputs / "report.xlsx",
+        "Fall 2025",
+        None,
+        False,
+    )
+    lines = (tmp_path / "enrollments.csv").read_text().splitlines()
+    assert 50 < len(lines) < 300
+
+
+# the programs list the old make_enrollments() scanned
+programs_with_internship = list(interns.program_to_course_map)
+
+
+def if_chain_enrollments(student, semester, program=None, list_mode=False):
+    """make_enrollments() before programs.toml, with the per-program if-chain
+    and uncompiled regex, to compare the eligibility table against"""
+    major = student["Primary Program of Study"]
+    if (
+        major in programs_with_internship
+        and student["Primary Program of Study Record Status"] == "In Progress"
+        and student["CCA Email"]
+    ):
+        if program and major != program:
+            return []
+        level = student["Latest Class Standing"]
+        if not (
+            major in ("Architecture", "Interior Design", "Graphic Design")
+            and level == "Third Year"
+        ) and not (major == "Graduate Architecture" and level == "Second Year"):
+            return []
+        username = re.sub("@cca.edu", "", student["CCA Email"])
+        course = interns.program_to_course_map[major]
+        if list_mode:
+            return [student["Student"], student["CCA Email"]]
+        if student["Is International Student"] == "Yes":
+            return [(username, course, semester), (username, course, "International")]
+        return [(username, course, semester)]
+    return []
+
+
+@pytest.fixture(scope="module")
+def students():
+    """100k synthetic Workday report rows as student dicts"""
+    return [dict(zip(WORKDAY_HEADER, r)) for r in workday_rows(Students(), 100_000)]
+
+
+@pytest.mark.parametrize(
+    "make_enrollments",
+    [if_chain_enrollments, interns.make_enrollments],
+    ids=["if_chain", "table"],
+)
+def test_make_enrollments(bench_rows, students, make_enrollments):
+    def run():
+        return [e for s in students for e in make_enrollments(s, "Fall 2025")]
+
+    enrollments = bench_rows(len(students), run)
+    assert enrollments == [
+        e for s in students for e in if_chain_enrollments(s, "Fall 2025")
+    ]
+    assert 5000 < len(enrollments) < 30_000
+
+
+def test_nso_make_rows(bench_rows, inputs):
+    field_map = {
+        "email": "CCA email",
+        "intl": "Is International Student",
+        "type": "Applicant Type",
+        "course": "NSO-{type}-2025FA",
+    }
+
+    def run():
+        with open(inputs / "nso.csv") as fh:
+            return sum(len(c) for c in nso.make_rows(csv.DictReader(fh), field_map))
+
+    assert 1000 < bench_rows(1000, run) < 1200
+
+
+def test_ixd_make_rows(bench_rows, inputs):
+    def run():
+        with open(inputs / "ixd.csv") as fh:
+            return sum(
+                len(ixd_interns.make_rows(row, "Fall 2025"))
+                for row in csv.DictReader(fh)
+            )
+
+    assert 1000 < bench_rows(1000, run) < 1200
+
+
+@pytest.fixture
+def writable(moodle, monkeypatch):
+    """the stub, with what the test enrolls forgotten afterwards"""
+    monkeypatch.setattr(moodle, "data", MoodleData(moodle.data.scale))
+    return moodle
+
+
+def test_apply_enrollments(writable):
+    rows = [(f"student{n}", INTERNSHIP_COURSES[n % 3], "Fall 2025") for n in range(300)]
+    rows += [(u, c, "International") for u, c, _ in rows[::10]]
+    rows += [("nobody", "BARCH-INTRN", "Fall 2025"), ("student1", "MARCH-INTRN", "")]
+    summary = apply.apply_enrollments(rows, batch_size=40)
+    assert summary == {
+        "enrolments": 300,
+        "groups": 3,
+        "memberships": 330,
+        "unknown": 2,
+        "failed": 0,
+    }
+    # 300 users in 8 batches, and 630 group members in 9 batches
+    assert writable.requests["enrol_manual_enrol_users"] == 8
+    assert writable.requests["core_group_create_groups"] == 1
+    assert writable.requests["core_group_add_group_members"] == 9
+    assert set(rows[:-2]) <= delta.current_memberships(INTERNSHIP_COURSES)
+    # a second run only finds groups that already exist
+    assert apply.apply_enrollments(rows, batch_size=40)["groups"] == 0
+
+
+def test_apply_lost_response(writable, monkeypatch):
+    """a create groups request that Moodle applied but whose response was
+    lost isn't sent again, its groups are found instead"""
+    respond = writable.respond
+
+    def lose_first_create(query):
+        status, data = respond(query)
+        if query["wsfunction"] == ["core_group_create_groups"] and (
+            writable.requests["core_group_create_groups"] == 1
+        ):
+            return 503, ""
+        return status, data
+
+    monkeypatch.setattr(writable, "respond", lose_first_create)
+    rows = [(f"student{n}", INTERNSHIP_COURSES[n % 3], "Spring") for n in range(30)]
+    summary = apply.apply_enrollments(rows, batch_size=40)
+    assert summary["groups"] == 3
+    assert summary["memberships"] == 30
+    assert summary["failed"] == 0
+    assert writable.requests["core_group_create_groups"] == 1
+    assert set(rows) <= delta.current_memberships(INTERNSHIP_COURSES)
+
+
+def test_interns_apply(writable, inputs, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    args = ["-r", str(inputs / "report.xlsx"), "-s", "Fall 2025", "--delta", "--apply"]
+    result = CliRunner().invoke(interns.main, args)
+    assert result.exit_code == 0, result.output
+    assert "enrol_manual_enrol_users batch 1/" in result.output
+    assert not (tmp_path / "enrollments.csv").exists()
+    enrolled = writable.data.enrolments
+    assert sum(len(users) for users in enrolled.values()) > 20
+    # everything's in Moodle now
+    result = CliRunner().invoke(interns.main, args)
+    assert result.exit_code == 0, result.output
+    assert "Enrolled 0 users, created 0 groups, and added 0 group members" in (
+        result.output
+    )
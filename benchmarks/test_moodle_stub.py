@@ -0,0 +1,35 @@
+import pytest
+import requests
+
+import throttle
+from client import MoodleClient, MoodleError
+from moodle_stub import TOKEN, MoodleStub, Scale, php_arrays
+
+
+def test_php_arrays():
+    assert php_arrays(
+        {"courseids[0]": ["1"], "criteria[0][key]": ["name"], "field": ["id"]}
+    ) == {"courseids": {"0": "1"}, "criteria": {"0": {"key": "name"}}, "field": "id"}
+
+
+def test_stub_errors(monkeypatch):
+    monkeypatch.setattr(throttle.time, "sleep", lambda seconds: None)
+    scale = Scale(courses=2, attempts=1, users=1)
+    with MoodleStub(scale, error_rate=0.3, moodle_error_rate=0.2) as stub:
+        url = stub.url + "/webservice/rest/server.php"
+        client = MoodleClient(url, TOKEN, throttle=throttle.Throttle(rate=0))
+        for _ in range(20):
+            assert len(client.call("core_course_get_courses")) == len(stub.data.courses)
+        stats = client.throttle.stats()
+        assert stats["server_errors"] > 0 and stats["moodle_errors"] > 0
+        assert stub.requests["core_course_get_courses"] == stats["requests"]
+
+        stub.error_rate = 1
+        client.throttle.max_retries = 1
+        with pytest.raises(requests.HTTPError):
+            client.call("core_course_get_courses")
+
+        stub.error_rate = stub.moodle_error_rate = 0
+        with pytest.raises(MoodleError) as e:
+            MoodleClient(url, "wrong").call("core_course_get_courses")
+        assert e.value.errorcode == "invalidtoken"
@@ -0,0 +1,73 @@
+import json
+
+from click.testing import CliRunner
+
+import course_get_categories
+import course_get_courses
+import course_get_courses_by_field
+import enrol_get_enrolled_users
+from moodle_stub import DEPARTMENTS, TERMS
+
+
+def test_course_get_courses_ndjson(bench, moodle, tmp_path):
+    output = tmp_path / "courses.ndjson"
+    args = ["-f", "ndjson", "--fields", "id,shortname", "-o", str(output)]
+    result = bench(CliRunner().invoke, course_get_courses.main, args)
+    assert result.exit_code == 0, result.output
+    lines = output.read_text().splitlines()
+    assert len(lines) == len(moodle.data.courses)
+    assert json.loads(lines[0]) == {"id": 100, "shortname": "ANIMA-1000-1-2025FA"}
+
+
+def test_course_get_courses_by_field_file(bench, moodle, tmp_path):
+    shortnames = [
+        f"{d}-{1000 + n}-1-{t}" for t in TERMS for d in DEPARTMENTS for n in range(40)
+    ] + ["BARCH-INTRN", "NOPE-1000-1-2025FA"]
+    (tmp_path / "sections.txt").write_text("\n".join(shortnames))
+    output = tmp_path / "ids.csv"
+    args = ["-f", str(tmp_path / "sections.txt"), "-o", str(output), "--no-cache"]
+    result = bench(CliRunner().invoke, course_get_courses_by_field.main, args)
+    assert result.exit_code == 0, result.output
+    lines = output.read_text().splitlines()
+    assert len(lines) == 1 + len(shortnames)
+    assert lines[-1] == "NOPE-1000-1-2025FA,"
+    # term categories are indexed, only misses are looked up one at a time
+    assert moodle.requests["core_course_get_courses_by_field"] < 20
+
+
+def test_course_get_categories(bench, moodle):
+    result = bench(CliRunner().invoke, course_get_categories.main, ["2025FA"])
+    assert result.exit_code == 0, result.output
+    assert [c["name"] for c in json.loads(result.output)] == ["2025FA", *DEPARTMENTS]
+
+
+def test_course_get_categories_local(bench, moodle, tmp_path):
+    args = ["2026SP", "--index", str(tmp_path / "categories.json")]
+    result = bench(CliRunner().invoke, course_get_categories.main, args)
+    assert result.exit_code == 0, result.output
+    assert [c["name"] for c in json.loads(result.output)] == ["2026SP", *DEPARTMENTS]
+
+
+def test_enrol_get_enrolled_users(bench, moodle):
+    courseids = [str(c["id"]) for c in moodle.data.courses[:20]]
+    args = [*courseids, "--fields", "username,groups", "-n", "8"]
+    result = bench(CliRunner().invoke, enrol_get_enrolled_users.main, args)
+    assert result.exit_code == 0, result.output
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert len(records) == 20 * 200
+    assert records[1] == {
+        "courseid": "100",
+        "id": 10000001,
+        "username": "user91901",
+        "groups": ["Fall 2025"],
+    }
+
+
+def test_enrol_get_enrolled_users_paged(bench, moodle):
+    users = bench(
+        enrol_get_enrolled_users.get_enrolled_users,
+        "100",
+        page_size=30,
+        concurrency=4,
+    )
+    assert [u["id"] for u in users] == [10000000 + n for n in range(200)]
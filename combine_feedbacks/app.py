@@ -1,17 +1,30 @@
+import asyncio
 import csv
+import json
 import os
 import re
+import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
 from datetime import date
 from html import unescape
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator
 
 import click
 from dotenv import dotenv_values
-from requests import HTTPError, Response, get
+
+# shared Moodle web service client lives with the rest_apis examples
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "rest_apis"))
+from async_client import AsyncMoodleClient
+from cache import cache_options, use_cache
+from client import MoodleClient, get_client
+from course_get_categories import CategoryTree
+from timing import profile_options, profiled, timings
 
 # a tripartite set of API calls:
-# 1. get all courses in the Internships category (may need to weed out demo/template courses)
+# 1. get all courses in the Internships categories (may need to weed out demo/template courses)
 # wsfunction: core_course_get_courses_by_field
 # 2. get all Feedback activities from courses (1 request, no need for iteration)
 # wsfunction: mod_feedback_get_feedbacks_by_courses
@@ -45,106 +58,267 @@ def debug(s: str) -> None:
         print(s)
 
 
-def http_error(resp: Response) -> None:
-    """print HTTP error details
+def moodle() -> MoodleClient:
+    """shared web service client for the configured URL and token"""
+    return get_client(conf["URL"], conf["TOKEN"])
+
+
+def category_roots() -> list[str]:
+    """the CATEGORY setting's ids, it can be a comma-separated list"""
+    return [id.strip() for id in str(conf["CATEGORY"]).split(",") if id.strip()]
+
+
+def harvest_categories(
+    roots: list[str], tree: CategoryTree | None = None
+) -> dict[str, str]:
+    """pick the categories to fetch courses from: each root, plus all of its
+    subcategories if we have a `tree` to walk
+
+    A category under several roots, or given twice, is only fetched once and
+    belongs to the first root it's under.
+
+    Args:
+        roots (list[str]): category ids
+        tree (CategoryTree|None): every Moodle category, to find subcategories
+
+    Returns:
+        dict[str, str]: {category id: root category id}, in the order to fetch
+    """
+    categories: dict[str, str] = {}
+    for root in roots:
+        subtree: list[int] = tree.subtree_ids(int(root)) if tree else []
+        for id in [root, *(str(id) for id in subtree)]:
+            categories.setdefault(id, root)
+    return categories
+
+
+def get_categories(recursive: bool = False) -> dict[str, str]:
+    """categories to fetch courses from, see harvest_categories()
 
     Args:
-        resp (Response): HTTP response object from requests library
+        recursive (bool): include subcategories, all categories are fetched
+            in one core_course_get_categories request to find them
     """
-    print(f"HTTP Error {resp.status_code}")
-    print(resp.headers)
-    print(resp.text)
+    tree: CategoryTree | None = None
+    if recursive:
+        tree = CategoryTree(moodle().call("core_course_get_categories"))
+    return harvest_categories(category_roots(), tree)
+
+
+async def get_categories_async(
+    client: AsyncMoodleClient, recursive: bool = False
+) -> dict[str, str]:
+    """get_categories() on an async client"""
+    tree: CategoryTree | None = None
+    if recursive:
+        tree = CategoryTree(await client.call("core_course_get_categories"))
+    return harvest_categories(category_roots(), tree)
+
+
+def unique_courses(
+    categories: Iterable[str], results: Iterable[dict[str, Any]]
+) -> list[dict]:
+    """merge the core_course_get_courses_by_field responses of categories,
+    dropping courses we've already seen"""
+    courses: dict[int, dict] = {}
+    for category, data in zip(categories, results):
+        debug(
+            f"Found {len(data['courses'])} courses in category {conf['DOMAIN']}/course/management.php?categoryid={category}"
+        )
+        for course in data["courses"]:
+            courses.setdefault(course["id"], course)
+    return list(courses.values())
 
 
 # 1 get courses
-def get_courses() -> list[dict]:
-    """get all courses in the Internships category
+def get_courses(
+    categories: Iterable[str] | None = None, concurrency: int = 1
+) -> list[dict]:
+    """get all courses in the Internships categories, `concurrency`
+    categories at a time
+
+    Args:
+        categories (Iterable[str]|None): category ids (default: the CATEGORY
+            setting's)
+        concurrency (int): number of categories to fetch at once (default: 1)
 
     Returns:
-        list[dict]: list of course dicts
+        list[dict]: list of course dicts, in category order without duplicates
     """
-    service: str = "core_course_get_courses_by_field"
-    format: str = "json"
-    params: dict[str, str] = {
-        # see https://moodle.cca.edu/admin/settings.php?section=webservicetokens
-        "wstoken": conf["TOKEN"],
-        "wsfunction": service,
-        "moodlewsrestformat": format,
-        "field": "category",
-        "value": conf["CATEGORY"],
-    }
-
-    response: Response = get(conf["URL"], params=params)
-    try:
-        response.raise_for_status()
-    except HTTPError:
-        http_error(response)
+    categories = list(categories or category_roots())
 
-    data = response.json()
-    debug(
-        f"Found {len(data['courses'])} courses in category {conf['DOMAIN']}/course/management.php?categoryid={conf['CATEGORY']}"
+    def fetch(category: str) -> dict[str, Any]:
+        return moodle().call(
+            "core_course_get_courses_by_field", {"field": "category", "value": category}
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return unique_courses(categories, executor.map(fetch, categories))
+
+
+async def get_courses_async(
+    client: AsyncMoodleClient, categories: Iterable[str] | None = None
+) -> list[dict]:
+    """get_courses() on an async client, every category is requested at once"""
+    categories = list(categories or category_roots())
+    results: list[dict[str, Any]] = await asyncio.gather(
+        *(
+            client.call(
+                "core_course_get_courses_by_field",
+                {"field": "category", "value": category},
+            )
+            for category in categories
+        )
     )
-    return data["courses"]
+    return unique_courses(categories, results)
 
 
-def write_csv(feedbacks: list[dict], label: str, output_dir: Path) -> None:
-    """write feedbacks to a CSV file
+# "(Label) Question text" -> Label
+label_regex: re.Pattern[str] = re.compile(r"^\(.*\)")
+# use the "printval" property for Connection question, rawval for others
+printval_regex: re.Pattern[str] = re.compile(r"\(connection\)", re.IGNORECASE)
+
+
+def question_label(response: dict, feedback: dict) -> str:
+    """find (label) and extract it from parentheses"""
+    label_matches = label_regex.match(response["name"].strip())
+    if label_matches:
+        return label_matches[0][1:-1]
+    raise Exception(
+        f"No label for question '{response['name']}' in feedback {feedback.get('id')} in course {feedback.get('courseid')}"
+    )
+
+
+class ResponsesCSV:
+    """CSV file that feedback analyses are written to one at a time, so we
+    never need to hold more than one analysis in memory. The header row comes
+    from the first attempt of the first analysis written.
+
+    Each feedback has its own question ids, so its questions are compiled once
+    into a schema of question id -> (column index, value property) and every
+    attempt is placed into a row by column index rather than by position.
 
     Args:
-        feedbacks (list[dict]): list of feedback dicts with responses stored in anonattempts property
         label (str): label to use in the filename
         output_dir (Path): directory to write the CSV file to
+        append (bool): add rows to an existing file, keeping its header, and
+        flush after every write (default: False)
     """
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
-    filename: Path = output_dir / f"{label}-responses.csv"
-    # example attempts structure:
-    #   "anonattempts": [
-    #     {
-    #       "id": 5817,
-    #       "courseid": 0,
-    #       "userid": 11,
-    #       "timemodified": 1683236827,
-    #       "fullname": "Rey .",
-    #       "responses": [
-    #         {
-    #           "id": 10490,
-    #           "name": "Your Phone Number",
-    #           "printval": "323-123-9876",
-    #           "rawval": "323-123-9876"
-    #         },
-    #   ...objects for each question, below is end of "attempts" array
-    #   ],
-    # extract columns from first response to first feedback
-    columns: list[str] = []
-    for r in feedbacks[0]["anonattempts"][0]["responses"]:
-        # find (label) and extract it from parentheses
-        label_matches = re.match(r"^\(.*\)", r["name"].strip())
-        if label_matches:
-            columns.append(label_matches[0][1:-1])
-        else:
+
+    def __init__(self, label: str, output_dir: Path, append: bool = False):
+        self.filename: Path = Path(output_dir) / f"{label}-responses.csv"
+        self.append: bool = append
+        self.file = None
+        self.writer = None
+        self.columns: dict[str, int] = {}
+        self.count: int = 0
+
+    def __enter__(self) -> "ResponsesCSV":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def open(self, feedback: dict) -> None:
+        # example attempts structure:
+        #   "anonattempts": [
+        #     {
+        #       "id": 5817,
+        #       "courseid": 0,
+        #       "userid": 11,
+        #       "timemodified": 1683236827,
+        #       "fullname": "Rey .",
+        #       "responses": [
+        #         {
+        #           "id": 10490,
+        #           "name": "Your Phone Number",
+        #           "printval": "323-123-9876",
+        #           "rawval": "323-123-9876"
+        #         },
+        #   ...objects for each question, below is end of "attempts" array
+        #   ],
+        if self.append and self.filename.exists():
+            # keep the columns of the file we're adding to
+            with open(self.filename, newline="") as fh:
+                header: list[str] = next(csv.reader(fh), [])
+            if header:
+                self.columns = {label: i for i, label in enumerate(header)}
+                self.file = open(self.filename, mode="a")
+                self.writer = csv.writer(self.file)
+                return
+
+        # extract columns from first response to first feedback
+        for r in feedback["anonattempts"][0]["responses"]:
+            self.columns.setdefault(question_label(r, feedback), len(self.columns))
+
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.filename, mode="w")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.columns.keys())
+
+    def compile(self, response: dict, feedback: dict) -> tuple[int, str]:
+        """column index and value property for a feedback question"""
+        label: str = question_label(response, feedback)
+        if label not in self.columns:
             raise Exception(
-                f"No label for question '{r['name']}' in feedback {feedbacks[0]['id']} in course {feedbacks[0]['courseid']}"
+                f"Question '{label}' in feedback {feedback.get('id')} is not one of the columns {list(self.columns)}"
             )
+        if printval_regex.match(response["name"]):
+            return self.columns[label], "printval"
+        return self.columns[label], "rawval"
 
-    # TODO use DictWriter instead? We want to be careful not to place the wrong values in a column
-    with open(filename, mode="w") as file:
-        writer = csv.writer(file)
-        writer.writerow(columns)
-        for feedback in feedbacks:
-            for attempt in feedback["anonattempts"]:
-                # use the "printval" property for Connection question, rawval for others
-                row: list[Any] = []
-                for response in attempt["responses"]:
-                    if re.match(r"\(connection\)", response["name"].lower()):
-                        row.append(unescape(response["printval"]))
-                    else:
-                        row.append(unescape(response["rawval"]))
-                writer.writerow(row)
+    def write(self, feedback: dict) -> None:
+        """write all the attempts of a feedback analysis
 
-    debug(
-        f"Wrote {sum([len(f['anonattempts']) for f in feedbacks])} responses to {filename}"
-    )
+        Args:
+            feedback (dict): feedback analysis with responses stored in anonattempts property
+        """
+        with timings.timer("write_csv"):
+            self._write(feedback)
+
+    def _write(self, feedback: dict) -> None:
+        if self.writer is None:
+            self.open(feedback)
+        width: int = len(self.columns)
+        # question id -> (column index, value property), built once per feedback
+        schema: dict[Any, tuple[int, str]] = {}
+        rows: list[list[str]] = []
+        for attempt in feedback["anonattempts"]:
+            row: list[str] = [""] * width
+            for response in attempt["responses"]:
+                question = schema.get(response["id"])
+                if question is None:
+                    with timings.timer("compile_questions"):
+                        question = schema[response["id"]] = self.compile(
+                            response, feedback
+                        )
+                index, value = question
+                row[index] = unescape(response[value])
+            rows.append(row)
+        self.writer.writerows(rows)
+        self.count += len(rows)
+        if self.append:
+            self.file.flush()
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+            debug(f"Wrote {self.count} responses to {self.filename}")
+        else:
+            debug(f"No responses to write to {self.filename}")
+
+
+def write_csv(feedbacks: Iterable[dict], label: str, output_dir: Path) -> None:
+    """write feedbacks to a CSV file
+
+    Args:
+        feedbacks (Iterable[dict]): feedback dicts with responses stored in anonattempts property
+        label (str): label to use in the filename
+        output_dir (Path): directory to write the CSV file to
+    """
+    with ResponsesCSV(label, output_dir) as responses:
+        for feedback in feedbacks:
+            responses.write(feedback)
 
 
 def course_ids(courses) -> list[str]:
@@ -165,39 +339,37 @@ def course_ids(courses) -> list[str]:
 
 
 # 2: get feedbacks
-def get_feedbacks(courses) -> list[dict]:
+def get_feedbacks(courses, chunk_size: int = 100, concurrency: int = 1) -> list[dict]:
     """given a list of courses, return the feedback activities within them
 
+    Course ids are sent in the POST body, in chunks of `chunk_size`, so a big
+    category can't produce a URL that's too long. Chunks are fetched
+    `concurrency` at a time and their feedbacks merged in course order.
+
     Args:
         courses (list[dict]): list of course dicts containing at least an id property
+        chunk_size (int): number of courses per request (default: 100)
+        concurrency (int): number of requests to make at once (default: 1)
 
     Returns:
         list[dict]: list of feedback activity dicts
     """
     ids: list[str] = course_ids(courses)
+    chunks: list[list[str]] = [
+        ids[i : i + chunk_size] for i in range(0, len(ids), chunk_size)
+    ]
 
-    service: str = "mod_feedback_get_feedbacks_by_courses"
-    format: str = "json"
-    params: dict[str, str] = {
-        # see https://moodle.cca.edu/admin/settings.php?section=webservicetokens
-        "wstoken": conf["TOKEN"],
-        "wsfunction": service,
-        "moodlewsrestformat": format,
-        "courseids[]": ",".join(ids),
-    }
-    # each course id is its own URL parameter, weird PHP behavior
-    # ! potential bug where large number of courses -> too long URL
-    for idx, id in enumerate(ids):
-        params[f"courseids[{idx}]"] = id
-
-    response: Response = get(conf["URL"], params=params)
-    try:
-        response.raise_for_status()
-    except HTTPError:
-        http_error(response)
+    def fetch(chunk: list[str]) -> list[dict[str, Any]]:
+        # each course id is its own parameter courseids[0]=1, weird PHP behavior
+        data = moodle().call(
+            "mod_feedback_get_feedbacks_by_courses", {"courseids": chunk}, "POST"
+        )
+        return data.get("feedbacks", [])
 
-    data = response.json()
-    feedbacks: list[dict[str, Any]] = data.get("feedbacks", [])
+    feedbacks: list[dict[str, Any]] = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for chunk_feedbacks in executor.map(fetch, chunks):
+            feedbacks.extend(chunk_feedbacks)
     # example feedback structure:
     # {
     #   "id": 1520,
@@ -218,6 +390,27 @@ def get_feedbacks(courses) -> list[dict]:
     return feedbacks
 
 
+async def get_feedbacks_async(
+    client: AsyncMoodleClient, courses, chunk_size: int = 100
+) -> list[dict]:
+    """get_feedbacks() on an async client, all the chunks are requested at
+    once and the client's in-flight limit decides how many are sent together"""
+    ids: list[str] = course_ids(courses)
+    results: list[dict[str, Any]] = await asyncio.gather(
+        *(
+            client.call(
+                "mod_feedback_get_feedbacks_by_courses",
+                {"courseids": ids[i : i + chunk_size]},
+                "POST",
+            )
+            for i in range(0, len(ids), chunk_size)
+        )
+    )
+    feedbacks: list[dict] = [f for data in results for f in data.get("feedbacks", [])]
+    debug(f"Found {len(feedbacks)} Feedback activities")
+    return feedbacks
+
+
 def feedback_type(feedback: dict[str, Any]) -> str | None:
     """classify feedback as either an internship information or evaluation activity, or neither
     the returned string must match the name of the list in get_responses that it's appended to
@@ -239,59 +432,507 @@ def feedback_type(feedback: dict[str, Any]) -> str | None:
 
 
 # 3: get analyses
-def get_responses(feedbacks) -> tuple[list[dict], list[dict]]:
+def get_analysis(fdbk: dict[str, Any]) -> dict[str, Any]:
+    """fetch the responses analysis of a single feedback activity
+
+    Args:
+        fdbk (dict): feedback activity dict with at least an id property
+
+    Returns:
+        dict: analysis dict with anonattempts and totalanonattempts properties
+    """
+    # see note in readme about the difference between these 2 functions
+    service: str = "mod_feedback_get_responses_analysis"
+    # service = 'mod_feedback_get_analysis'
+    # TODO handle warnings array & check for its presence in other wsfunction data
+    # example analysis structure:
+    # {
+    #   "attempts": []
+    #   "totalattempts": 0,
+    #   "anonattempts": [...],
+    #   "totalanonattempts": 10,
+    #   "warnings": []
+    # }
+    return moodle().call(service, {"feedbackid": fdbk["id"]})
+
+
+async def get_analysis_async(
+    client: AsyncMoodleClient, fdbk: dict[str, Any]
+) -> dict[str, Any]:
+    """get_analysis() on an async client"""
+    return await client.call(
+        "mod_feedback_get_responses_analysis", {"feedbackid": fdbk["id"]}
+    )
+
+
+class Checkpoint:
+    """append-only NDJSON journal of the feedback analyses a run has fetched,
+    one {"id", "type", "analysis"} line per feedback, so an interrupted run can
+    be resumed without refetching them
+
+    Only the byte offset of each journaled analysis is kept in memory, its
+    data is read back from the file when it's replayed.
+
+    Args:
+        output_dir (Path): directory to keep checkpoint.ndjson in
+        resume (bool): keep the analyses of a previous run, otherwise start over
+    """
+
+    def __init__(self, output_dir: Path, resume: bool = False):
+        self.path: Path = Path(output_dir) / "checkpoint.ndjson"
+        self.offsets: dict[int, int] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if resume and self.path.exists():
+            self.load()
+        else:
+            self.path.write_bytes(b"")
+        self.file = open(self.path, "ab")
+
+    def __enter__(self) -> "Checkpoint":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.file.close()
+
+    def __contains__(self, id: int) -> bool:
+        return id in self.offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def load(self) -> None:
+        """index the journal, dropping a last line cut off by a crash"""
+        end: int = 0
+        with open(self.path, "r+b") as fh:
+            for line in fh:
+                try:
+                    entry: dict[str, Any] = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                self.offsets[entry["id"]] = end
+                end += len(line)
+            fh.truncate(end)
+
+    def read(self, id: int) -> dict[str, Any]:
+        """analysis of a journaled feedback"""
+        with open(self.path, "rb") as fh:
+            fh.seek(self.offsets[id])
+            return json.loads(fh.readline())["analysis"]
+
+    def record(self, type: str, fdbk: dict[str, Any], data: dict[str, Any]) -> None:
+        """append a fetched analysis, flushed so it survives the process dying"""
+        line: str = json.dumps({"id": fdbk["id"], "type": type, "analysis": data})
+        self.offsets[fdbk["id"]] = self.file.tell()
+        self.file.write(line.encode() + b"\n")
+        self.file.flush()
+
+    def remove(self) -> None:
+        """delete the journal once its run has finished"""
+        self.file.close()
+        self.path.unlink(missing_ok=True)
+
+
+class Watermarks:
+    """the newest attempt of each feedback that an incremental run has
+    appended to the master CSVs, and how many attempts the feedback had
+
+    Attempt ids only grow, so attempts past a feedback's mark are new. Marks
+    are appended to watermarks.ndjson as each feedback is written, the last
+    line for a feedback wins, so an interrupted run keeps what it finished.
+    The file is compacted to a line per feedback when it's opened and closed.
+
+    Args:
+        output_dir (Path): directory to keep watermarks.ndjson in
+    """
+
+    def __init__(self, output_dir: Path):
+        self.path: Path = Path(output_dir) / "watermarks.ndjson"
+        self.marks: dict[int, dict[str, int]] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self.load()
+        self.compact()
+        self.file = open(self.path, "a")
+
+    def __enter__(self) -> "Watermarks":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __contains__(self, id: int) -> bool:
+        return id in self.marks
+
+    def __getitem__(self, id: int) -> dict[str, int]:
+        return self.marks[id]
+
+    def load(self) -> None:
+        with open(self.path, "r") as fh:
+            for line in fh:
+                try:
+                    mark: dict[str, int] = json.loads(line)
+                except ValueError:
+                    # a last line cut off by a crash
+                    break
+                self.marks[mark["id"]] = mark
+
+    def new_attempts(self, fdbk: dict, data: dict) -> dict:
+        """the analysis with only the attempts past the feedback's mark"""
+        if fdbk["id"] not in self.marks:
+            return data
+        last: int = self.marks[fdbk["id"]]["attempt"]
+        return {
+            **data,
+            "anonattempts": [a for a in data["anonattempts"] if a["id"] > last],
+        }
+
+    def record(self, fdbk: dict, data: dict) -> None:
+        """mark a feedback's attempts as written, call after writing them"""
+        previous: int = self.marks.get(fdbk["id"], {}).get("attempt", 0)
+        mark: dict[str, int] = {
+            "id": fdbk["id"],
+            "attempts": data["totalanonattempts"],
+            "attempt": max((a["id"] for a in data["anonattempts"]), default=previous),
+        }
+        self.marks[fdbk["id"]] = mark
+        self.file.write(json.dumps(mark) + "\n")
+        self.file.flush()
+
+    def compact(self) -> None:
+        tmp: Path = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as fh:
+            fh.writelines(json.dumps(mark) + "\n" for mark in self.marks.values())
+        os.replace(tmp, self.path)
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.file.close()
+            self.compact()
+
+
+def probe_query(fdbk: dict[str, Any], watermarks: Watermarks) -> dict[str, Any]:
+    """a one attempt page of a marked feedback's analysis, the last page when
+    it still has as many attempts as its mark, which holds its newest attempt
+    because attempts are listed in the order they were submitted"""
+    page: int = max(watermarks[fdbk["id"]]["attempts"] - 1, 0)
+    return {"feedbackid": fdbk["id"], "page": page, "perpage": 1}
+
+
+def probed(data: dict[str, Any]) -> tuple[int, int | None]:
+    """attempt count and id of the attempt on a probe_query() page"""
+    attempts: list[dict] = data["anonattempts"]
+    return data["totalanonattempts"], attempts[-1]["id"] if attempts else None
+
+
+def probe_attempts(
+    fdbk: dict[str, Any], watermarks: Watermarks
+) -> tuple[int, int | None]:
+    """a marked feedback's attempt count and newest attempt id, see probe_query()"""
+    return probed(
+        moodle().call(
+            "mod_feedback_get_responses_analysis", probe_query(fdbk, watermarks)
+        )
+    )
+
+
+async def probe_attempts_async(
+    client: AsyncMoodleClient, fdbk: dict[str, Any], watermarks: Watermarks
+) -> tuple[int, int | None]:
+    """probe_attempts() on an async client"""
+    return probed(
+        await client.call(
+            "mod_feedback_get_responses_analysis", probe_query(fdbk, watermarks)
+        )
+    )
+
+
+def changed(
+    feedbacks: list[dict],
+    watermarks: Watermarks,
+    probes: Iterable[tuple[int, int | None]],
+) -> list[dict]:
+    """feedbacks that are new, or whose attempt count or newest attempt
+    differs from their mark, `probes` are the probe_attempts() of the marked
+    feedbacks in order
+
+    The count alone misses an attempt deleted and another submitted between
+    runs, the newest attempt id catches it because ids only grow.
+    """
+    seen: dict[int, tuple[int, int | None]] = dict(
+        zip((f["id"] for f in feedbacks if f["id"] in watermarks), probes)
+    )
+
+    def unchanged(fdbk: dict) -> bool:
+        if fdbk["id"] not in seen:
+            return False
+        mark: dict[str, int] = watermarks[fdbk["id"]]
+        return seen[fdbk["id"]] == (mark["attempts"], mark["attempt"])
+
+    result: list[dict] = [f for f in feedbacks if not unchanged(f)]
+    debug(f"{len(result)} of {len(feedbacks)} feedbacks have new attempts")
+    return result
+
+
+def changed_feedbacks(
+    feedbacks: Iterable[dict], watermarks: Watermarks, concurrency: int = 1
+) -> list[dict]:
+    """leave out the internship and evaluation feedbacks that haven't had
+    attempts added or removed since their watermarks, which costs a request
+    for one attempt of each, `concurrency` at a time
+
+    Moodle doesn't update a course's or a feedback's timemodified when someone
+    submits it, so the attempt count and newest attempt are the cheapest sign
+    of a change.
+    """
+    feedbacks = [f for f in feedbacks if feedback_type(f)]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        probes = list(
+            executor.map(
+                lambda f: probe_attempts(f, watermarks),
+                [f for f in feedbacks if f["id"] in watermarks],
+            )
+        )
+    return changed(feedbacks, watermarks, probes)
+
+
+async def changed_feedbacks_async(
+    client: AsyncMoodleClient, feedbacks: Iterable[dict], watermarks: Watermarks
+) -> list[dict]:
+    """changed_feedbacks() on an async client"""
+    feedbacks = [f for f in feedbacks if feedback_type(f)]
+    probes: list[tuple[int, int | None]] = await asyncio.gather(
+        *(
+            probe_attempts_async(client, f, watermarks)
+            for f in feedbacks
+            if f["id"] in watermarks
+        )
+    )
+    return changed(feedbacks, watermarks, probes)
+
+
+def fetched(type: str, fdbk: dict, data: dict, checkpoint: Checkpoint | None) -> bool:
+    """journal an analysis if it's new, returns whether it has any attempts"""
+    if checkpoint is not None and fdbk["id"] not in checkpoint:
+        checkpoint.record(type, fdbk, data)
+    debug(
+        f"{len(data['anonattempts'])} attempts on Feedback {fdbk['id']} {conf['DOMAIN'] + '/mod/feedback/show_entries.php?id=' + str(fdbk['coursemodule'])}"
+    )
+    return data["totalanonattempts"] > 0
+
+
+def iter_responses(
+    feedbacks: Iterable[dict],
+    concurrency: int = 1,
+    checkpoint: Checkpoint | None = None,
+) -> Iterator[tuple[str, dict, dict]]:
+    """fetch the analysis of each internship and evaluation feedback, yielding
+    them one at a time in the same order as `feedbacks`
+
+    At most `concurrency` analyses are requested ahead of the one being
+    yielded, so memory is bounded by that many payloads no matter how many
+    feedbacks there are.
+
+    Args:
+        feedbacks (Iterable[dict]): feeedback activity dicts
+        concurrency (int): number of analyses to fetch at once (default: 1)
+        checkpoint (Checkpoint|None): journal that fetched analyses are
+        recorded in, and that already journaled analyses are read from
+        instead of fetching them again
+
+    Yields:
+        tuple[str, dict, dict]: feedback_type, feedback, analysis for feedbacks with attempts
+    """
+    concurrency = max(1, concurrency)
+    pending: deque[tuple[str, dict, Future]] = deque()
+
+    def finish() -> Iterator[tuple[str, dict, dict]]:
+        type, fdbk, future = pending.popleft()
+        data: dict = future.result()
+        if fetched(type, fdbk, data, checkpoint):
+            yield type, fdbk, data
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for fdbk in feedbacks:
+            # skip feedbacks that aren't internships or evaluations
+            type = feedback_type(fdbk)
+            if type:
+                if checkpoint is not None and fdbk["id"] in checkpoint:
+                    future: Future = Future()
+                    future.set_result(checkpoint.read(fdbk["id"]))
+                else:
+                    future = executor.submit(get_analysis, fdbk)
+                pending.append((type, fdbk, future))
+                if len(pending) >= concurrency:
+                    yield from finish()
+        while pending:
+            yield from finish()
+
+
+async def iter_responses_async(
+    client: AsyncMoodleClient,
+    feedbacks: Iterable[dict],
+    concurrency: int = 1,
+    checkpoint: Checkpoint | None = None,
+) -> AsyncIterator[tuple[str, dict, dict]]:
+    """iter_responses() on an async client, with `concurrency` analyses
+    requested ahead of the one being yielded as tasks instead of threads"""
+    concurrency = max(1, concurrency)
+    pending: deque[tuple[str, dict, asyncio.Future]] = deque()
+
+    async def finish() -> tuple[str, dict, dict] | None:
+        type, fdbk, future = pending.popleft()
+        data: dict = await future
+        return (type, fdbk, data) if fetched(type, fdbk, data, checkpoint) else None
+
+    try:
+        for fdbk in feedbacks:
+            type = feedback_type(fdbk)
+            if not type:
+                continue
+            if checkpoint is not None and fdbk["id"] in checkpoint:
+                future: asyncio.Future = asyncio.get_running_loop().create_future()
+                future.set_result(checkpoint.read(fdbk["id"]))
+            else:
+                future = asyncio.ensure_future(get_analysis_async(client, fdbk))
+            pending.append((type, fdbk, future))
+            if len(pending) >= concurrency and (response := await finish()):
+                yield response
+        while pending:
+            if response := await finish():
+                yield response
+    finally:
+        for _, _, future in pending:
+            future.cancel()
+
+
+def get_responses(feedbacks, concurrency: int = 1) -> tuple[list[dict], list[dict]]:
     """given a list of feedback activities, return two lists of responses:
     1. internship information ("Employer and Intern Information" feedbacks)
     2. student evaluations ("Evaluation" feedbacks)
 
+    Analyses are fetched by a pool of `concurrency` threads but are returned in
+    the same order as `feedbacks` so the CSVs match a serial run. This holds
+    every analysis in memory, main() streams them with iter_responses instead.
+
     Args:
         feedbacks (list[dict]): list of feeedback activity dicts
+        concurrency (int): number of analyses to fetch at once (default: 1)
 
     Returns:
         list[dict], list[dict]: list of internship responses, list of evaluation responses
     """
     internships = []
     evaluations = []
-    for fdbk in feedbacks:
-        # skip feedbacks that aren't internships or evaluations
-        type = feedback_type(fdbk)
-        if type:
-            # see note in readme about the difference between these 2 functions
-            service: str = "mod_feedback_get_responses_analysis"
-            # service = 'mod_feedback_get_analysis'
-            format: str = "json"
-            params: dict[str, str] = {
-                "wstoken": conf["TOKEN"],
-                "wsfunction": service,
-                "moodlewsrestformat": format,
-                "feedbackid": fdbk["id"],
-            }
-            response = get(conf["URL"], params=params)
-            try:
-                response.raise_for_status()
-            except HTTPError:
-                http_error(response)
-
-            data = response.json()
-            # TODO handle warnings array & check for its presence in other wsfunction data
-            # example analysis structure:
-            # {
-            #   "attempts": []
-            #   "totalattempts": 0,
-            #   "anonattempts": [...],
-            #   "totalanonattempts": 10,
-            #   "warnings": []
-            # }
-            debug(
-                f"{len(data['anonattempts'])} attempts on Feedback {fdbk['id']} {conf['DOMAIN'] + '/mod/feedback/show_entries.php?id=' + str(fdbk['coursemodule'])}"
-            )
-
-            if data["totalanonattempts"] > 0:
-                locals()[type].append(data)
+    for type, fdbk, data in iter_responses(feedbacks, concurrency):
+        locals()[type].append(data)
 
     return internships, evaluations
 
 
+async def get_responses_async(
+    client: AsyncMoodleClient, feedbacks, concurrency: int = 1
+) -> tuple[list[dict], list[dict]]:
+    """get_responses() on an async client"""
+    responses: dict[str, list[dict]] = {"internships": [], "evaluations": []}
+    async for type, fdbk, data in iter_responses_async(client, feedbacks, concurrency):
+        responses[type].append(data)
+    return responses["internships"], responses["evaluations"]
+
+
+@contextmanager
+def response_writers(
+    output_dir: Path,
+    resume: bool = False,
+    partitions: dict[int, str] | None = None,
+    watermarks: Watermarks | None = None,
+) -> Iterator[tuple[Checkpoint, Callable[[str, dict, dict], None]]]:
+    """today's internships and evaluations CSVs, and the checkpoint that's
+    journaling their analyses, which is deleted once the block finishes
+    without an error
+
+    Yields the checkpoint and a write(type, feedback, analysis) function that
+    writes an analysis to the CSV for its feedback type.
+
+    Args:
+        partitions (dict[int, str]|None): course id -> category, to write a
+            pair of CSVs per category rather than one pair for everything
+        watermarks (Watermarks|None): append only the attempts past each
+            feedback's watermark to master CSVs (no date in their names),
+            then move its mark up
+    """
+    today = date.today().isoformat()
+    with ExitStack() as stack:
+        checkpoint: Checkpoint = stack.enter_context(Checkpoint(output_dir, resume))
+        csvs: dict[tuple[str | None, str], ResponsesCSV] = {}
+
+        def write(type: str, fdbk: dict, data: dict) -> None:
+            category: str | None = partitions[fdbk["course"]] if partitions else None
+            if (category, type) not in csvs:
+                label: str = f"category{category}-{type}" if category else type
+                if watermarks is None:
+                    label = f"{today}-{label}"
+                csvs[category, type] = stack.enter_context(
+                    ResponsesCSV(label, output_dir, append=watermarks is not None)
+                )
+            if watermarks is None:
+                csvs[category, type].write(data)
+                return
+            new: dict = watermarks.new_attempts(fdbk, data)
+            if new["anonattempts"]:
+                csvs[category, type].write(new)
+            watermarks.record(fdbk, data)
+
+        if len(checkpoint):
+            click.echo(f"Resuming with {len(checkpoint)} journaled feedback analyses")
+        yield checkpoint, write
+    checkpoint.remove()
+
+
+def course_categories(
+    courses: Iterable[dict], categories: dict[str, str]
+) -> dict[int, str]:
+    """course id -> the root category each course was harvested under"""
+    return {c["id"]: categories[str(c["categoryid"])] for c in courses}
+
+
+async def combine_async(
+    output_dir: Path,
+    chunk_size: int,
+    concurrency: int,
+    resume: bool,
+    recursive: bool,
+    per_category: bool,
+    incremental: bool,
+    cache_dir: Path | None,
+    no_cache: bool,
+    refresh: bool,
+) -> None:
+    """main() with an async client, `concurrency` is also its connection limit"""
+    async with AsyncMoodleClient(
+        conf["URL"], conf["TOKEN"], max_connections=concurrency
+    ) as client:
+        use_cache(client, cache_dir, no_cache, refresh or incremental)
+        categories = await get_categories_async(client, recursive)
+        courses = await get_courses_async(client, categories)
+        feedbacks = await get_feedbacks_async(client, courses, chunk_size)
+        partitions = course_categories(courses, categories) if per_category else None
+        with Watermarks(output_dir) if incremental else nullcontext() as watermarks:
+            if watermarks is not None:
+                feedbacks = await changed_feedbacks_async(client, feedbacks, watermarks)
+            with response_writers(output_dir, resume, partitions, watermarks) as (
+                checkpoint,
+                write,
+            ):
+                async for type, fdbk, data in iter_responses_async(
+                    client, feedbacks, concurrency, checkpoint
+                ):
+                    write(type, fdbk, data)
+        if conf.get("DEBUG"):
+            click.echo(f"Moodle requests: {client.stats()}")
+
+
 @click.command(help="Combine Moodle internship feedback responses into CSV files.")
 @click.help_option("-h", "--help")
 @click.option(
@@ -304,7 +945,19 @@ def get_responses(feedbacks) -> tuple[list[dict], list[dict]]:
 @click.option(
     "--category",
     "-c",
-    help="Moodle category ID to fetch courses from (overrides .env)",
+    multiple=True,
+    help="Moodle category ID to fetch courses from, repeat for several (overrides .env)",
+)
+@click.option(
+    "--recursive",
+    "-r",
+    is_flag=True,
+    help="Also fetch courses from every subcategory of the categories",
+)
+@click.option(
+    "--per-category",
+    is_flag=True,
+    help="Write a pair of CSVs for each category instead of one pair for all of them",
 )
 @click.option(
     "--token",
@@ -316,16 +969,65 @@ def get_responses(feedbacks) -> tuple[list[dict], list[dict]]:
     "-d",
     help="Moodle domain URL (overrides .env)",
 )
+@click.option(
+    "--concurrency",
+    "-n",
+    default=1,
+    help="Number of feedback analyses to fetch in parallel (default: 1)",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--chunk-size",
+    default=100,
+    help="Number of courses per request when fetching feedbacks (default: 100)",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Reuse the analyses journaled by an interrupted run instead of fetching them again",
+)
+@click.option(
+    "--async",
+    "use_async",
+    is_flag=True,
+    help="Make requests from an asyncio event loop instead of threads",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Append only the attempts submitted since the last incremental run to undated CSVs",
+)
+@cache_options
+@profile_options
 @click.option(
     "--debug",
     is_flag=True,
     help="Enable debug output",
 )
-def main(output_dir, category, token, domain, debug):
+def main(
+    output_dir,
+    category,
+    recursive,
+    per_category,
+    token,
+    domain,
+    concurrency,
+    chunk_size,
+    resume,
+    use_async,
+    incremental,
+    cache_dir,
+    no_cache,
+    refresh,
+    profile,
+    profile_json,
+    debug,
+):
     """Fetch and combine internship feedback from Moodle."""
     # Override config with CLI options if provided
     if category:
-        conf["CATEGORY"] = category
+        conf["CATEGORY"] = ",".join(category)
     if token:
         conf["TOKEN"] = token
     if domain:
@@ -342,12 +1044,49 @@ def main(output_dir, category, token, domain, debug):
         )
         exit(1)
 
-    courses = get_courses()
-    feedbacks = get_feedbacks(courses)
-    internships, evaluations = get_responses(feedbacks)
-    today = date.today().isoformat()
-    write_csv(internships, f"{today}-internships", output_dir)
-    write_csv(evaluations, f"{today}-evaluations", output_dir)
+    cache_dir = cache_dir or conf.get("CACHE_DIR")
+    with profiled(profile, profile_json):
+        if use_async:
+            asyncio.run(
+                combine_async(
+                    output_dir,
+                    chunk_size,
+                    concurrency,
+                    resume,
+                    recursive,
+                    per_category,
+                    incremental,
+                    cache_dir,
+                    no_cache,
+                    refresh,
+                )
+            )
+        else:
+            # incremental runs need the current attempts, not cached ones
+            use_cache(moodle(), cache_dir, no_cache, refresh or incremental)
+            categories = get_categories(recursive)
+            courses = get_courses(categories, concurrency)
+            feedbacks = get_feedbacks(courses, chunk_size, concurrency)
+            partitions = (
+                course_categories(courses, categories) if per_category else None
+            )
+            with Watermarks(output_dir) if incremental else nullcontext() as marks:
+                if marks is not None:
+                    feedbacks = changed_feedbacks(feedbacks, marks, concurrency)
+                # write each analysis as soon as it arrives rather than
+                # collecting them all, journaling them so an interrupted run
+                # can pick up where it left off
+                with response_writers(output_dir, resume, partitions, marks) as (
+                    checkpoint,
+                    write,
+                ):
+                    for type, fdbk, data in iter_responses(
+                        feedbacks, concurrency, checkpoint
+                    ):
+                        write(type, fdbk, data)
+            # the debug option shadows debug() in here
+            if conf.get("DEBUG"):
+                click.echo(f"Moodle requests: {moodle().throttle.stats()}")
     click.echo(f"Wrote CSV files to {output_dir}")
 
 
@@ -0,0 +1,242 @@
+import random
+import time
+
+import pytest
+
+import app
+
+
+class FakeClient:
+    def call(self, wsfunction, params=None):
+        # random latency so concurrent requests complete out of order
+        time.sleep(random.uniform(0, 0.02))
+        id = params["feedbackid"]
+        return {
+            "anonattempts": [{"id": id, "responses": []}],
+            "totalanonattempts": 1,
+        }
+
+
+@pytest.fixture(autouse=True)
+def stub_moodle(monkeypatch):
+    monkeypatch.setitem(app.conf, "TOKEN", "token")
+    monkeypatch.setitem(app.conf, "DOMAIN", "https://moodle.example.edu")
+    monkeypatch.setattr(app, "moodle", FakeClient)
+
+
+feedbacks = [
+    {"id": i, "coursemodule": i, "name": name}
+    for i, name in enumerate(
+        ["Submit Employer and Intern Information", "Midterm Evaluation", "Other"] * 10
+    )
+]
+
+
+def test_get_responses_classifies():
+    internships, evaluations = app.get_responses(feedbacks)
+    assert len(internships) == 10
+    assert len(evaluations) == 10
+    assert internships[0]["anonattempts"][0]["id"] == 0
+    assert evaluations[0]["anonattempts"][0]["id"] == 1
+
+
+def test_get_responses_concurrent_order():
+    assert app.get_responses(feedbacks, concurrency=8) == app.get_responses(feedbacks)
+
+
+def analysis(id, responses):
+    return {
+        "id": id,
+        "courseid": 1,
+        "anonattempts": [{"id": id, "responses": responses}],
+    }
+
+
+def test_write_csv(tmp_path):
+    analyses = [
+        analysis(
+            1,
+            [
+                {
+                    "id": 10,
+                    "name": "(Name) Your name",
+                    "printval": "Rey",
+                    "rawval": "Rey",
+                },
+                {
+                    "id": 11,
+                    "name": "(Connection) How?",
+                    "printval": "A &amp; B",
+                    "rawval": "2",
+                },
+            ],
+        ),
+        # another feedback with its own question ids and a different order
+        analysis(
+            2,
+            [
+                {"id": 21, "name": "(Connection) How?", "printval": "C", "rawval": "3"},
+                {
+                    "id": 20,
+                    "name": "(Name) Your name",
+                    "printval": "Finn",
+                    "rawval": "Finn",
+                },
+            ],
+        ),
+        # missing question
+        analysis(
+            3,
+            [{"id": 30, "name": "(Name) Your name", "printval": "Po", "rawval": "Po"}],
+        ),
+    ]
+    app.write_csv(iter(analyses), "test", tmp_path)
+    assert (tmp_path / "test-responses.csv").read_text().splitlines() == [
+        "Name,Connection",
+        "Rey,A & B",
+        "Finn,C",
+        "Po,",
+    ]
+
+
+def test_write_csv_unknown_question(tmp_path):
+    analyses = [
+        analysis(1, [{"id": 10, "name": "(Name) Q", "printval": "a", "rawval": "a"}]),
+        analysis(2, [{"id": 20, "name": "(Phone) Q", "printval": "1", "rawval": "1"}]),
+    ]
+    with pytest.raises(Exception, match="Phone"):
+        app.write_csv(analyses, "test", tmp_path)
+
+
+def test_get_feedbacks_chunks(monkeypatch):
+    calls = []
+
+    class ChunkClient:
+        def call(self, wsfunction, params=None, method="GET"):
+            calls.append((method, params["courseids"]))
+            return {
+                "feedbacks": [{"id": int(id), "name": ""} for id in params["courseids"]]
+            }
+
+    monkeypatch.setattr(app, "moodle", ChunkClient)
+    monkeypatch.setitem(app.conf, "IGNORED_COURSES", "3")
+    courses = [{"id": i} for i in range(1, 11)]
+    feedbacks = app.get_feedbacks(courses, chunk_size=4, concurrency=3)
+    assert [f["id"] for f in feedbacks] == [1, 2, 4, 5, 6, 7, 8, 9, 10]
+    assert sorted(calls) == [
+        ("POST", ["1", "2", "4", "5"]),
+        ("POST", ["10"]),
+        ("POST", ["6", "7", "8", "9"]),
+    ]
+
+
+def test_checkpoint_resume(tmp_path, monkeypatch):
+    # a run that dies after 5 analyses, with half a line left in the journal
+    with app.Checkpoint(tmp_path) as checkpoint:
+        for i, response in enumerate(app.iter_responses(feedbacks, 2, checkpoint)):
+            if i == 4:
+                break
+    with open(checkpoint.path, "a") as fh:
+        fh.write('{"id": 99, "type": "evalu')
+
+    fetched = []
+
+    class CountingClient(FakeClient):
+        def call(self, wsfunction, params=None):
+            fetched.append(params["feedbackid"])
+            return super().call(wsfunction, params)
+
+    monkeypatch.setattr(app, "moodle", CountingClient)
+    with app.Checkpoint(tmp_path, resume=True) as checkpoint:
+        assert 99 not in checkpoint
+        resumed = list(app.iter_responses(feedbacks, 2, checkpoint))
+    # only the feedbacks missing from the journal were requested
+    assert sorted(fetched) == [i for i in range(7, 30) if i % 3 != 2]
+    assert resumed == list(app.iter_responses(feedbacks))
+    checkpoint.remove()
+    assert not checkpoint.path.exists()
+
+
+def test_harvest_categories():
+    def category(id, parent):
+        return {"id": id, "name": str(id), "parent": parent, "path": ""}
+
+    # 1 > 2 > 3, and 4
+    tree = app.CategoryTree(
+        [category(1, 0), category(2, 1), category(3, 2), category(4, 0)]
+    )
+    assert app.harvest_categories(["4", "2", "1"]) == {"4": "4", "2": "2", "1": "1"}
+    # 2 and 3 belong to the first root they're under
+    categories = app.harvest_categories(["2", "1", "4", "3"], tree)
+    assert list(categories.items()) == [("2", "2"), ("3", "2"), ("1", "1"), ("4", "4")]
+
+
+def test_get_courses_dedupes(monkeypatch):
+    class CategoryClient:
+        def call(self, wsfunction, params=None):
+            id = int(params["value"])
+            # course 3 is listed under both categories
+            return {"courses": [{"id": id}, {"id": 3}]}
+
+    monkeypatch.setattr(app, "moodle", CategoryClient)
+    monkeypatch.setitem(app.conf, "CATEGORY", "1, 2")
+    courses = app.get_courses(concurrency=2)
+    assert [c["id"] for c in courses] == [1, 3, 2]
+
+
+def test_watermarks(tmp_path):
+    fdbk = {"id": 1}
+    attempts = [{"id": id, "responses": []} for id in (5, 7)]
+    with app.Watermarks(tmp_path) as watermarks:
+        assert 1 not in watermarks
+        data = {"totalanonattempts": 2, "anonattempts": attempts}
+        assert watermarks.new_attempts(fdbk, data) == data
+        watermarks.record(fdbk, data)
+    # a mark cut off by a crash is ignored
+    with open(tmp_path / "watermarks.ndjson", "a") as fh:
+        fh.write('{"id": 2, "attem')
+
+    with app.Watermarks(tmp_path) as watermarks:
+        assert watermarks[1] == {"id": 1, "attempts": 2, "attempt": 7}
+        assert 2 not in watermarks
+        data = {"totalanonattempts": 3, "anonattempts": [*attempts, {"id": 9}]}
+        assert watermarks.new_attempts(fdbk, data)["anonattempts"] == [{"id": 9}]
+    assert (tmp_path / "watermarks.ndjson").read_text().count("\n") == 1
+
+
+def test_changed(tmp_path):
+    feedbacks = [{"id": id, "name": "Final Evaluation"} for id in (1, 2, 3)]
+    with app.Watermarks(tmp_path) as watermarks:
+        for id in (1, 2):
+            attempts = [{"id": 10 * id + n} for n in range(3)]
+            data = {"totalanonattempts": 3, "anonattempts": attempts}
+            watermarks.record({"id": id}, data)
+        # the last page of 3 attempts, where the newest one was
+        assert app.probe_query(feedbacks[0], watermarks)["page"] == 2
+        page = {"totalanonattempts": 3, "anonattempts": [{"id": 12}]}
+        assert app.probed(page) == (3, 12)
+        # 1 is unchanged, 2 had an attempt deleted and another submitted, 3 is new
+        assert app.changed(feedbacks, watermarks, [(3, 12), (3, 23)]) == [
+            feedbacks[1],
+            feedbacks[2],
+        ]
+
+
+def test_responses_csv_append(tmp_path):
+    def response(id, question, value):
+        return {"id": id, "name": f"({question}) Q", "printval": value, "rawval": value}
+
+    with app.ResponsesCSV("test", tmp_path, append=True) as responses:
+        responses.write(
+            analysis(1, [response(10, "Name", "a"), response(11, "Email", "b")])
+        )
+    # the existing columns are kept even though this feedback's order differs
+    with app.ResponsesCSV("test", tmp_path, append=True) as responses:
+        responses.write(
+            analysis(2, [response(21, "Email", "d"), response(20, "Name", "c")])
+        )
+    assert (tmp_path / "test-responses.csv").read_text().splitlines() == [
+        "Name,Email",
+        "a,b",
+        "c,d",
+    ]
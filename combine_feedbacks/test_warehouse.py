@@ -0,0 +1,221 @@
+import json
+
+import warehouse
+
+
+def response(id, question, value):
+    return {"id": id, "name": f"({question}) Q", "printval": value, "rawval": value}
+
+
+def load(db, run=1):
+    with db:
+        warehouse.upsert(
+            db,
+            "categories",
+            ["id"],
+            [
+                warehouse.category_row(
+                    {"id": 1, "name": "A", "parent": 0, "path": "/1"}, run
+                ),
+                warehouse.category_row(
+                    {"id": 2, "name": "B", "parent": 1, "path": "/1/2"}, run
+                ),
+                warehouse.category_row(
+                    {"id": 3, "name": "C", "parent": 0, "path": "/3"}, run
+                ),
+            ],
+        )
+        warehouse.upsert(
+            db,
+            "courses",
+            ["id"],
+            [
+                warehouse.course_row(
+                    {"id": 10, "shortname": "X", "categoryid": 2}, run, 0
+                ),
+                warehouse.course_row(
+                    {"id": 20, "shortname": "Y", "categoryid": 3}, run, 1
+                ),
+            ],
+        )
+        fdbks = [
+            {"id": 100, "course": 10, "name": "Midterm Evaluation"},
+            {"id": 200, "course": 20, "name": "Final Evaluation"},
+        ]
+        warehouse.upsert(
+            db,
+            "feedbacks",
+            ["id"],
+            [warehouse.feedback_row(f, run, i) for i, f in enumerate(fdbks)],
+        )
+        for fdbk in fdbks:
+            attempts = [
+                {
+                    "id": fdbk["id"] + 1,
+                    "responses": [response(1, "Name", "a"), response(2, "Email", "b")],
+                },
+                {
+                    "id": fdbk["id"] + 2,
+                    "responses": [response(2, "Email", "d"), response(1, "Name", "c")],
+                },
+            ]
+            warehouse.upsert(
+                db,
+                "attempts",
+                ["id"],
+                [
+                    warehouse.attempt_row(fdbk, a, run, i)
+                    for i, a in enumerate(attempts)
+                ],
+            )
+            warehouse.upsert(
+                db,
+                "responses",
+                ["attemptid", "questionid"],
+                [r for a in attempts for r in warehouse.response_rows(a, run)],
+            )
+
+
+def test_upsert_updates_in_place():
+    db = warehouse.connect(":memory:")
+    load(db)
+    load(db, run=2)
+    assert db.execute("SELECT count(*) FROM responses").fetchone()[0] == 8
+    assert db.execute("SELECT DISTINCT synced FROM attempts").fetchone()[0] == 2
+    with db:
+        warehouse.upsert(
+            db,
+            "courses",
+            ["id"],
+            [warehouse.course_row({"id": 10, "shortname": "Z", "categoryid": 2}, 3, 0)],
+        )
+        # stale rows go, and take the rows under them with them
+        warehouse.delete_stale(db, "courses", "categoryid", [2, 3], 3)
+    assert [tuple(c) for c in db.execute("SELECT id, shortname FROM courses")] == [
+        (10, "Z")
+    ]
+    assert db.execute("SELECT count(*) FROM responses").fetchone()[0] == 4
+
+
+def test_export_responses(tmp_path):
+    db = warehouse.connect(":memory:")
+    load(db)
+    analyses = list(warehouse.iter_analyses(db, "evaluations", ["1"]))
+    assert [a["id"] for a in analyses] == [100]
+    warehouse.app.write_csv(analyses, "test", tmp_path)
+    assert (tmp_path / "test-responses.csv").read_text().splitlines() == [
+        "Name,Email",
+        "a,b",
+        "c,d",
+    ]
+    assert len(list(warehouse.iter_analyses(db, "evaluations"))) == 2
+    assert list(warehouse.iter_analyses(db, "internships")) == []
+
+
+def test_export_enrolments(tmp_path):
+    db = warehouse.connect(":memory:")
+    load(db)
+    user = {"courseid": "10", "id": 7, "username": "rey", "roles": ["student"]}
+    user["groups"] = ["Fall 2025", "International"]
+    with db:
+        warehouse.upsert(db, "users", ["id"], [warehouse.user_row(user, 1)])
+        warehouse.upsert(
+            db, "enrolments", ["courseid", "userid"], [warehouse.enrolment_row(user, 1)]
+        )
+    assert json.loads(
+        db.execute("SELECT groupnames FROM enrolments").fetchone()[0]
+    ) == [
+        "Fall 2025",
+        "International",
+    ]
+    assert warehouse.export_enrolments(db, tmp_path / "enrolments.csv", ["3"]) == 0
+    assert warehouse.export_enrolments(db, tmp_path / "enrolments.csv") == 1
+    assert (tmp_path / "enrolments.csv").read_text().splitlines()[1] == (
+        '10,X,7,rey,,,student,"Fall 2025,International"'
+    )
+
+
+def test_export_in_harvest_order(tmp_path):
+    """courses, feedbacks, and attempts come out in the order Moodle gave
+    them, not id order, so the CSVs match app.py's byte for byte"""
+    db = warehouse.connect(":memory:")
+    load(db)
+    courses = [
+        {"id": 20, "shortname": "Y", "categoryid": 3},
+        {"id": 10, "shortname": "X", "categoryid": 2},
+    ]
+    fdbks = [
+        {"id": 300, "course": 20, "name": "Final Evaluation"},
+        {"id": 100, "course": 10, "name": "Midterm Evaluation"},
+        {"id": 200, "course": 20, "name": "Midterm Evaluation"},
+    ]
+    analyses = [
+        {
+            "id": fdbk["id"],
+            "courseid": fdbk["course"],
+            "anonattempts": [
+                {
+                    "id": fdbk["id"] + 9,
+                    "responses": [response(2, "Email", "b"), response(1, "Name", "a")],
+                },
+                {
+                    "id": fdbk["id"] + 2,
+                    "responses": [response(1, "Name", "c"), response(2, "Email", "d")],
+                },
+            ],
+        }
+        for fdbk in fdbks
+    ]
+    with db:
+        warehouse.upsert(
+            db,
+            "courses",
+            ["id"],
+            [warehouse.course_row(c, 2, i) for i, c in enumerate(courses)],
+        )
+        warehouse.upsert(
+            db,
+            "feedbacks",
+            ["id"],
+            [warehouse.feedback_row(f, 2, i) for i, f in enumerate(fdbks)],
+        )
+        for fdbk, data in zip(fdbks, analyses):
+            warehouse.upsert(
+                db,
+                "attempts",
+                ["id"],
+                [
+                    warehouse.attempt_row(fdbk, a, 2, i)
+                    for i, a in enumerate(data["anonattempts"])
+                ],
+            )
+            warehouse.upsert(
+                db,
+                "responses",
+                ["attemptid", "questionid"],
+                [
+                    r
+                    for a in data["anonattempts"]
+                    for r in warehouse.response_rows(a, 2)
+                ],
+            )
+        # load()'s attempts, like a sync that finds them deleted
+        warehouse.delete_stale(db, "attempts", "feedbackid", [100, 200], 2)
+
+    warehouse.app.write_csv(analyses, "app", tmp_path)
+    warehouse.app.write_csv(
+        warehouse.iter_analyses(db, "evaluations"), "warehouse", tmp_path
+    )
+    assert (tmp_path / "app-responses.csv").read_text().splitlines()[:3] == [
+        "Email,Name",
+        "b,a",
+        "d,c",
+    ]
+    assert (tmp_path / "warehouse-responses.csv").read_text() == (
+        tmp_path / "app-responses.csv"
+    ).read_text()
+    assert warehouse.export_courses(db, tmp_path / "courses.csv") == 2
+    assert [
+        line.split(",")[0]
+        for line in (tmp_path / "courses.csv").read_text().splitlines()[1:]
+    ] == ["20", "10"]
@@ -0,0 +1,674 @@
+"""
+Local SQLite warehouse of the Moodle data our scripts fetch: categories,
+courses, enrolments, and the attempts on internship and evaluation feedbacks.
+`sync` loads everything under the configured categories with upserts keyed on
+Moodle ids, and `export` writes the same CSVs as app.py (plus courses and
+rosters) from the database without touching Moodle.
+"""
+
+import csv
+import json
+import sqlite3
+import sys
+import time
+from datetime import date
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import click
+
+# Add this directory to path so sibling modules import when run as a script
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import app  # also puts rest_apis on the path
+import config
+from cache import cache_options, use_cache
+from course_get_categories import CategoryTree
+from enrol_get_enrolled_users import iter_course_users
+from timing import profile_options, profiled, timings
+
+DATABASE: Path = Path("data") / "moodle.db"
+# roster fields we keep, full profiles carry every course a user is in
+ROSTER_FIELDS: list[str] = ["username", "email", "fullname", "roles", "groups"]
+EXPORTS: list[str] = ["responses", "courses", "enrolments"]
+
+# every row records the sync that last saw it, so rows a newer sync of the
+# same course or feedback didn't see can be deleted. Courses, feedbacks, and
+# attempts also record their position in the harvest so exports can write
+# them in the order app.py does, sync by sync, so categories synced one at a
+# time come out like app.py given all of them in that order.
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS syncs (
+    id INTEGER PRIMARY KEY,
+    started INTEGER NOT NULL,
+    finished INTEGER,
+    categories TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    parent INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    visible INTEGER,
+    timemodified INTEGER,
+    synced INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS categories_parent ON categories (parent);
+CREATE TABLE IF NOT EXISTS courses (
+    id INTEGER PRIMARY KEY,
+    shortname TEXT NOT NULL,
+    fullname TEXT,
+    categoryid INTEGER NOT NULL,
+    visible INTEGER,
+    startdate INTEGER,
+    enddate INTEGER,
+    position INTEGER NOT NULL,
+    synced INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS courses_categoryid ON courses (categoryid);
+CREATE INDEX IF NOT EXISTS courses_shortname ON courses (shortname);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    email TEXT,
+    fullname TEXT,
+    synced INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_username ON users (username);
+CREATE TABLE IF NOT EXISTS enrolments (
+    courseid INTEGER NOT NULL REFERENCES courses (id) ON DELETE CASCADE,
+    userid INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    -- JSON lists of role shortnames and group names
+    rolenames TEXT NOT NULL,
+    groupnames TEXT NOT NULL,
+    synced INTEGER NOT NULL,
+    PRIMARY KEY (courseid, userid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS enrolments_userid ON enrolments (userid);
+CREATE TABLE IF NOT EXISTS feedbacks (
+    id INTEGER PRIMARY KEY,
+    courseid INTEGER NOT NULL REFERENCES courses (id) ON DELETE CASCADE,
+    coursemodule INTEGER,
+    name TEXT NOT NULL,
+    -- "internships", "evaluations", or NULL for other feedbacks
+    type TEXT,
+    position INTEGER NOT NULL,
+    synced INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS feedbacks_courseid ON feedbacks (courseid);
+CREATE INDEX IF NOT EXISTS feedbacks_type ON feedbacks (type);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    feedbackid INTEGER NOT NULL REFERENCES feedbacks (id) ON DELETE CASCADE,
+    timemodified INTEGER,
+    -- order of the attempt in its analysis
+    position INTEGER NOT NULL,
+    synced INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_feedbackid ON attempts (feedbackid);
+CREATE TABLE IF NOT EXISTS responses (
+    attemptid INTEGER NOT NULL REFERENCES attempts (id) ON DELETE CASCADE,
+    questionid INTEGER NOT NULL,
+    -- order of the question in its attempt
+    position INTEGER NOT NULL,
+    -- "(Label) Question text" -> Label, NULL if the question has no label
+    label TEXT,
+    name TEXT NOT NULL,
+    printval TEXT,
+    rawval TEXT,
+    synced INTEGER NOT NULL,
+    PRIMARY KEY (attemptid, questionid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS responses_label ON responses (label);
+"""
+
+
+def connect(path: Path | str = DATABASE) -> sqlite3.Connection:
+    """open (and create) the warehouse, ":memory:" for a throwaway one"""
+    if str(path) != ":memory:":
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+    db: sqlite3.Connection = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    # readers don't block a sync, and a sync only fsyncs at checkpoints
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")
+    db.execute("PRAGMA foreign_keys = ON")
+    db.executescript(SCHEMA)
+    return db
+
+
+def upsert(
+    db: sqlite3.Connection, table: str, key: list[str], rows: Iterable[dict[str, Any]]
+) -> int:
+    """insert rows with one executemany, updating the other columns of rows
+    whose `key` columns match an existing row, call inside a transaction
+
+    Args:
+        table (str): one of the SCHEMA tables
+        key (list[str]): the table's primary key columns
+        rows (Iterable[dict]): rows with the same columns
+
+    Returns:
+        int: number of rows inserted or updated
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    columns: list[str] = list(rows[0])
+    updates: str = ", ".join(f"{c} = excluded.{c}" for c in columns if c not in key)
+    db.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join(':' + c for c in columns)}) "
+        f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}",
+        rows,
+    )
+    return len(rows)
+
+
+def category_row(category: dict[str, Any], run: int) -> dict[str, Any]:
+    return {
+        "id": category["id"],
+        "name": category["name"],
+        "parent": category["parent"],
+        "path": category["path"],
+        "visible": category.get("visible"),
+        "timemodified": category.get("timemodified"),
+        "synced": run,
+    }
+
+
+def course_row(course: dict[str, Any], run: int, position: int) -> dict[str, Any]:
+    return {
+        "id": course["id"],
+        "shortname": course["shortname"],
+        "fullname": course.get("fullname"),
+        "categoryid": course["categoryid"],
+        "visible": course.get("visible"),
+        "startdate": course.get("startdate"),
+        "enddate": course.get("enddate"),
+        "position": position,
+        "synced": run,
+    }
+
+
+def user_row(user: dict[str, Any], run: int) -> dict[str, Any]:
+    return {
+        "id": user["id"],
+        "username": user["username"],
+        "email": user.get("email"),
+        "fullname": user.get("fullname"),
+        "synced": run,
+    }
+
+
+def enrolment_row(user: dict[str, Any], run: int) -> dict[str, Any]:
+    """user is an iter_course_users() record, which has a courseid"""
+    return {
+        "courseid": int(user["courseid"]),
+        "userid": user["id"],
+        "rolenames": json.dumps(user.get("roles") or []),
+        "groupnames": json.dumps(user.get("groups") or []),
+        "synced": run,
+    }
+
+
+def feedback_row(fdbk: dict[str, Any], run: int, position: int) -> dict[str, Any]:
+    return {
+        "id": fdbk["id"],
+        "courseid": fdbk["course"],
+        "coursemodule": fdbk.get("coursemodule"),
+        "name": fdbk["name"],
+        "type": app.feedback_type(fdbk),
+        "position": position,
+        "synced": run,
+    }
+
+
+def attempt_row(
+    fdbk: dict[str, Any], attempt: dict[str, Any], run: int, position: int
+) -> dict[str, Any]:
+    return {
+        "id": attempt["id"],
+        "feedbackid": fdbk["id"],
+        "timemodified": attempt.get("timemodified"),
+        "position": position,
+        "synced": run,
+    }
+
+
+def response_rows(attempt: dict[str, Any], run: int) -> Iterator[dict[str, Any]]:
+    for position, response in enumerate(attempt["responses"]):
+        label = app.label_regex.match(response["name"].strip())
+        yield {
+            "attemptid": attempt["id"],
+            "questionid": response["id"],
+            "position": position,
+            "label": label[0][1:-1] if label else None,
+            "name": response["name"],
+            "printval": response.get("printval"),
+            "rawval": response.get("rawval"),
+            "synced": run,
+        }
+
+
+def delete_stale(
+    db: sqlite3.Connection, table: str, parent: str, ids: Iterable[Any], run: int
+) -> int:
+    """delete the rows of `table` under parent `ids` that sync `run` didn't
+    see, e.g. users who left a course whose roster was just loaded"""
+    cursor = db.executemany(
+        f"DELETE FROM {table} WHERE {parent} = ? AND synced < ?",
+        [(id, run) for id in ids],
+    )
+    return cursor.rowcount
+
+
+def sync(
+    db: sqlite3.Connection,
+    recursive: bool = False,
+    concurrency: int = 4,
+    chunk_size: int = 100,
+    rosters: bool = True,
+) -> dict[str, int]:
+    """load the categories, courses, rosters, and feedback attempts of the
+    configured categories into the warehouse
+
+    Each step is loaded with executemany in its own transaction, and rosters
+    and analyses in a transaction per course and feedback, so an interrupted
+    sync keeps what it finished. Rows that Moodle no longer has (e.g. a user
+    dropped from a synced course, or a question removed from a feedback) are
+    deleted.
+
+    Args:
+        db (sqlite3.Connection): warehouse from connect()
+        recursive (bool): include the subcategories of the categories
+        concurrency (int): categories, rosters, or analyses to fetch at once
+        chunk_size (int): courses per feedback request
+        rosters (bool): load each course's enrolments
+
+    Returns:
+        dict[str, int]: rows loaded into each table
+    """
+    counts: dict[str, int] = dict.fromkeys(
+        ["categories", "courses", "enrolments", "feedbacks", "attempts"], 0
+    )
+    with db:
+        run: int = db.execute(
+            "INSERT INTO syncs (started, categories) VALUES (?, ?)",
+            (int(time.time()), str(app.conf["CATEGORY"])),
+        ).lastrowid
+
+    # every category, they're one request and give courses their context
+    tree = CategoryTree(app.moodle().call("core_course_get_categories"))
+    categories: dict[str, str] = app.harvest_categories(
+        app.category_roots(), tree if recursive else None
+    )
+    with timings.timer("load categories"), db:
+        counts["categories"] = upsert(
+            db, "categories", ["id"], (category_row(c, run) for c in tree.categories)
+        )
+
+    courses: list[dict] = app.get_courses(categories, concurrency)
+    with timings.timer("load courses"), db:
+        counts["courses"] = upsert(
+            db,
+            "courses",
+            ["id"],
+            (course_row(c, run, i) for i, c in enumerate(courses)),
+        )
+        delete_stale(db, "courses", "categoryid", map(int, categories), run)
+    courseids: list[str] = app.course_ids(courses)
+
+    if rosters:
+        users = iter_course_users(courseids, ROSTER_FIELDS, concurrency=concurrency)
+        for _, roster in groupby(users, key=lambda u: u["courseid"]):
+            roster = list(roster)
+            with timings.timer("load enrolments"), db:
+                upsert(db, "users", ["id"], (user_row(u, run) for u in roster))
+                counts["enrolments"] += upsert(
+                    db,
+                    "enrolments",
+                    ["courseid", "userid"],
+                    (enrolment_row(u, run) for u in roster),
+                )
+        # a course whose roster is now empty never comes out of groupby, so
+        # clear out stale enrolments once every roster is in
+        with db:
+            delete_stale(db, "enrolments", "courseid", map(int, courseids), run)
+
+    feedbacks: list[dict] = app.get_feedbacks(courses, chunk_size, concurrency)
+    with timings.timer("load feedbacks"), db:
+        counts["feedbacks"] = upsert(
+            db,
+            "feedbacks",
+            ["id"],
+            (feedback_row(f, run, i) for i, f in enumerate(feedbacks)),
+        )
+        delete_stale(db, "feedbacks", "courseid", map(int, courseids), run)
+
+    for _, fdbk, data in app.iter_responses(feedbacks, concurrency):
+        with timings.timer("load attempts"), db:
+            counts["attempts"] += upsert(
+                db,
+                "attempts",
+                ["id"],
+                (
+                    attempt_row(fdbk, a, run, i)
+                    for i, a in enumerate(data["anonattempts"])
+                ),
+            )
+            upsert(
+                db,
+                "responses",
+                ["attemptid", "questionid"],
+                (r for a in data["anonattempts"] for r in response_rows(a, run)),
+            )
+            # questions that were removed from the feedback, or renumbered
+            delete_stale(
+                db,
+                "responses",
+                "attemptid",
+                (a["id"] for a in data["anonattempts"]),
+                run,
+            )
+    # attempts that were deleted, including those of feedbacks that have none
+    # left and so weren't yielded
+    with db:
+        delete_stale(db, "attempts", "feedbackid", (f["id"] for f in feedbacks), run)
+        db.execute(
+            "UPDATE syncs SET finished = ? WHERE id = ?", (int(time.time()), run)
+        )
+    return counts
+
+
+def category_filter(categories: Iterable[str]) -> tuple[str, list[str]]:
+    """SQL condition on a `cat` categories table alias that matches the
+    categories and everything under them, and its parameters"""
+    categories = list(categories)
+    if not categories:
+        return "1", []
+    condition: str = " OR ".join(["(cat.path || '/') LIKE ?"] * len(categories))
+    return f"({condition})", [f"%/{c}/%" for c in categories]
+
+
+def iter_analyses(
+    db: sqlite3.Connection, type: str, categories: Iterable[str] = ()
+) -> Iterator[dict[str, Any]]:
+    """rebuild the analyses of a type of feedback from the warehouse one
+    feedback at a time, shaped like mod_feedback_get_responses_analysis so
+    they can be written with app.write_csv(), in the order the syncs
+    harvested them
+
+    Args:
+        type (str): "internships" or "evaluations"
+        categories (Iterable[str]): only feedbacks in courses under these
+            category ids (default: all)
+    """
+    condition, params = category_filter(categories)
+    rows = db.execute(
+        f"""
+        SELECT f.id AS feedbackid, f.courseid, a.id AS attemptid,
+            r.questionid, r.name, r.printval, r.rawval
+        FROM feedbacks f
+        JOIN courses c ON c.id = f.courseid
+        JOIN categories cat ON cat.id = c.categoryid
+        JOIN attempts a ON a.feedbackid = f.id
+        JOIN responses r ON r.attemptid = a.id
+        WHERE f.type = ? AND {condition}
+        ORDER BY f.synced, f.position, a.position, r.position
+        """,
+        [type, *params],
+    )
+    for (feedbackid, courseid), feedback in groupby(rows, key=lambda r: r[:2]):
+        yield {
+            "id": feedbackid,
+            "courseid": courseid,
+            "anonattempts": [
+                {
+                    "id": attemptid,
+                    "responses": [
+                        {
+                            "id": r["questionid"],
+                            "name": r["name"],
+                            "printval": r["printval"],
+                            "rawval": r["rawval"],
+                        }
+                        for r in responses
+                    ],
+                }
+                for attemptid, responses in groupby(feedback, key=lambda r: r[2])
+            ],
+        }
+
+
+def write_query(db: sqlite3.Connection, sql: str, params: list[Any], path: Path) -> int:
+    """write the rows of a query to a CSV with its column names as the header
+
+    Returns:
+        int: rows written
+    """
+    cursor = db.execute(sql, params)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    count: int = 0
+    with open(path, "w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(d[0] for d in cursor.description)
+        for row in cursor:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def export_courses(
+    db: sqlite3.Connection, path: Path, categories: Iterable[str] = ()
+) -> int:
+    condition, params = category_filter(categories)
+    return write_query(
+        db,
+        f"""
+        SELECT c.id, c.shortname, c.fullname, c.categoryid, cat.name AS category,
+            c.visible, c.startdate, c.enddate
+        FROM courses c JOIN categories cat ON cat.id = c.categoryid
+        WHERE {condition}
+        ORDER BY c.synced, c.position
+        """,
+        params,
+        path,
+    )
+
+
+def export_enrolments(
+    db: sqlite3.Connection, path: Path, categories: Iterable[str] = ()
+) -> int:
+    condition, params = category_filter(categories)
+    # roles and groups are comma-separated like the Upload Users CSVs
+    return write_query(
+        db,
+        f"""
+        SELECT c.id AS courseid, c.shortname, u.id AS userid, u.username,
+            u.email, u.fullname,
+            (SELECT group_concat(value, ',') FROM json_each(e.rolenames)) AS roles,
+            (SELECT group_concat(value, ',') FROM json_each(e.groupnames)) AS groups
+        FROM enrolments e
+        JOIN courses c ON c.id = e.courseid
+        JOIN categories cat ON cat.id = c.categoryid
+        JOIN users u ON u.id = e.userid
+        WHERE {condition}
+        ORDER BY c.synced, c.position, u.id
+        """,
+        params,
+        path,
+    )
+
+
+def export(
+    db: sqlite3.Connection,
+    outputs: Iterable[str],
+    output_dir: Path,
+    categories: Iterable[str] = (),
+) -> None:
+    """write today's CSVs from the warehouse, responses are written exactly
+    like app.py writes them"""
+    today: str = date.today().isoformat()
+    categories = list(categories)
+    for output in outputs:
+        with timings.timer(f"export {output}"):
+            if output == "responses":
+                for type in ("internships", "evaluations"):
+                    app.write_csv(
+                        iter_analyses(db, type, categories),
+                        f"{today}-{type}",
+                        output_dir,
+                    )
+            elif output == "courses":
+                export_courses(db, output_dir / f"{today}-courses.csv", categories)
+            elif output == "enrolments":
+                export_enrolments(
+                    db, output_dir / f"{today}-enrolments.csv", categories
+                )
+
+
+def db_option(fn):
+    return click.option(
+        "--db",
+        default=DATABASE,
+        show_default=True,
+        help="SQLite database file",
+        type=click.Path(dir_okay=False, path_type=Path),
+    )(fn)
+
+
+@click.group(help="Keep a local SQLite copy of Moodle data and export CSVs from it.")
+@click.help_option("-h", "--help")
+def cli():
+    pass
+
+
+@cli.command("sync", help="Load categories, courses, rosters, and feedback attempts.")
+@click.help_option("-h", "--help")
+@db_option
+@click.option(
+    "--category",
+    "-c",
+    multiple=True,
+    help="Moodle category ID to sync courses from, repeat for several (overrides .env)",
+)
+@click.option(
+    "--recursive",
+    "-r",
+    is_flag=True,
+    help="Also sync courses from every subcategory of the categories",
+)
+@click.option(
+    "--no-enrolments",
+    is_flag=True,
+    help="Skip loading course rosters",
+)
+@click.option(
+    "--token",
+    "-t",
+    help="Moodle web service token (overrides .env)",
+)
+@click.option(
+    "--domain",
+    "-d",
+    help="Moodle domain URL (overrides .env)",
+)
+@click.option(
+    "--concurrency",
+    "-n",
+    default=4,
+    help="Number of categories, rosters, or analyses to fetch at once (default: 4)",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--chunk-size",
+    default=100,
+    help="Number of courses per request when fetching feedbacks (default: 100)",
+    type=click.IntRange(min=1),
+)
+@cache_options
+@profile_options
+def sync_command(
+    db,
+    category,
+    recursive,
+    no_enrolments,
+    token,
+    domain,
+    concurrency,
+    chunk_size,
+    cache_dir,
+    no_cache,
+    refresh,
+    profile,
+    profile_json,
+):
+    if category:
+        app.conf["CATEGORY"] = ",".join(category)
+    if token:
+        app.conf["TOKEN"] = token
+    if domain:
+        app.conf["DOMAIN"] = domain
+        app.conf["URL"] = domain + "/webservice/rest/server.php"
+    if (
+        not app.conf.get("TOKEN")
+        or not app.conf.get("DOMAIN")
+        or not app.conf.get("CATEGORY")
+    ):
+        raise click.UsageError(
+            "TOKEN, DOMAIN, and CATEGORY must be set in .env or via CLI options"
+        )
+    # the roster helpers use the rest_apis config
+    config.url, config.token = app.conf["URL"], app.conf["TOKEN"]
+
+    with profiled(profile, profile_json):
+        use_cache(
+            app.moodle(), cache_dir or app.conf.get("CACHE_DIR"), no_cache, refresh
+        )
+        connection = connect(db)
+        try:
+            counts = sync(
+                connection, recursive, concurrency, chunk_size, not no_enrolments
+            )
+        finally:
+            connection.close()
+    click.echo(
+        f"Synced {counts['categories']} categories, {counts['courses']} courses, "
+        f"{counts['enrolments']} enrolments, {counts['feedbacks']} feedbacks, and "
+        f"{counts['attempts']} feedback attempts to {db}"
+    )
+
+
+@cli.command("export", help="Write CSVs from the database without contacting Moodle.")
+@click.help_option("-h", "--help")
+@click.argument("outputs", nargs=-1, type=click.Choice(EXPORTS))
+@db_option
+@click.option(
+    "--output-dir",
+    "-o",
+    default="data",
+    help="Directory to write CSV files to (default: data)",
+    type=click.Path(path_type=Path),
+)
+@click.option(
+    "--category",
+    "-c",
+    multiple=True,
+    help="Only export courses under this category ID, repeat for several",
+)
+@profile_options
+def export_command(outputs, db, output_dir, category, profile, profile_json):
+    if not db.exists():
+        raise click.UsageError(f"{db} doesn't exist, run sync first")
+    with profiled(profile, profile_json):
+        connection = connect(db)
+        try:
+            export(connection, outputs or EXPORTS, output_dir, category)
+        finally:
+            connection.close()
+    click.echo(f"Wrote CSV files to {output_dir}")
+
+
+if __name__ == "__main__":
+    cli()
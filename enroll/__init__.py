@@ -0,0 +1,21 @@
+"""
+Enrollment scripts. They reuse the Moodle web service functions in rest_apis,
+which are modules on their own rather than a package, so importing enroll puts
+that directory on the path once for all of them. Run the scripts as modules
+from the project root, e.g. `python -m enroll.interns`.
+"""
+
+import sys
+from pathlib import Path
+
+# Find project root by looking for pyproject.toml
+current_dir = Path(__file__).resolve().parent
+project_root = current_dir.parent
+while (
+    not (project_root / "pyproject.toml").exists()
+    and project_root != project_root.parent
+):
+    project_root = project_root.parent
+
+if str(project_root / "rest_apis") not in sys.path:
+    sys.path.insert(0, str(project_root / "rest_apis"))
@@ -0,0 +1,260 @@
+"""
+Push enrollments straight into Moodle instead of uploading a CSV on the Upload
+Users page. Users are enrolled in batches with enrol_manual_enrol_users,
+groups that don't exist yet are created with core_group_create_groups, and
+users are added to their groups in batches with core_group_add_group_members.
+Course shortnames, usernames, and each course's groups are looked up once per
+run, and course and user lookups go through the response cache.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator
+
+import click
+import requests
+
+import config
+from client import MoodleError, get_client
+from course_get_courses_by_field import get_mdl_courses_by_shortname
+from timing import timings
+
+from .options import BATCH_SIZE
+
+Enrollment = tuple[str, str, str]
+# Moodle's student role
+STUDENT_ROLE: int = 5
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def send_batches(
+    wsfunction: str,
+    key: str,
+    items: list[Any],
+    batch_size: int = BATCH_SIZE,
+    unsent: Callable[[list[Any]], list[Any]] | None = None,
+) -> tuple[list[Any], list[Any]]:
+    """POST `items` to a web service function `batch_size` at a time, echoing
+    how long each batch took
+
+    Moodle checks a whole batch before changing anything, so a batch with one
+    bad item fails as a unit. The other batches are still sent.
+
+    The client doesn't retry these writes, a batch that timed out or got a 5xx
+    may have been applied anyway. Such a batch is sent once more, with only
+    the items `unsent(batch)` says are still missing from Moodle.
+
+    Args:
+        wsfunction (str): e.g. "enrol_manual_enrol_users"
+        key (str): the function's list parameter, e.g. "enrolments"
+        items (list): list parameter values
+        batch_size (int): items per request
+        unsent (Callable|None): looks up which items of a batch Moodle doesn't
+            have (default: all of them, for writes Moodle ignores when they're
+            repeated, like enrolling a user who's already enrolled)
+
+    Returns:
+        tuple[list, list]: (responses of the batches that succeeded, items of
+        the batches that failed)
+    """
+    client = get_client(config.url, config.token)
+    batches: list[list[Any]] = list(batched(items, batch_size))
+    responses: list[Any] = []
+    failed: list[Any] = []
+    for n, batch in enumerate(batches, 1):
+        start: float = time.perf_counter()
+        try:
+            responses.append(client.call(wsfunction, {key: batch}, "POST", False))
+            status: str = "ok"
+        except MoodleError as e:
+            failed.extend(batch)
+            status = f"failed: {e.message}"
+        except requests.RequestException as e:
+            remaining: list[Any] = unsent(batch) if unsent else batch
+            try:
+                if remaining:
+                    responses.append(
+                        client.call(wsfunction, {key: remaining}, "POST", False)
+                    )
+                status = f"resent {len(remaining)} after {e}"
+            except (MoodleError, requests.RequestException) as e:
+                failed.extend(remaining)
+                status = f"failed: {getattr(e, 'message', e)}"
+        seconds: float = time.perf_counter() - start
+        timings.add(f"apply {wsfunction}", seconds)
+        click.echo(
+            f"{wsfunction} batch {n}/{len(batches)}: {len(batch)} {key} in "
+            f"{seconds * 1000:.0f}ms, {status}"
+        )
+    return responses, failed
+
+
+def get_user_ids(
+    usernames: Iterable[str], batch_size: int = BATCH_SIZE
+) -> dict[str, int]:
+    """look up Moodle user ids `batch_size` usernames at a time, users that
+    don't exist are left out"""
+    client = get_client(config.url, config.token)
+    userids: dict[str, int] = {}
+    for batch in batched(sorted(set(usernames)), batch_size):
+        users: list[dict[str, Any]] = client.call(
+            "core_user_get_users_by_field",
+            {"field": "username", "values": batch},
+            "POST",
+        )
+        userids.update((u["username"], u["id"]) for u in users)
+    return userids
+
+
+def get_course_groups(
+    courseids: Iterable[int], concurrency: int = 8
+) -> dict[int, dict[str, int]]:
+    """fetch the groups of courses (concurrently)
+
+    Returns:
+        dict: {course id: {group name: group id}}
+    """
+    client = get_client(config.url, config.token)
+    courseids = list(courseids)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        groups = executor.map(
+            lambda id: client.call("core_group_get_course_groups", {"courseid": id}),
+            courseids,
+        )
+        return {
+            id: {g["name"]: g["id"] for g in course_groups}
+            for id, course_groups in zip(courseids, groups)
+        }
+
+
+def apply_enrollments(
+    enrollments: Iterable[Enrollment],
+    batch_size: int = BATCH_SIZE,
+    role: int = STUDENT_ROLE,
+    concurrency: int = 8,
+) -> dict[str, int]:
+    """enroll users and add them to groups, creating groups that are missing
+
+    Args:
+        enrollments (Iterable[tuple]): (username, course shortname, group)
+        rows like the ones written to enrollment CSVs, group may be "" to
+        only enroll
+        batch_size (int): items per web service request
+        role (int): role id to enroll users with (default: STUDENT_ROLE)
+        concurrency (int): course lookups to make at once
+
+    Returns:
+        dict[str, int]: counts of enrolments, groups created, and group
+        memberships sent, plus rows skipped for unknown users or courses and
+        items in failed batches
+    """
+    summary: dict[str, int] = dict.fromkeys(
+        ["enrolments", "groups", "memberships", "unknown", "failed"], 0
+    )
+    rows: list[Enrollment] = list(
+        dict.fromkeys((u.strip(), c.strip(), g.strip()) for u, c, g in enrollments)
+    )
+    if not rows:
+        return summary
+
+    with timings.timer("apply lookups"):
+        courses: dict[str, Any] = get_mdl_courses_by_shortname(
+            {c for _, c, _ in rows}, categories=[], concurrency=concurrency
+        )
+        courseids: dict[str, int] = {
+            s: c["id"] for s, c in courses.items() if isinstance(c, dict)
+        }
+        for shortname in sorted(courses.keys() - courseids.keys()):
+            click.echo(f"Couldn't find course {shortname}, skipping its enrollments")
+        userids: dict[str, int] = get_user_ids({u for u, _, _ in rows}, batch_size)
+        for username in sorted({u for u, _, _ in rows} - userids.keys()):
+            click.echo(f"Couldn't find user {username}, skipping their enrollments")
+    known: list[Enrollment] = [r for r in rows if r[0] in userids and r[1] in courseids]
+    summary["unknown"] = len(rows) - len(known)
+
+    # (user id, course id) in the order they first appear
+    enrolments: list[tuple[int, int]] = list(
+        dict.fromkeys((userids[u], courseids[c]) for u, c, _ in known)
+    )
+    _, failed = send_batches(
+        "enrol_manual_enrol_users",
+        "enrolments",
+        [{"roleid": role, "userid": u, "courseid": c} for u, c in enrolments],
+        batch_size,
+    )
+    summary["enrolments"] = len(enrolments) - len(failed)
+    summary["failed"] += len(failed)
+    not_enrolled: set[tuple[int, int]] = {(e["userid"], e["courseid"]) for e in failed}
+
+    grouped: list[Enrollment] = [r for r in known if r[2]]
+    with timings.timer("apply lookups"):
+        groups: dict[int, dict[str, int]] = get_course_groups(
+            sorted({courseids[c] for _, c, _ in grouped}), concurrency
+        )
+    missing: list[tuple[int, str]] = list(
+        dict.fromkeys(
+            (courseids[c], g) for _, c, g in grouped if g not in groups[courseids[c]]
+        )
+    )
+
+    def uncreated(batch: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """groups of a batch that Moodle doesn't have, noting those it does"""
+        current = get_course_groups({g["courseid"] for g in batch}, concurrency)
+        for courseid, names in current.items():
+            groups[courseid].update(names)
+        return [g for g in batch if g["name"] not in groups[g["courseid"]]]
+
+    created, failed = send_batches(
+        "core_group_create_groups",
+        "groups",
+        [{"courseid": c, "name": g, "description": ""} for c, g in missing],
+        batch_size,
+        uncreated,
+    )
+    for group in (g for batch in created for g in batch):
+        groups[group["courseid"]][group["name"]] = group["id"]
+    summary["groups"] = len(missing) - len(failed)
+    summary["failed"] += len(failed)
+
+    members: list[tuple[int, int]] = list(
+        dict.fromkeys(
+            (groups[courseids[c]][g], userids[u])
+            for u, c, g in grouped
+            if g in groups[courseids[c]]
+            and (userids[u], courseids[c]) not in not_enrolled
+        )
+    )
+    _, failed = send_batches(
+        "core_group_add_group_members",
+        "members",
+        [{"groupid": g, "userid": u} for g, u in members],
+        batch_size,
+    )
+    summary["memberships"] = len(members) - len(failed)
+    summary["failed"] += len(failed)
+    return summary
+
+
+def push(enrollments: Iterable[Enrollment], batch_size: int = BATCH_SIZE) -> None:
+    """apply enrollments for a CLI, echoing a summary
+
+    Raises:
+        click.ClickException: some batches failed
+    """
+    with timings.timer("apply"):
+        summary: dict[str, int] = apply_enrollments(enrollments, batch_size)
+    click.echo(
+        f"Enrolled {summary['enrolments']} users, created {summary['groups']} "
+        f"groups, and added {summary['memberships']} group members. Skipped "
+        f"{summary['unknown']} enrollments of unknown users or courses."
+    )
+    if summary["failed"]:
+        raise click.ClickException(
+            f"{summary['failed']} enrolments, groups, or members failed, see above"
+        )
@@ -0,0 +1,93 @@
+"""
+Compare generated enrollments against current Moodle course membership so we
+only upload the (user, course, group) rows that are missing.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import click
+
+import cache
+import config
+from client import get_client
+from course_get_courses_by_field import get_mdl_courses_by_shortname
+from enrol_get_enrolled_users import get_enrolled_users
+from timing import timings
+
+Enrollment = tuple[str, str, str]
+# all we need from a roster, full user profiles make for huge responses
+ROSTER_FIELDS: list[str] = ["username", "groups"]
+
+
+def use_cache(cache_dir: Path | None, no_cache: bool, refresh: bool) -> None:
+    """cache course lookups and rosters per the cache_options values"""
+    cache.use_cache(
+        get_client(config.url, config.token),
+        cache_dir or config.conf.get("CACHE_DIR"),
+        no_cache,
+        refresh,
+    )
+
+
+def index_memberships(shortname: str, users: list[dict[str, Any]]) -> set[Enrollment]:
+    """index a course roster as (username, course, group) tuples
+
+    Args:
+        shortname (str): course shortname
+        users (list[dict]): core_enrol_get_enrolled_users response
+    """
+    memberships: set[Enrollment] = set()
+    for user in users:
+        username: str = user["username"]
+        for group in user.get("groups", []):
+            memberships.add((username, shortname, group["name"]))
+    return memberships
+
+
+def current_memberships(
+    shortnames: Iterable[str], concurrency: int = 8
+) -> set[Enrollment]:
+    """fetch the rosters of courses (concurrently) and index who is in them
+
+    Args:
+        shortnames (Iterable[str]): course shortnames like BARCH-INTRN
+        concurrency (int): number of rosters to fetch at once
+
+    Returns:
+        set[tuple]: (username, course shortname, group name) tuples
+    """
+    # internship shortnames have no term so there's no term category to
+    # search, look each one up directly
+    courses: dict[str, Any] = get_mdl_courses_by_shortname(
+        shortnames, categories=[], concurrency=concurrency
+    )
+    found: dict[str, Any] = {s: c for s, c in courses.items() if isinstance(c, dict)}
+    for shortname in courses.keys() - found.keys():
+        click.echo(
+            f"Couldn't find course {shortname}, all its enrollments are new", err=True
+        )
+
+    memberships: set[Enrollment] = set()
+    with (
+        timings.timer("current_memberships"),
+        ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor,
+    ):
+        rosters = executor.map(
+            partial(get_enrolled_users, userfields=ROSTER_FIELDS),
+            [str(c["id"]) for c in found.values()],
+        )
+        for shortname, users in zip(found, rosters):
+            memberships |= index_memberships(shortname, users)
+    return memberships
+
+
+def missing(
+    enrollments: Iterable[Enrollment], memberships: set[Enrollment]
+) -> Iterator[Enrollment]:
+    """yield only the enrollments that aren't already in Moodle"""
+    for enrollment in enrollments:
+        if tuple(enrollment) not in memberships:
+            yield enrollment
@@ -1,23 +1,46 @@
 import _csv  # for typing
 import csv
 import re
-import warnings
+import tomllib
 from pathlib import Path
-from typing import Any, Generator, Literal
+from typing import Any, Iterator, Literal
 
 import click
-from openpyxl import Workbook, load_workbook
-from openpyxl.worksheet.worksheet import Worksheet
 
+from . import xlsx  # importing enroll puts rest_apis on the path
+from .options import apply_options
+from cache import cache_options
+from timing import profile_options, profiled, timings
+
+
+def load_programs(path: Path) -> dict[tuple[str, str], str]:
+    """compile the eligibility table into a lookup of (program, standing) to
+    internship course, leaving out disabled programs
+
+    Args:
+        path (Path): TOML file with a [programs."Program Name"] table for each
+        program, each with course, standing, and enabled keys
+
+    Returns:
+        dict: {(program, standing): course}
+    """
+    with open(path, "rb") as fh:
+        programs: dict[str, dict[str, Any]] = tomllib.load(fh)["programs"]
+    return {
+        (name, rule["standing"]): rule["course"]
+        for name, rule in programs.items()
+        if rule.get("enabled", True)
+    }
+
+
+eligibility: dict[tuple[str, str], str] = load_programs(
+    Path(__file__).resolve().parent / "programs.toml"
+)
 program_to_course_map: dict[str, str] = {
-    "Architecture": "BARCH-INTRN",
-    "Graduate Architecture": "MARCH-INTRN",
-    "Graphic Design": "GRAPH-INTRN",
-    # "Industrial Design": "INDUS-INTRN",
-    # "Interaction Design": "IXDSN-INTRN",
-    "Interior Design": "INTER-INTRN",
+    program: course for (program, _), course in eligibility.items()
 }
 programs_with_internship: list[str] = list(program_to_course_map.keys())
+email_regex: re.Pattern[str] = re.compile(r"@cca\.edu")
 
 
 def row_to_dict(header, row) -> dict[Any, Any]:
@@ -29,7 +52,8 @@ def meets_program_criteria(student) -> bool:
     internship course. Criteria rely on the Latest Class Standing field, which
     is a string that goes from "First Year" up to "Fifth Year". It is not a
     _level_ per se, as in an undergrad can be a "Fifth Year" and grad students
-    start in their "First Year". "First Year" != Freshman.
+    start in their "First Year". "First Year" != Freshman. The standing each
+    program requires is in programs.toml.
 
     Args:
         student (dict): dict of student information
@@ -37,25 +61,10 @@ def meets_program_criteria(student) -> bool:
     Returns:
         bool: true if ready, false otherwise
     """
-    major: str = student["Primary Program of Study"]
-    level: str = student["Latest Class Standing"]
-    # INDUS wants students to finish Prof Practice, we do not preload them
-    # IXDSN has their own "student tracking" spreadsheet we use
-    if (
-        major
-        in (
-            "Architecture",
-            "Interior Design",
-            "Graphic Design",
-            # "Interaction Design",
-        )
-        and level == "Third Year"
-    ):
-        return True
-    if major == "Graduate Architecture" and level == "Second Year":
-        return True
-    # default to false
-    return False
+    return (
+        student["Primary Program of Study"],
+        student["Latest Class Standing"],
+    ) in eligibility
 
 
 def make_enrollments(student, semester, program=None, list_mode=False) -> list[Any]:
@@ -70,20 +79,19 @@ def make_enrollments(student, semester, program=None, list_mode=False) -> list[A
         list: returns a list ready to be added to a Moodle enrollment CSV
         if the student is ready, otherwise the boolean False
     """
-    # students must be actively enrolled in a program with a required internship
     major: str = student["Primary Program of Study"]
+    if program and major != program:
+        return []
+    # students must be actively enrolled in a program with a required internship
+    # and meet its criteria, a single lookup in the compiled eligibility table
+    course: str | None = eligibility.get((major, student["Latest Class Standing"]))
     if (
-        major in programs_with_internship
+        course
         and student["Primary Program of Study Record Status"] == "In Progress"
         and student["CCA Email"]
     ):
-        if program and major != program:
-            return []
-        if not meets_program_criteria(student):
-            return []
         # return enrollment rows
-        username: str = re.sub("@cca.edu", "", student["CCA Email"])
-        course: str = program_to_course_map[major]
+        username: str = email_regex.sub("", student["CCA Email"])
         is_intl: Literal["International", False] = (
             "International" if student["Is International Student"] == "Yes" else False
         )
@@ -96,32 +104,76 @@ def make_enrollments(student, semester, program=None, list_mode=False) -> list[A
     return []
 
 
-def wd_report_to_enroll_csv(
-    report: Path, semester: str, program: str, list_mode: bool
-) -> None:
-    # silence "Workbook contains no default style" warning
-    with warnings.catch_warnings(record=True):
-        warnings.simplefilter("always")
-        wb: Workbook = load_workbook(report)
-    sheet: Worksheet = wb.worksheets[0]
-    rows: Generator = sheet.iter_rows(values_only=True)
+def read_report(report: Path) -> Iterator[dict[str, Any]]:
+    """stream student dicts from the Workday report one row at a time
+
+    The sheet XML is parsed as we iterate (see xlsx.py) instead of loading the
+    whole workbook into openpyxl's object model first.
+
+    Args:
+        report (Path): path to the Workday Excel file
+
+    Yields:
+        dict: student information keyed by the report's column headers
+    """
+    rows: Iterator[tuple] = xlsx.iter_rows(report)
     header: tuple = next(rows)
-    if header[0] == "Students for Internship Review":
+    if header and header[0] == "Students for Internship Review":
         # skip header row
         header = next(rows)
-    with open("enrollments.csv", "w") as file:
+    # rows end at their last non-empty cell
+    padding: tuple = (None,) * len(header)
+    for row in rows:
+        yield row_to_dict(header, row + padding)
+
+
+def report_enrollments(
+    report: Path,
+    semester: str,
+    program: str | None = None,
+    memberships: set[tuple[str, str, str]] | None = None,
+) -> Iterator[tuple[str, str, str]]:
+    """stream the report's enrollment rows, leaving out existing memberships
+    (see delta.current_memberships) if they're given"""
+    if memberships is not None:
+        from .delta import missing
+    for student in read_report(report):
+        enrollments: list[Any] = make_enrollments(student, semester, program)
+        if memberships is not None:
+            yield from missing(enrollments, memberships)
+        else:
+            yield from enrollments
+
+
+def wd_report_to_enroll_csv(
+    report: Path,
+    semester: str,
+    program: str,
+    list_mode: bool,
+    memberships: set[tuple[str, str, str]] | None = None,
+) -> None:
+    """write enrollments.csv (or print students in list mode) from the report
+
+    Args:
+        memberships (set|None): existing (username, course, group) tuples to
+        leave out of the CSV, see delta.current_memberships
+    """
+    if memberships is not None:
+        from .delta import missing
+    with timings.timer("enrollments"), open("enrollments.csv", "w") as file:
         writer: _csv._writer = csv.writer(file)
         # write CSV header row
         writer.writerow(["username", "course1", "group1"])
         if list_mode:
             click.echo("\t".join(["Student", "Email"]))
-        for row in rows:
-            student: dict[str, str] = row_to_dict(header, row)
+        for student in read_report(report):
             enrollments: list[Any] = make_enrollments(
                 student, semester, program, list_mode
             )
             if list_mode and len(enrollments):
                 click.echo("\t".join(enrollments))
+            elif memberships is not None:
+                writer.writerows(missing(enrollments, memberships))
             else:
                 writer.writerows(enrollments)
 
@@ -166,14 +218,59 @@ def semester_validator(ctx, param, value):
     is_flag=True,
     help="print list of students (instead of CSV)",
 )
-def main(report: Path, semester: str, program: str, list_mode: bool):
+@click.option(
+    "--delta",
+    "delta_mode",
+    is_flag=True,
+    help="only write enrollments that aren't already in Moodle",
+)
+@apply_options
+@cache_options
+@profile_options
+def main(
+    report: Path,
+    semester: str,
+    program: str,
+    list_mode: bool,
+    delta_mode: bool,
+    apply_mode: bool,
+    batch_size: int,
+    cache_dir: Path | None,
+    no_cache: bool,
+    refresh: bool,
+    profile: bool,
+    profile_json: Path | None,
+):
     if program == "Industrial Design":
         click.echo(
             "We do not preload Industrial Design internships students. They provide us with a list of students who completed the Professional Practice course.",
             err=True,
         )
         exit(1)
-    wd_report_to_enroll_csv(report, semester, program, list_mode)
+    if apply_mode and list_mode:
+        raise click.UsageError("--apply enrolls students, it can't list them")
+    with profiled(profile, profile_json):
+        memberships: set[tuple[str, str, str]] | None = None
+        if delta_mode or apply_mode:
+            # only import the Moodle client when we're going to use it
+            from . import delta
+
+            delta.use_cache(cache_dir, no_cache, refresh)
+        if delta_mode:
+            courses: list[str] = (
+                [program_to_course_map[program]]
+                if program
+                else list(program_to_course_map.values())
+            )
+            memberships = delta.current_memberships(courses)
+        if apply_mode:
+            from . import apply
+
+            apply.push(
+                report_enrollments(report, semester, program, memberships), batch_size
+            )
+            return
+        wd_report_to_enroll_csv(report, semester, program, list_mode, memberships)
     if not list_mode:
         click.echo(
             "Created enrollments.csv. Upload Users: https://moodle.cca.edu/admin/tool/uploaduser/"
@@ -6,6 +6,9 @@ from pathlib import Path
 
 import click
 
+from .options import apply_options  # importing enroll puts rest_apis on the path
+from cache import cache_options
+
 COURSE: str = "IXDSN-INTRN"
 EMAIL_COLUMN: str = "email"
 INTL_COLUMN: str = "international"
@@ -53,10 +56,23 @@ def semester_validator(ctx, param, value):
     help="Output CSV file (default: enrollments.csv)",
     type=click.Path(path_type=Path),
 )
-def main(infile, semester, outfile):
+@apply_options
+@cache_options
+def main(
+    infile, semester, outfile, apply_mode, batch_size, cache_dir, no_cache, refresh
+):
     """Generate IXD intern enrollment CSV."""
     with open(infile, "r") as fh:
         reader = csv.DictReader(fh)
+        if apply_mode:
+            from . import apply, delta
+
+            delta.use_cache(cache_dir, no_cache, refresh)
+            apply.push(
+                (tuple(e) for row in reader for e in make_rows(row, semester)),
+                batch_size,
+            )
+            return
         with open(outfile, "w") as out:
             writer = csv.writer(out)
             # header
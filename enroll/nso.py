@@ -6,11 +6,17 @@ students who need to be placed into multiple groups.
 """
 
 import csv
-import re
+from itertools import chain, islice
+from typing import Iterable, Iterator
 
 import click
 
-email_regex: re.Pattern[str] = re.compile(r"@cca\.edu$")
+from .options import apply_options  # importing enroll puts rest_apis on the path
+from cache import cache_options
+
+EMAIL_DOMAIN: str = "@cca.edu"
+# rows processed (and written) at a time
+CHUNK_SIZE: int = 5000
 student_type_map: dict[str, str] = {
     "First Year": "FRESH",
     "Graduate": "GRAD",
@@ -19,34 +25,60 @@ student_type_map: dict[str, str] = {
 }
 
 
-def writerows(writer, row, field_map) -> None:
-    # sometimes user hasn't created their CCA email yet, if so skip them
-    email = row[field_map["email"]].strip()
-    if not re.search(email_regex, email) or not (
-        username := re.sub(email_regex, "", email)
-    ):
-        return
-
-    stype = row[field_map["type"]].strip().title()
-    if stype not in student_type_map.keys():
-        raise ValueError(f"Unknown student type {stype} for student {username}")
-
-    writer.writerow(
-        {
-            "username": username,
-            "course1": field_map["course"].format(type=student_type_map[stype]),
-            "group1": stype,
-        }
-    )
-    # if international, write another row with the international group
-    intl = row[field_map["intl"]]
-    if intl:
-        writer.writerow(
-            {
-                "username": username,
-                "course1": field_map["course"].format(type=student_type_map[stype]),
-                "group1": "International",
-            }
+def make_rows(
+    rows: Iterable[dict[str, str]], field_map: dict[str, str], chunk_size=CHUNK_SIZE
+) -> Iterator[list[list[str]]]:
+    """turn input rows into enrollment rows, working on chunks of rows at a
+    time: each field is extracted and transformed as a whole column, then the
+    chunk's enrollments are yielded together so they can be written at once
+
+    Args:
+        rows (Iterable[dict]): input CSV rows, e.g. from a csv.DictReader
+        field_map (dict): input column names for "email", "type", and "intl",
+            plus the "course" shortname template
+        chunk_size (int): number of input rows per chunk
+
+    Yields:
+        list[list[str]]: [username, course, group] rows for each chunk
+    """
+    # there are only a few student types so format each course name once
+    courses: dict[str, str] = {
+        stype: field_map["course"].format(type=code)
+        for stype, code in student_type_map.items()
+    }
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        emails: list[str] = [row[field_map["email"]].strip() for row in chunk]
+        # sometimes user hasn't created their CCA email yet, if so skip them
+        usernames: list[str] = [
+            email[: -len(EMAIL_DOMAIN)] if email.endswith(EMAIL_DOMAIN) else ""
+            for email in emails
+        ]
+        stypes: list[str] = [row[field_map["type"]].strip().title() for row in chunk]
+        intls: list[str] = [row[field_map["intl"]] for row in chunk]
+
+        enrollments: list[list[str]] = []
+        for username, stype, intl in zip(usernames, stypes, intls):
+            if not username:
+                continue
+            course: str | None = courses.get(stype)
+            if course is None:
+                raise ValueError(f"Unknown student type {stype} for student {username}")
+            enrollments.append([username, course, stype])
+            # if international, write another row with the international group
+            if intl:
+                enrollments.append([username, course, "International"])
+        yield enrollments
+
+
+def writerows(
+    writer: csv.DictWriter, row: dict[str, str], field_map: dict[str, str]
+) -> None:
+    """write one input row's enrollments to a DictWriter with username,
+    course1, and group1 fields, the row at a time version of make_rows()"""
+    for enrollments in make_rows([row], field_map):
+        writer.writerows(
+            {"username": u, "course1": c, "group1": g} for u, c, g in enrollments
         )
 
 
@@ -87,6 +119,8 @@ def writerows(writer, row, field_map) -> None:
     required=True,
     type=str,
 )
+@apply_options
+@cache_options
 def main(**kwargs):
     field_map: dict[str, str] = {
         "email": kwargs["email"],
@@ -96,13 +130,20 @@ def main(**kwargs):
     }
     with open(kwargs["input.csv"], "r") as csvfile:
         reader = csv.DictReader(csvfile)
-        with open(kwargs["outfile"], "w") as outfile:
-            writer = csv.DictWriter(
-                outfile, fieldnames=["username", "course1", "group1"]
+        if kwargs["apply_mode"]:
+            from . import apply, delta
+
+            delta.use_cache(kwargs["cache_dir"], kwargs["no_cache"], kwargs["refresh"])
+            apply.push(
+                chain.from_iterable(make_rows(reader, field_map)),
+                kwargs["batch_size"],
             )
-            writer.writeheader()
-            for row in reader:
-                writerows(writer, row, field_map)
+            return
+        with open(kwargs["outfile"], "w") as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(["username", "course1", "group1"])
+            for enrollments in make_rows(reader, field_map):
+                writer.writerows(enrollments)
 
 
 if __name__ == "__main__":
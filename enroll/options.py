@@ -0,0 +1,27 @@
+"""
+Click options shared by the enrollment scripts. They're kept apart from
+apply.py so a script only imports the Moodle client when --apply is used.
+"""
+
+import click
+
+# enrolments, usernames, groups, or group members sent per request
+BATCH_SIZE: int = 100
+
+
+def apply_options(fn):
+    """add --apply and --batch-size options to a click command"""
+    fn = click.option(
+        "--batch-size",
+        default=BATCH_SIZE,
+        show_default=True,
+        help="Enrolments, groups, or group members per web service request",
+        type=click.IntRange(min=1),
+    )(fn)
+    fn = click.option(
+        "--apply",
+        "apply_mode",
+        is_flag=True,
+        help="Enroll users and add them to groups in Moodle instead of writing a CSV",
+    )(fn)
+    return fn
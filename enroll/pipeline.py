@@ -0,0 +1,152 @@
+"""
+Combine several enrollment sources (Workday internship reports, IXD intern
+CSVs, NSO CSVs) into a single Moodle enrollment CSV for the Upload Users page.
+Sources are described in a TOML file, streamed one after the other, and
+written in one pass with duplicate enrollments removed.
+"""
+
+import csv
+import tomllib
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+import click
+
+from . import interns, ixd_interns, nso  # importing enroll puts rest_apis on the path
+from .options import apply_options
+from cache import cache_options
+from timing import profile_options, profiled, timings
+
+Enrollment = tuple[str, str, str]
+
+
+def workday_source(source: dict[str, Any], semester: str) -> Iterator[Enrollment]:
+    for student in interns.read_report(Path(source["path"])):
+        yield from interns.make_enrollments(student, semester, source.get("program"))
+
+
+def ixd_source(source: dict[str, Any], semester: str) -> Iterator[Enrollment]:
+    with open(source["path"], "r") as fh:
+        for row in csv.DictReader(fh):
+            for enrollment in ixd_interns.make_rows(row, semester):
+                yield tuple(enrollment)
+
+
+def nso_source(source: dict[str, Any], semester: str) -> Iterator[Enrollment]:
+    # same defaults as nso.py's options
+    field_map: dict[str, str] = {
+        "email": source.get("email", "CCA email"),
+        "intl": source.get("intl", "Is International Student"),
+        "type": source.get("type", "Applicant Type"),
+        "course": source["course"],
+    }
+    with open(source["path"], "r") as fh:
+        for enrollments in nso.make_rows(csv.DictReader(fh), field_map):
+            for enrollment in enrollments:
+                yield tuple(enrollment)
+
+
+# source type in the TOML file -> function that yields its enrollments
+source_types: dict[str, Callable[[dict[str, Any], str], Iterator[Enrollment]]] = {
+    "workday": workday_source,
+    "ixd": ixd_source,
+    "nso": nso_source,
+}
+
+
+def normalize(enrollments: Iterable[Enrollment]) -> Iterator[Enrollment]:
+    """strip whitespace and drop duplicate enrollments, keeping the first"""
+    seen: set[Enrollment] = set()
+    for username, course, group in enrollments:
+        enrollment: Enrollment = (username.strip(), course.strip(), group.strip())
+        if enrollment not in seen:
+            seen.add(enrollment)
+            yield enrollment
+
+
+def run_pipeline(config: dict[str, Any], semester: str | None) -> Iterator[Enrollment]:
+    """stream the enrollments of every source in config, de-duplicated
+
+    Args:
+        config (dict): parsed TOML with [[workday]], [[ixd]], and [[nso]] tables
+        semester (str|None): semester group for internship sources
+
+    Yields:
+        tuple: (username, course, group)
+    """
+    sources: list[tuple[str, dict[str, Any]]] = [
+        (type, source) for type in source_types for source in config.get(type, [])
+    ]
+    if not semester and any(type != "nso" for type, _ in sources):
+        raise click.UsageError("Internship sources need a semester group")
+
+    def enrollments() -> Iterator[Enrollment]:
+        for type, source in sources:
+            yield from source_types[type](source, semester or "")
+
+    yield from normalize(enrollments())
+
+
+@click.command(
+    help="Combine internship and NSO enrollment sources into one Moodle enrollment CSV."
+)
+@click.help_option("-h", "--help")
+@click.argument("sources", type=click.Path(exists=True, path_type=Path))
+@click.option(
+    "-s",
+    "--semester",
+    help='Semester group for internship sources (like "Fall 2025", overrides SOURCES)',
+)
+@click.option(
+    "-o",
+    "--outfile",
+    help="Output CSV file (default: enrollments.csv, overrides SOURCES)",
+    type=click.Path(path_type=Path),
+)
+@apply_options
+@cache_options
+@profile_options
+def main(
+    sources: Path,
+    semester: str | None,
+    outfile: Path | None,
+    apply_mode: bool,
+    batch_size: int,
+    cache_dir: Path | None,
+    no_cache: bool,
+    refresh: bool,
+    profile: bool,
+    profile_json: Path | None,
+):
+    with open(sources, "rb") as fh:
+        config: dict[str, Any] = tomllib.load(fh)
+    semester = semester or config.get("semester")
+    if semester:
+        ixd_interns.semester_validator(None, None, semester)
+    outfile = outfile or Path(config.get("outfile", "enrollments.csv"))
+    if apply_mode:
+        from . import apply, delta
+
+        delta.use_cache(cache_dir, no_cache, refresh)
+        with profiled(profile, profile_json):
+            apply.push(run_pipeline(config, semester), batch_size)
+        return
+
+    count: int = 0
+    with (
+        profiled(profile, profile_json),
+        timings.timer("enrollments"),
+        open(outfile, "w") as out,
+    ):
+        writer = csv.writer(out)
+        writer.writerow(["username", "course1", "group1"])
+        for enrollment in run_pipeline(config, semester):
+            writer.writerow(enrollment)
+            count += 1
+
+    click.echo(f"Created {outfile} with {count} enrollments")
+    click.echo("Upload Users: https://moodle.cca.edu/admin/tool/uploaduser/")
+
+
+if __name__ == "__main__":
+    main()
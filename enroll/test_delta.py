@@ -0,0 +1,69 @@
+import json
+
+from click.testing import CliRunner
+from openpyxl import Workbook
+
+from . import delta
+from .interns import main
+
+
+def test_delta(tmp_path, monkeypatch):
+    with open("enroll/fixtures/enrolled_users.json") as f:
+        roster = json.load(f)
+    monkeypatch.setattr(
+        delta,
+        "get_mdl_courses_by_shortname",
+        lambda shortnames, **kwargs: {"BARCH-INTRN": {"id": 5001}},
+    )
+    monkeypatch.setattr(delta, "get_enrolled_users", lambda id, **kwargs: roster)
+
+    wb = Workbook()
+    wb.active.append(
+        [
+            "Student",
+            "CCA Email",
+            "Primary Program of Study",
+            "Primary Program of Study Record Status",
+            "Latest Class Standing",
+            "Is International Student",
+        ]
+    )
+    for username, intl in [("enrolled", "Yes"), ("nogroup", ""), ("new", "")]:
+        wb.active.append(
+            [username, f"{username}@cca.edu", "Architecture"]
+            + ["In Progress", "Third Year", intl]
+        )
+    wb.save(tmp_path / "report.xlsx")
+
+    monkeypatch.chdir(tmp_path)
+    result = CliRunner().invoke(
+        main,
+        ["-r", "report.xlsx", "-s", "Fall 2025", "-p", "Architecture", "--delta"],
+    )
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "enrollments.csv").read_text().splitlines() == [
+        "username,course1,group1",
+        "enrolled,BARCH-INTRN,International",
+        "nogroup,BARCH-INTRN,Fall 2025",
+        "new,BARCH-INTRN,Fall 2025",
+    ]
+
+
+def test_current_memberships_missing_course(monkeypatch, capsys):
+    """a course that isn't in Moodle is reported on stderr, away from
+    --list-mode output"""
+    with open("enroll/fixtures/enrolled_users.json") as f:
+        roster = json.load(f)
+    monkeypatch.setattr(
+        delta,
+        "get_mdl_courses_by_shortname",
+        lambda shortnames, **kwargs: {"BARCH-INTRN": {"id": 5001}, "NOPE": None},
+    )
+    monkeypatch.setattr(delta, "get_enrolled_users", lambda id, **kwargs: roster)
+    memberships = delta.current_memberships(["BARCH-INTRN", "NOPE"])
+    assert ("enrolled", "BARCH-INTRN", "Fall 2025") in memberships
+    assert {m[1] for m in memberships} == {"BARCH-INTRN"}
+    assert all(m[2] for m in memberships)
+    out, err = capsys.readouterr()
+    assert out == ""
+    assert err == "Couldn't find course NOPE, all its enrollments are new\n"
@@ -1,6 +1,12 @@
 import pytest
+from openpyxl import Workbook
 
-from .interns import make_enrollments, meets_program_criteria
+from .interns import (
+    load_programs,
+    make_enrollments,
+    meets_program_criteria,
+    read_report,
+)
 
 
 @pytest.mark.parametrize(
@@ -123,6 +129,17 @@ def test_make_enrollment_program_filter(input, expected):
             },
             True,
         ),
+        # INDUS third year, program is disabled
+        (
+            {
+                "CCA Email": "a@cca.edu",
+                "Primary Program of Study Record Status": "In Progress",
+                "Primary Program of Study": "Industrial Design",
+                "Is International Student": "",
+                "Latest Class Standing": "Third Year",
+            },
+            False,
+        ),
         # MARCH 2nd year, also meets
         (
             {
@@ -140,6 +157,25 @@ def test_meets_program_criteria(input, expected):
     assert meets_program_criteria(input) == expected
 
 
+def test_load_programs(tmp_path):
+    (tmp_path / "programs.toml").write_text(
+        """
+[programs."Architecture"]
+course = "BARCH-INTRN"
+standing = "Third Year"
+enabled = true
+
+[programs."Industrial Design"]
+course = "INDUS-INTRN"
+standing = "Third Year"
+enabled = false
+"""
+    )
+    assert load_programs(tmp_path / "programs.toml") == {
+        ("Architecture", "Third Year"): "BARCH-INTRN"
+    }
+
+
 # test list mode
 @pytest.mark.parametrize(
     "input,expected",
@@ -172,3 +208,29 @@ def test_meets_program_criteria(input, expected):
 )
 def test_make_enrollment_list_mode(input, expected):
     assert make_enrollments(input, "Fall 2023", list_mode=True) == expected
+
+
+@pytest.mark.parametrize("title_row", [True, False])
+def test_read_report(tmp_path, title_row):
+    wb = Workbook()
+    sheet = wb.active
+    if title_row:
+        sheet.append(["Students for Internship Review"])
+    sheet.append(["Student", "CCA Email", "Is International Student"])
+    sheet.append(["fake name", "a@cca.edu", "Yes"])
+    # trailing empty cell
+    sheet.append(["other name", "b@cca.edu"])
+    wb.save(tmp_path / "report.xlsx")
+
+    assert list(read_report(tmp_path / "report.xlsx")) == [
+        {
+            "Student": "fake name",
+            "CCA Email": "a@cca.edu",
+            "Is International Student": "Yes",
+        },
+        {
+            "Student": "other name",
+            "CCA Email": "b@cca.edu",
+            "Is International Student": None,
+        },
+    ]
@@ -1,9 +1,11 @@
+import csv
+import io
 import os
 
 import pytest
 from click.testing import CliRunner
 
-from .nso import main
+from .nso import main, make_rows, writerows
 
 
 def test_normal_nso():
@@ -25,6 +27,40 @@ def test_normal_nso():
         ]
 
 
+def test_make_rows_chunks():
+    field_map = {
+        "email": "CCA email",
+        "intl": "Is International Student",
+        "type": "Applicant Type",
+        "course": "NSO-{type}-2024FA",
+    }
+    with open("enroll/fixtures/nso.csv") as f:
+        rows = list(csv.DictReader(f))
+    # chunk boundaries don't change the output
+    assert [r for chunk in make_rows(rows, field_map, chunk_size=2) for r in chunk] == [
+        r for chunk in make_rows(rows, field_map) for r in chunk
+    ]
+    assert len(list(make_rows(rows, field_map, chunk_size=2))) == 3
+
+
+def test_writerows():
+    field_map = {
+        "email": "CCA email",
+        "intl": "Is International Student",
+        "type": "Applicant Type",
+        "course": "NSO-{type}-2024FA",
+    }
+    out = io.StringIO()
+    writer = csv.DictWriter(out, ["username", "course1", "group1"])
+    with open("enroll/fixtures/nso.csv") as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        writerows(writer, row, field_map)
+    assert list(csv.reader(io.StringIO(out.getvalue()))) == [
+        r for chunk in make_rows(rows, field_map) for r in chunk
+    ]
+
+
 def test_student_type_error():
     runner = CliRunner()
     result = runner.invoke(
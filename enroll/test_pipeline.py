@@ -0,0 +1,66 @@
+from click.testing import CliRunner
+from openpyxl import Workbook
+
+from .pipeline import main
+
+
+def test_pipeline(tmp_path):
+    wb = Workbook()
+    wb.active.append(["Students for Internship Review"])
+    wb.active.append(
+        [
+            "Student",
+            "CCA Email",
+            "Primary Program of Study",
+            "Primary Program of Study Record Status",
+            "Latest Class Standing",
+            "Is International Student",
+        ]
+    )
+    wb.active.append(
+        ["A", "arch@cca.edu", "Architecture", "In Progress", "Third Year", "Yes"]
+    )
+    wb.save(tmp_path / "report.xlsx")
+    # ixd student is listed twice
+    (tmp_path / "ixd.csv").write_text(
+        "email,international\nixd@cca.edu,no\nixd@cca.edu,no\n"
+    )
+    (tmp_path / "sources.toml").write_text(
+        f"""
+semester = "Fall 2025"
+outfile = "{tmp_path / "out.csv"}"
+
+[[workday]]
+path = "{tmp_path / "report.xlsx"}"
+
+[[ixd]]
+path = "{tmp_path / "ixd.csv"}"
+
+[[nso]]
+path = "enroll/fixtures/nso.csv"
+course = "NSO-{{type}}-2024FA"
+"""
+    )
+    result = CliRunner().invoke(main, [str(tmp_path / "sources.toml")])
+    assert result.exit_code == 0, result.output
+
+    assert (tmp_path / "out.csv").read_text().splitlines() == [
+        "username,course1,group1",
+        "arch,BARCH-INTRN,Fall 2025",
+        "arch,BARCH-INTRN,International",
+        "ixd,IXDSN-INTRN,Fall 2025",
+        "frosh,NSO-FRESH-2024FA,First Year",
+        "intlgrad,NSO-GRAD-2024FA,Graduate",
+        "intlgrad,NSO-GRAD-2024FA,International",
+        "intltransfer,NSO-TRSFR-2024FA,Transfer",
+        "intltransfer,NSO-TRSFR-2024FA,International",
+        "seconddegree,NSO-TRSFR-2024FA,Second Degree",
+    ]
+
+
+def test_pipeline_needs_semester(tmp_path):
+    (tmp_path / "sources.toml").write_text('[[ixd]]\npath = "ixd.csv"\n')
+    result = CliRunner().invoke(
+        main, [str(tmp_path / "sources.toml"), "-o", str(tmp_path / "out.csv")]
+    )
+    assert result.exit_code == 2
@@ -0,0 +1,71 @@
+import zipfile
+
+from openpyxl import Workbook, load_workbook
+
+from .xlsx import column_index, iter_rows
+
+
+def test_column_index():
+    assert column_index("A1") == 0
+    assert column_index("Z9") == 25
+    assert column_index("AB12") == 27
+
+
+def test_iter_rows_matches_openpyxl(tmp_path):
+    wb = Workbook()
+    wb.active.title = "Report"
+    sheet = wb.active
+    sheet.append(["Students for Internship Review"])
+    sheet.append(["Student", "ID", "GPA", "Active", None, "Notes"])
+    sheet.append(["fake name", 12345, 3.5, True, None, "a & <b>"])
+    # gap in the middle of the row and a skipped row
+    sheet["A5"] = "other name"
+    sheet["C5"] = 4.0
+    # a second sheet we should ignore
+    wb.create_sheet("Other").append(["nope"])
+    wb.save(tmp_path / "report.xlsx")
+
+    expected = list(
+        load_workbook(tmp_path / "report.xlsx", read_only=True)
+        .worksheets[0]
+        .iter_rows(values_only=True)
+    )
+    # openpyxl pads rows to the sheet width, we stop at the last cell
+    assert [
+        row + (None,) * (6 - len(row)) for row in iter_rows(tmp_path / "report.xlsx")
+    ] == [row + (None,) * (6 - len(row)) for row in expected]
+
+
+def test_iter_rows_cell_types(tmp_path):
+    """cells openpyxl doesn't write: phonetic runs, inline strings, ISO dates"""
+    main = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    rel = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    with zipfile.ZipFile(tmp_path / "report.xlsx", "w") as archive:
+        archive.writestr(
+            "xl/workbook.xml",
+            f'<workbook xmlns="{main}" xmlns:r="{rel}"><sheets>'
+            '<sheet name="Report" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        )
+        archive.writestr(
+            "xl/_rels/workbook.xml.rels",
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+            'relationships"><Relationship Id="rId1" Target="worksheets/sheet1.xml"/>'
+            "</Relationships>",
+        )
+        archive.writestr(
+            "xl/sharedStrings.xml",
+            f'<sst xmlns="{main}"><si><r><t>山田</t></r><r><t> 太郎</t></r>'
+            "<rPh sb='0' eb='2'><t>ヤマダ</t></rPh><phoneticPr fontId='1'/></si></sst>",
+        )
+        archive.writestr(
+            "xl/worksheets/sheet1.xml",
+            f'<worksheet xmlns="{main}"><sheetData><row r="1">'
+            '<c r="A1" t="s"><v>0</v></c>'
+            '<c r="B1" t="inlineStr"><is><t>inline</t></is></c>'
+            '<c r="C1" t="d"><v>2027-05-15T00:00:00</v></c>'
+            '<c r="D1"><v>46522</v></c>'
+            "</row></sheetData></worksheet>",
+        )
+    assert list(iter_rows(tmp_path / "report.xlsx")) == [
+        ("山田 太郎", "inline", "2027-05-15T00:00:00", 46522)
+    ]
@@ -0,0 +1,127 @@
+"""Minimal streaming reader for the first worksheet of an Excel workbook.
+
+openpyxl builds Python objects for every cell (even in read-only mode) which
+dominates the time it takes to read large Workday exports. We only need the
+cell values, so we parse the sheet XML directly and yield one row at a time.
+Dates are returned as Excel serial numbers, or as ISO 8601 strings for the
+rarer t="d" cells; none of the report fields we use are dates.
+"""
+
+import posixpath
+import re
+import zipfile
+from pathlib import Path
+from typing import Any, Iterator
+from xml.etree.ElementTree import Element, iterparse, parse
+
+MAIN: str = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL: str = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL: str = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+column_regex: re.Pattern[str] = re.compile(r"[A-Z]+")
+
+
+def column_index(ref: str) -> int:
+    """zero-based column index of a cell reference like "AB12" """
+    index: int = 0
+    match = column_regex.match(ref)
+    for char in match[0] if match else "":
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+def text(element: Element | None) -> str:
+    """concatenated text of a string item, including rich text runs but not
+    the phonetic (furigana) runs of <rPh> elements"""
+    if element is None:
+        return ""
+    parts: list[str] = []
+    for child in element:
+        if child.tag == f"{MAIN}t":
+            parts.append(child.text or "")
+        elif child.tag == f"{MAIN}r":
+            parts.extend(t.text or "" for t in child.iter(f"{MAIN}t"))
+    return "".join(parts)
+
+
+def first_sheet_path(archive: zipfile.ZipFile) -> str:
+    """path inside the archive of the first sheet listed in the workbook"""
+    with archive.open("xl/workbook.xml") as fh:
+        sheet = parse(fh).getroot().find(f"{MAIN}sheets/{MAIN}sheet")
+    if sheet is None:
+        raise ValueError("Workbook has no worksheets")
+    rel_id = sheet.get(f"{REL}id")
+    with archive.open("xl/_rels/workbook.xml.rels") as fh:
+        for rel in parse(fh).getroot().iter(f"{PKG_REL}Relationship"):
+            if rel.get("Id") == rel_id:
+                target: str = rel.get("Target", "")
+                # targets are usually relative to xl/ but can be absolute
+                if target.startswith("/"):
+                    return target.lstrip("/")
+                return posixpath.normpath(posixpath.join("xl", target))
+    raise ValueError(f"Couldn't find worksheet {rel_id} in workbook")
+
+
+def shared_strings(archive: zipfile.ZipFile) -> list[str]:
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings: list[str] = []
+    with archive.open("xl/sharedStrings.xml") as fh:
+        for _, element in iterparse(fh):
+            if element.tag == f"{MAIN}si":
+                strings.append(text(element))
+                element.clear()
+    return strings
+
+
+def cell_value(cell: Element, strings: list[str]) -> Any:
+    type: str | None = cell.get("t")
+    if type == "inlineStr":
+        return text(cell.find(f"{MAIN}is"))
+    value = cell.find(f"{MAIN}v")
+    if value is None or value.text is None:
+        return None
+    if type == "s":
+        return strings[int(value.text)]
+    # "d" is an ISO 8601 date, which we leave as a string
+    if type in ("str", "e", "d"):
+        return value.text
+    if type == "b":
+        return value.text == "1"
+    # same rule openpyxl uses to tell integers from floats
+    if "." in value.text or "E" in value.text.upper():
+        return float(value.text)
+    return int(value.text)
+
+
+def iter_rows(path: Path) -> Iterator[tuple]:
+    """yield tuples of cell values from the first worksheet, like openpyxl's
+    iter_rows(values_only=True) each row ends at its last non-empty cell and
+    missing rows are yielded as empty tuples"""
+    with zipfile.ZipFile(path) as archive:
+        strings: list[str] = shared_strings(archive)
+        with archive.open(first_sheet_path(archive)) as fh:
+            expected: int = 1
+            sheet_data: Element | None = None
+            for event, element in iterparse(fh, events=("start", "end")):
+                if event == "start":
+                    if element.tag == f"{MAIN}sheetData":
+                        sheet_data = element
+                    continue
+                if element.tag != f"{MAIN}row":
+                    continue
+                number: int = int(element.get("r", expected))
+                for _ in range(expected, number):
+                    yield ()
+                expected = number + 1
+
+                row: list[Any] = []
+                for position, cell in enumerate(element.iter(f"{MAIN}c")):
+                    ref: str | None = cell.get("r")
+                    index: int = column_index(ref) if ref else position
+                    if index >= len(row):
+                        row.extend([None] * (index + 1 - len(row)))
+                    row[index] = cell_value(cell, strings)
+                # free the parsed row, we never look back
+                if sheet_data is not None:
+                    sheet_data.clear()
+                yield tuple(row)
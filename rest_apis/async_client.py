@@ -0,0 +1,399 @@
+"""asyncio Moodle web service client for bulk operations.
+
+A thread pool spends a thread, and a turn at the GIL, on every request in
+flight. AsyncMoodleClient keeps hundreds of requests in flight from one event
+loop over a pool of keep-alive HTTP/1.1 connections, written on asyncio
+streams so there's nothing extra to install. It has the same cache, throttle,
+retries, and timings as MoodleClient and raises the same errors.
+
+The HTTP client is only as much of HTTP/1.1 as Moodle's REST endpoint needs:
+Content-Length, chunked, and read-until-close bodies, gzip, keep-alive, and
+`Connection: close`. Unlike requests it doesn't follow redirects (a 3xx is an
+HTTPError), doesn't use HTTP(S)_PROXY or .netrc, and trusts the system CA
+certificates, or REQUESTS_CA_BUNDLE, CURL_CA_BUNDLE, or SSL_CERT_FILE.
+
+    async with AsyncMoodleClient(url, token) as client:
+        courses = await asyncio.gather(
+            *(client.call("core_course_get_courses_by_field", p) for p in params)
+        )
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import ssl
+import time
+from contextlib import suppress
+from typing import Any
+from urllib.parse import urlencode, urlsplit
+
+import requests
+
+from cache import UNCACHED, ResponseCache, cache_key
+from client import POOL_SIZE, TIMEOUT, MoodleError, is_exception, ws_params
+from throttle import AsyncAIMDLimiter, Throttle, is_transient
+from timing import timings
+
+
+class Response:
+    """status, headers, and body of an HTTP response, with the parts of the
+    requests.Response interface that the clients use
+
+    Args:
+        status_code (int): HTTP status
+        headers (dict[str, str]): headers, names lowercased
+        content (bytes): body, already decompressed
+    """
+
+    def __init__(self, status_code: int, headers: dict[str, str], content: bytes):
+        self.status_code: int = status_code
+        self.headers: dict[str, str] = headers
+        self.content: bytes = content
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if 300 <= self.status_code < 400:
+            raise requests.HTTPError(
+                f"{self.status_code} redirect to {self.headers.get('location')}, "
+                "redirects aren't followed",
+                response=self,
+            )
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+
+class ConnectTimeout(TimeoutError):
+    """opening a connection timed out, so the request was never sent"""
+
+
+class ConnectionPool:
+    """keep-alive HTTP/1.1 connections to the host of one URL, opened as
+    they're needed and reused most recently used first, no redirects, proxies,
+    or HTTP/2 (see above)
+
+    Args:
+        url (str): every request goes to this URL
+        size (int): most connections open at once (default: POOL_SIZE)
+        timeout (int): seconds to wait to connect or for a response (default: TIMEOUT)
+    """
+
+    def __init__(self, url: str, size: int = POOL_SIZE, timeout: int = TIMEOUT):
+        parts = urlsplit(url)
+        self.host: str = parts.hostname or "localhost"
+        self.port: int = parts.port or (443 if parts.scheme == "https" else 80)
+        self.netloc: str = parts.netloc
+        self.path: str = parts.path or "/"
+        self.ssl: ssl.SSLContext | None = None
+        if parts.scheme == "https":
+            # the CA bundle requests would use, OpenSSL itself reads SSL_CERT_FILE
+            cafile: str | None = os.environ.get("REQUESTS_CA_BUNDLE")
+            self.ssl = ssl.create_default_context(
+                cafile=cafile or os.environ.get("CURL_CA_BUNDLE")
+            )
+        self.timeout: int = timeout
+        self.slots = asyncio.Semaphore(size)
+        self.idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    async def request(
+        self, method: str, query: dict[str, Any], retry: bool = True
+    ) -> Response:
+        """send the query string in the URL (GET) or as a form body (POST)
+
+        Args:
+            retry (bool): resend a POST on a fresh connection when a kept-alive
+                one turns out to be closed. False for writes that aren't
+                idempotent, the server may have read the request before it
+                closed the connection. GETs are always resent. (default: True)
+
+        Raises:
+            ConnectTimeout: opening a connection timed out
+            OSError: connecting or sending failed, or timed out
+            EOFError: the connection closed before the whole response arrived
+        """
+        params: str = urlencode(query)
+        head: str = (
+            f"{method} {self.path if method == 'POST' else self.path + '?' + params} "
+            f"HTTP/1.1\r\nHost: {self.netloc}\r\nAccept-Encoding: gzip\r\n"
+        )
+        body: bytes = b""
+        if method == "POST":
+            body = params.encode()
+            head += (
+                "Content-Type: application/x-www-form-urlencoded\r\n"
+                f"Content-Length: {len(body)}\r\n"
+            )
+        message: bytes = (head + "\r\n").encode() + body
+
+        async with self.slots:
+            while True:
+                reused: bool = bool(self.idle)
+                if reused:
+                    reader, writer = self.idle.pop()
+                else:
+                    try:
+                        reader, writer = await asyncio.wait_for(
+                            asyncio.open_connection(self.host, self.port, ssl=self.ssl),
+                            self.timeout,
+                        )
+                    except TimeoutError as e:
+                        raise ConnectTimeout(
+                            f"Connecting to {self.netloc} timed out"
+                        ) from e
+                try:
+                    writer.write(message)
+                    await writer.drain()
+                    response, keep_alive = await asyncio.wait_for(
+                        self.read(reader), self.timeout
+                    )
+                except TimeoutError:
+                    writer.close()
+                    raise
+                except (OSError, EOFError):
+                    writer.close()
+                    # the server closed an idle connection, try a fresh one,
+                    # unless it may have acted on a write before closing it
+                    if reused and (retry or method == "GET"):
+                        continue
+                    raise
+                except BaseException:
+                    # e.g. cancelled, the response is still on its way
+                    writer.close()
+                    raise
+                if keep_alive:
+                    self.idle.append((reader, writer))
+                else:
+                    writer.close()
+                return response
+
+    async def read(self, reader: asyncio.StreamReader) -> tuple[Response, bool]:
+        """read a response, returns it and whether the connection can be reused
+
+        Raises:
+            EOFError: the connection closed early, or the response is malformed
+        """
+        head: bytes = await reader.readuntil(b"\r\n\r\n")
+        status_line, *lines = head.decode("latin-1").split("\r\n")
+        version, status, *_ = status_line.split(" ", 2) + [""]
+        if not version.startswith("HTTP/") or not status.isdigit():
+            raise EOFError(f"Malformed status line {status_line[:100]!r}")
+        headers: dict[str, str] = {}
+        for line in lines:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+        keep_alive: bool = (
+            version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        )
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            content: bytes = await self.read_chunked(reader)
+        elif "content-length" in headers:
+            content = await reader.readexactly(int(headers["content-length"]))
+        else:
+            # the body ends when the server closes the connection
+            content = await reader.read()
+            keep_alive = False
+        if headers.get("content-encoding", "").lower() == "gzip":
+            content = gzip.decompress(content)
+        return Response(int(status), headers, content), keep_alive
+
+    async def read_chunked(self, reader: asyncio.StreamReader) -> bytes:
+        chunks: list[bytes] = []
+        while True:
+            line: bytes = await reader.readline()
+            try:
+                size: int = int(line.split(b";")[0], 16)
+            except ValueError:
+                raise EOFError(f"Malformed chunk size {line[:100]!r}") from None
+            if not size:
+                # skip any trailers up to the blank line that ends them
+                while (await reader.readline()) not in (b"\r\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    async def close(self) -> None:
+        while self.idle:
+            _, writer = self.idle.pop()
+            writer.close()
+            with suppress(OSError):
+                await writer.wait_closed()
+
+
+class AsyncMoodleClient:
+    """Call Moodle web service functions from coroutines.
+
+    Use it as an async context manager, or call aclose(), so its connections
+    are closed on the event loop that opened them.
+
+    Args:
+        url (str): REST endpoint like https://moodle.cca.edu/webservice/rest/server.php
+        token (str): web service token
+        max_connections (int): most connections open, and the highest the
+            throttle's in-flight limit goes (default: POOL_SIZE)
+        timeout (int): seconds to wait for a response (default: TIMEOUT)
+        cache (ResponseCache|None): on-disk response cache (default: None)
+        refresh (bool): skip cache reads but still store responses
+        throttle (Throttle|None): rate limit and retry policy to copy, the
+            client's own copy has an AsyncAIMDLimiter with the same bounds and
+            leaves this one untouched (default: Throttle())
+    """
+
+    def __init__(
+        self,
+        url: str,
+        token: str,
+        max_connections: int = POOL_SIZE,
+        timeout: int = TIMEOUT,
+        cache: ResponseCache | None = None,
+        refresh: bool = False,
+        throttle: Throttle | None = None,
+    ):
+        self.url: str = url
+        self.token: str = token
+        self.cache: ResponseCache | None = cache
+        self.refresh: bool = refresh
+        # the caller's throttle may be shared by threads that block on its
+        # limiter, which can't be swapped out from under them
+        self.throttle: Throttle = (
+            throttle.copy() if throttle else Throttle(max_limit=max_connections)
+        )
+        limiter = self.throttle.limiter
+        self.throttle.limiter = AsyncAIMDLimiter(
+            int(limiter.limit), limiter.min_limit, limiter.max_limit
+        )
+        self.pool = ConnectionPool(url, max_connections, timeout)
+
+    async def __aenter__(self) -> "AsyncMoodleClient":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    async def call(
+        self,
+        wsfunction: str,
+        params: dict[str, Any] | None = None,
+        method="GET",
+        retry: bool = True,
+    ) -> Any:
+        """call a web service function and return its decoded JSON, see
+        MoodleClient.call() (including `retry` for writes that aren't
+        idempotent)
+
+        Raises:
+            requests.HTTPError: non-2xx HTTP status
+            MoodleError: Moodle returned an exception payload
+        """
+        query: dict[str, Any] = ws_params(self.token, wsfunction, params)
+        cache: ResponseCache | None = None if wsfunction in UNCACHED else self.cache
+        if cache:
+            key: str = cache_key(self.url, wsfunction, query)
+            if not self.refresh:
+                hit, data = cache.get(key, wsfunction)
+                if hit:
+                    return data
+
+        attempt: int = 0
+        while True:
+            response: Response = await self.send(
+                wsfunction, query, method, attempt, retry
+            )
+            start: float = time.perf_counter()
+            data = response.json()
+            timings.decoded(wsfunction, time.perf_counter() - start)
+            if retry and is_exception(data) and is_transient(data):
+                delay: float | None = self.throttle.retry_delay(
+                    attempt, "moodle_errors"
+                )
+                if delay is not None:
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+            if is_exception(data):
+                raise MoodleError(data)
+            break
+        if cache:
+            cache.set(key, data)
+        return data
+
+    async def send(
+        self,
+        wsfunction: str,
+        query: dict[str, Any],
+        method: str = "GET",
+        attempt: int = 0,
+        retry: bool = True,
+    ) -> Response:
+        """make a request through the throttle, retrying dropped connections,
+        5xx, and 429 responses with backoff, see MoodleClient.send()
+
+        Args:
+            retry (bool): False to only retry 429s and connect timeouts,
+                which Moodle can't have acted on
+
+        Raises:
+            requests.HTTPError: non-2xx HTTP status, or out of retries
+            requests.ConnectionError: connection failed and out of retries
+        """
+        limiter: AsyncAIMDLimiter = self.throttle.limiter
+        while True:
+            wait: float = self.throttle.reserve()
+            if wait:
+                await asyncio.sleep(wait)
+            started: float = await limiter.acquire()
+            start: float = time.perf_counter()
+            try:
+                response: Response = await self.pool.request(method, query, retry)
+            except (OSError, EOFError) as e:
+                self.throttle.slow(wsfunction, started)
+                await limiter.release(started, congested=True)
+                # a connect timeout never reached Moodle
+                connect_timeout: bool = isinstance(e, ConnectTimeout)
+                delay: float | None = (
+                    self.throttle.retry_delay(attempt, "connection_errors")
+                    if retry or connect_timeout
+                    else None
+                )
+                if delay is None:
+                    error = (
+                        requests.ConnectTimeout
+                        if connect_timeout
+                        else requests.ConnectionError
+                    )
+                    raise error(str(e) or repr(e)) from e
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                await limiter.release(started, congested=False)
+                raise
+            timings.request(
+                wsfunction, time.perf_counter() - start, len(response.content)
+            )
+            pushback: bool = response.status_code == 429 or response.status_code >= 500
+            slow: bool = self.throttle.slow(wsfunction, started)
+            await limiter.release(started, pushback or slow)
+            if pushback and (retry or response.status_code == 429):
+                delay = self.throttle.retry_delay(
+                    attempt,
+                    "throttled" if response.status_code == 429 else "server_errors",
+                    response.headers.get("retry-after"),
+                )
+                if delay is not None:
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+            response.raise_for_status()
+            return response
+
+    async def aclose(self) -> None:
+        await self.pool.close()
+
+    def stats(self) -> dict[str, Any]:
+        """throttle counters plus the current in-flight limit"""
+        return self.throttle.stats()
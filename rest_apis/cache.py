@@ -0,0 +1,159 @@
+"""Opt-in on-disk cache of Moodle web service responses.
+
+Entries are keyed on (domain, wsfunction, params minus token), expire after a
+per-wsfunction TTL, and the least recently used entries are evicted once the
+cache grows past its size cap.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlparse
+
+import click
+
+# seconds until a cached response is stale, by wsfunction
+TTLS: dict[str, int] = {
+    # categories and course lists rarely change mid-term
+    "core_course_get_categories": 7 * 24 * 60 * 60,
+    "core_course_get_courses": 24 * 60 * 60,
+    "core_course_get_courses_by_field": 24 * 60 * 60,
+    "mod_feedback_get_feedbacks_by_courses": 24 * 60 * 60,
+    # responses and rosters change as students submit and enroll
+    "mod_feedback_get_responses_analysis": 60 * 60,
+    "core_enrol_get_enrolled_users": 15 * 60,
+}
+DEFAULT_TTL: int = 60 * 60
+# never cached: writes, and lookups of things our writes change
+UNCACHED: set[str] = {
+    "core_group_add_group_members",
+    "core_group_create_groups",
+    "core_group_get_course_groups",
+    "enrol_manual_enrol_users",
+}
+MAX_BYTES: int = 256 * 1024 * 1024
+
+
+def cache_key(url: str, wsfunction: str, params: dict[str, Any]) -> str:
+    """hash of the domain, wsfunction, and normalized params (minus token)"""
+    normalized: list[tuple[str, str]] = sorted(
+        (str(k), str(v))
+        for k, v in params.items()
+        if k not in ("wstoken", "wsfunction", "moodlewsrestformat")
+    )
+    key: str = json.dumps([urlparse(url).netloc, wsfunction, normalized])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Directory of JSON files, one per cached response.
+
+    Args:
+        directory (Path): where to store responses
+        ttls (dict[str, int]): seconds each wsfunction stays fresh (default: TTLS)
+        max_bytes (int): total size before LRU eviction (default: MAX_BYTES)
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        ttls: dict[str, int] = TTLS,
+        max_bytes: int = MAX_BYTES,
+    ):
+        self.directory: Path = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttls: dict[str, int] = ttls
+        self.max_bytes: int = max_bytes
+        self.lock = threading.Lock()
+        self.size: int = sum(f.stat().st_size for f in self.directory.glob("*.json"))
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str, wsfunction: str) -> tuple[bool, Any]:
+        """look up a response
+
+        Returns:
+            tuple[bool, Any]: (hit, data) where data is None on a miss
+        """
+        path: Path = self.path(key)
+        try:
+            with open(path) as fh:
+                entry: dict[str, Any] = json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False, None
+        if time.time() - entry["time"] > self.ttls.get(wsfunction, DEFAULT_TTL):
+            self.delete(path)
+            return False, None
+        # access time is unreliable (noatime mounts) so bump mtime for LRU
+        os.utime(path)
+        return True, entry["data"]
+
+    def set(self, key: str, data: Any) -> None:
+        path: Path = self.path(key)
+        tmp: Path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp, "w") as fh:
+            json.dump({"time": time.time(), "data": data}, fh)
+        size: int = tmp.stat().st_size
+        with self.lock:
+            if path.exists():
+                self.size -= path.stat().st_size
+            os.replace(tmp, path)
+            self.size += size
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def delete(self, path: Path) -> None:
+        with self.lock:
+            try:
+                size: int = path.stat().st_size
+                path.unlink()
+                self.size -= size
+            except FileNotFoundError:
+                pass
+
+    def evict(self) -> None:
+        """delete least recently used entries until we're under the size cap"""
+        entries = sorted(self.directory.glob("*.json"), key=lambda f: f.stat().st_mtime)
+        for path in entries:
+            if self.size <= self.max_bytes:
+                break
+            self.delete(path)
+
+    def clear(self) -> None:
+        for path in self.directory.glob("*.json"):
+            self.delete(path)
+
+
+def cache_options(fn):
+    """add --cache-dir, --no-cache, and --refresh options to a click command"""
+    fn = click.option(
+        "--refresh",
+        is_flag=True,
+        help="Ignore cached responses but store the fresh ones",
+    )(fn)
+    fn = click.option(
+        "--no-cache",
+        is_flag=True,
+        help="Disable the response cache even if a cache directory is set",
+    )(fn)
+    fn = click.option(
+        "--cache-dir",
+        help="Cache Moodle responses in this directory (overrides .env CACHE_DIR)",
+        type=click.Path(file_okay=False, path_type=Path),
+    )(fn)
+    return fn
+
+
+def use_cache(client, cache_dir: Path | None, no_cache: bool, refresh: bool) -> None:
+    """configure a MoodleClient's cache from the cache_options values, caching
+    is off unless a cache directory is given"""
+    if cache_dir and not no_cache:
+        client.cache = ResponseCache(cache_dir)
+        client.refresh = refresh
+    else:
+        client.cache = None
@@ -0,0 +1,352 @@
+"""Shared Moodle web service client.
+
+All of our scripts talk to the same REST endpoint with the same token, so they
+share one keep-alive requests Session per (url, token) instead of opening a new
+TCP+TLS connection for every call.
+"""
+
+import codecs
+import json
+import time
+from functools import lru_cache
+from typing import Any, Iterable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import UNCACHED, ResponseCache, cache_key
+from throttle import Throttle, is_transient
+from timing import timings
+
+# connections kept alive per host, enough for our thread pools
+POOL_SIZE: int = 16
+TIMEOUT: int = 60
+# bytes read at a time when streaming a response
+CHUNK_SIZE: int = 64 * 1024
+
+
+class MoodleError(Exception):
+    """Moodle sends HTTP 200 responses with error information in JSON, example:
+    { 'errorcode': 'criteriaerror', 'debuginfo':
+    'You can not search on this criteria: shortname', 'exception':
+    'moodle_exception', 'message': 'Missing permissions to search on
+    a criterion. (You can not search on this criteria: shortname)' }
+    """
+
+    def __init__(self, data: dict[str, Any]):
+        self.data: dict[str, Any] = data
+        self.errorcode: str | None = data.get("errorcode")
+        self.exception: str | None = data.get("exception")
+        self.message: str = data.get("message", str(data))
+        super().__init__(self.message)
+
+
+def is_exception(data: Any) -> bool:
+    """is this decoded response one of Moodle's HTTP 200 exception payloads?"""
+    return isinstance(data, dict) and bool(
+        data.get("exception") or data.get("moodle_exception")
+    )
+
+
+def php_params(params: dict[str, Any]) -> dict[str, Any]:
+    """flatten lists and dicts into PHP array query string format, e.g.
+    {"courseids": [1, 2]} -> {"courseids[0]": 1, "courseids[1]": 2}
+    {"criteria": [{"key": "name"}]} -> {"criteria[0][key]": "name"}
+
+    because it wouldn't be Moodle without a weird, antiquated nuance
+    """
+    flat: dict[str, Any] = {}
+    for key, value in params.items():
+        if isinstance(value, dict):
+            items = value.items()
+        elif isinstance(value, (list, tuple)):
+            items = enumerate(value)
+        else:
+            flat[key] = value
+            continue
+        for k, v in php_params({f"{key}[{k}]": v for k, v in items}).items():
+            flat[k] = v
+    return flat
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """incrementally parse a top-level JSON array, yielding one item at a time
+    so only the current item (plus one chunk) is ever held in memory
+
+    Raises:
+        MoodleError: the body was an exception object rather than an array
+        ValueError: the body is neither an array nor an object
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer: str = ""
+    pos: int = 0
+    exhausted: bool = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, exhausted
+        for chunk in chunks:
+            # drop what we've already parsed before adding more
+            buffer = buffer[pos:] + utf8.decode(chunk)
+            pos = 0
+            return True
+        exhausted = True
+        buffer = buffer[pos:] + utf8.decode(b"", final=True)
+        pos = 0
+        return False
+
+    def skip(chars: str) -> str:
+        """advance past chars, returning the next character ("" at EOF)"""
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not fill():
+                return ""
+
+    start: str = skip(" \t\r\n")
+    if start == "{":
+        # exceptions are the only objects a list-returning wsfunction sends
+        while fill():
+            pass
+        data = json.loads(buffer)
+        if is_exception(data):
+            raise MoodleError(data)
+        raise ValueError(f"Expected a JSON array, got an object: {buffer[:100]}")
+    if start != "[":
+        raise ValueError(f"Expected a JSON array, got: {buffer[pos : pos + 100]}")
+    pos += 1
+
+    while True:
+        if skip(" \t\r\n,") in ("]", ""):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(buffer) and not exhausted:
+                raise json.JSONDecodeError("item may be incomplete", buffer, end)
+        except json.JSONDecodeError:
+            if exhausted:
+                raise
+            fill()
+            continue
+        pos = end
+        yield item
+
+
+def ws_params(
+    token: str, wsfunction: str, params: dict[str, Any] | None
+) -> dict[str, Any]:
+    """full query of a web service call: token, function, format, and params"""
+    return {
+        # see https://moodle.cca.edu/admin/settings.php?section=webservicetokens
+        "wstoken": token,
+        "wsfunction": wsfunction,
+        "moodlewsrestformat": "json",
+        **php_params(params or {}),
+    }
+
+
+class MoodleClient:
+    """Call Moodle web service functions over a pooled, keep-alive session.
+
+    Args:
+        url (str): REST endpoint like https://moodle.cca.edu/webservice/rest/server.php
+        token (str): web service token
+        pool_size (int): max connections kept alive (default: POOL_SIZE)
+        timeout (int): seconds to wait for a response (default: TIMEOUT)
+        cache (ResponseCache|None): on-disk response cache (default: None)
+        refresh (bool): skip cache reads but still store responses
+        throttle (Throttle|None): rate limit and retry policy (default: Throttle())
+    """
+
+    def __init__(
+        self,
+        url: str,
+        token: str,
+        pool_size: int = POOL_SIZE,
+        timeout: int = TIMEOUT,
+        cache: ResponseCache | None = None,
+        refresh: bool = False,
+        throttle: Throttle | None = None,
+    ):
+        self.url: str = url
+        self.token: str = token
+        self.timeout: int = timeout
+        self.cache: ResponseCache | None = cache
+        self.refresh: bool = refresh
+        self.throttle: Throttle = throttle or Throttle(max_limit=pool_size)
+        self.session: requests.Session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def params(self, wsfunction: str, params: dict[str, Any] | None) -> dict[str, Any]:
+        return ws_params(self.token, wsfunction, params)
+
+    def call(
+        self,
+        wsfunction: str,
+        params: dict[str, Any] | None = None,
+        method="GET",
+        retry: bool = True,
+    ) -> Any:
+        """call a web service function and return its decoded JSON
+
+        Args:
+            wsfunction (str): e.g. "core_course_get_courses"
+            params (dict|None): function parameters, lists and dicts are
+                flattened into PHP array format
+            method (str): "GET" or "POST", use POST when params are too long
+                for a URL (default: GET)
+            retry (bool): retry timeouts, dropped connections, 5xx responses,
+                and transient Moodle errors. Pass False for writes that aren't
+                idempotent, Moodle may have applied a request whose response
+                we never got. 429s and connections that were never opened are
+                retried either way. (default: True)
+
+        Raises:
+            requests.HTTPError: non-2xx HTTP status
+            MoodleError: Moodle returned an exception payload
+
+        Returns:
+            Any: decoded JSON response
+        """
+        query: dict[str, Any] = self.params(wsfunction, params)
+        cache: ResponseCache | None = None if wsfunction in UNCACHED else self.cache
+        if cache:
+            key: str = cache_key(self.url, wsfunction, query)
+            if not self.refresh:
+                hit, data = cache.get(key, wsfunction)
+                if hit:
+                    return data
+
+        attempt: int = 0
+        while True:
+            response: requests.Response = self.send(
+                wsfunction, query, method, attempt, retry=retry
+            )
+            start: float = time.perf_counter()
+            data = response.json()
+            timings.decoded(wsfunction, time.perf_counter() - start)
+            if retry and is_exception(data) and is_transient(data):
+                if self.throttle.retry(attempt, "moodle_errors"):
+                    attempt += 1
+                    continue
+            if is_exception(data):
+                raise MoodleError(data)
+            break
+        if cache:
+            cache.set(key, data)
+        return data
+
+    def stream(
+        self, wsfunction: str, params: dict[str, Any] | None = None
+    ) -> Iterator[Any]:
+        """call a web service function that returns a list and yield its items
+        as they are parsed from the response body, bypassing the cache
+
+        Raises:
+            requests.HTTPError: non-2xx HTTP status
+            MoodleError: Moodle returned an exception payload
+        """
+        query: dict[str, Any] = self.params(wsfunction, params)
+        size: int = 0
+
+        def chunks(response: requests.Response) -> Iterator[bytes]:
+            nonlocal size
+            for chunk in response.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                yield chunk
+
+        with self.send(wsfunction, query, stream=True) as response:
+            start: float = time.perf_counter()
+            try:
+                yield from iter_json_array(chunks(response))
+            finally:
+                timings.streamed(wsfunction, time.perf_counter() - start, size)
+
+    def send(
+        self,
+        wsfunction: str,
+        query: dict[str, Any],
+        method: str = "GET",
+        attempt: int = 0,
+        stream: bool = False,
+        retry: bool = True,
+    ) -> requests.Response:
+        """make a request through the throttle, retrying dropped connections,
+        5xx, and 429 responses with backoff
+
+        Args:
+            attempt (int): retries the caller has already made
+            retry (bool): False to only retry requests Moodle can't have
+                acted on, 429s and connect timeouts, see call()
+
+        Raises:
+            requests.HTTPError: non-2xx HTTP status, or out of retries
+            requests.RequestException: connection failed and out of retries
+        """
+        while True:
+            started: float = self.throttle.acquire()
+            start: float = time.perf_counter()
+            dropped: requests.RequestException | None = None
+            pushback: bool = False
+            try:
+                if method == "POST":
+                    response: requests.Response = self.session.post(
+                        self.url, data=query, timeout=self.timeout, stream=stream
+                    )
+                else:
+                    response = self.session.get(
+                        self.url, params=query, timeout=self.timeout, stream=stream
+                    )
+                # streamed bodies are read (and timed) as they're parsed, see
+                # stream()
+                timings.request(
+                    wsfunction,
+                    time.perf_counter() - start,
+                    0 if stream else len(response.content),
+                )
+                pushback = response.status_code == 429 or response.status_code >= 500
+            except (requests.ConnectionError, requests.Timeout) as e:
+                dropped = e
+            finally:
+                # free the slot whatever happened (an invalid URL, an SSL error,
+                # Ctrl-C) or every thread sharing this client ends up blocked in
+                # acquire(), only Moodle pushing back counts as congestion
+                self.throttle.release(
+                    wsfunction, started, failed=pushback or dropped is not None
+                )
+            if dropped is not None:
+                # a connect timeout never reached Moodle
+                resendable: bool = retry or isinstance(dropped, requests.ConnectTimeout)
+                if resendable and self.throttle.retry(attempt, "connection_errors"):
+                    attempt += 1
+                    continue
+                raise dropped
+            throttled: bool = response.status_code == 429
+            # a 429 was turned away before Moodle did anything
+            if pushback and (retry or throttled):
+                if self.throttle.retry(
+                    attempt,
+                    "throttled" if throttled else "server_errors",
+                    response.headers.get("Retry-After"),
+                ):
+                    response.close()
+                    attempt += 1
+                    continue
+            response.raise_for_status()
+            return response
+
+    def close(self) -> None:
+        self.session.close()
+
+
+@lru_cache
+def get_client(url: str, token: str) -> MoodleClient:
+    """shared client for a url and token so every caller reuses its sockets"""
+    return MoodleClient(url, token)
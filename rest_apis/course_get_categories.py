@@ -4,14 +4,17 @@ Returns JSON data of the named category and all its children.
 
 import json
 import sys
+from collections import defaultdict
 from pathlib import Path
+from typing import Any, Iterable
 
 import click
-import requests
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 import config
+from client import MoodleError, get_client
+from timing import profile_options, profiled
 
 # https://moodle.cca.edu/webservice/rest/server.php?wstoken=...&wsfunction=core_course_get_categories&moodlewsrestformat=json&criteria[0][key]=name&criteria[0][value]=2019SP
 
@@ -34,48 +37,111 @@ def get_mdl_categories(filter):
     useful fields. To see the full set, look at a returned value. A few fields
     are empty or unused like "idnumber" and "description".
     """
-    # constants
-    url = config.url
-    service = "core_course_get_categories"
-    format = "json"
-    params = {
-        # see https://moodle.cca.edu/admin/settings.php?section=webservicetokens
-        "wstoken": config.token,
-        "wsfunction": service,
-        "moodlewsrestformat": format,
-    }
-
-    # construct criteria in PHP array query string format
-    # because it wouldn't be Moodle without a weird, antiquated nuance
-    num_filters = 0
-    for key, value in filter.items():
-        params["criteria[{}][key]".format(num_filters)] = key
-        params["criteria[{}][value]".format(num_filters)] = value
-        num_filters += 1
-
-    response = requests.get(url, params=params)
-    data = response.json()
-
-    if data is not None:
-        if isinstance(data, list) and len(data) == 0:
-            # not an error but didn't get any categories
-            print("No matching categories were found; check your query filter.")
-            return data
-
-        elif isinstance(data, dict):
-            if data.get("exception") or data.get("moodle_exception"):
-                """
-                Moodle sends HTTP 200 responses with error information in JSON, example:
-                { 'errorcode': 'criteriaerror', 'debuginfo':
-                'You can not search on this criteria: shortname', 'exception':
-                'moodle_exception', 'message': 'Missing permissions to search on
-                a criterion. (You can not search on this criteria: shortname)' }
-                """
-                return "Error: {}".format(data["message"])
+    # the client flattens criteria into PHP array query string format like
+    # criteria[0][key]=name&criteria[0][value]=2019SP
+    criteria = [{"key": key, "value": value} for key, value in filter.items()]
+
+    try:
+        data = get_client(config.url, config.token).call(
+            "core_course_get_categories", {"criteria": criteria}
+        )
+    except MoodleError as e:
+        return "Error: {}".format(e.message)
+
+    if isinstance(data, list) and len(data) == 0:
+        # not an error but didn't get any categories
+        print("No matching categories were found; check your query filter.")
 
     return data
 
 
+class CategoryTree:
+    """index of every Moodle category by id, name, and parent, built from one
+    core_course_get_categories request, so walking the hierarchy doesn't cost
+    a round trip per level
+
+    Args:
+        categories (list[dict]): every category, as core_course_get_categories
+            returns them
+    """
+
+    def __init__(self, categories: list[dict[str, Any]]):
+        self.categories: list[dict[str, Any]] = categories
+        self.by_id: dict[int, dict[str, Any]] = {c["id"]: c for c in categories}
+        self.by_name: dict[str, list[int]] = defaultdict(list)
+        self.children: dict[int, list[int]] = defaultdict(list)
+        # position in the API response, so results come back in Moodle's order
+        self.order: dict[int, int] = {}
+        for position, category in enumerate(categories):
+            self.by_name[category["name"]].append(category["id"])
+            self.children[category["parent"]].append(category["id"])
+            self.order[category["id"]] = position
+
+    @classmethod
+    def fetch(cls) -> "CategoryTree":
+        """build the tree from all of Moodle's categories
+
+        Raises:
+            MoodleError: e.g. the token can't call core_course_get_categories
+        """
+        return cls(
+            get_client(config.url, config.token).call("core_course_get_categories")
+        )
+
+    @classmethod
+    def load(cls, path: Path | None = None, refresh: bool = False) -> "CategoryTree":
+        """read the tree saved at `path`, or fetch it (and save it to `path`) if
+        there's no saved tree or `refresh` is set"""
+        if path and Path(path).exists() and not refresh:
+            with open(path, "r") as fh:
+                return cls(json.load(fh))
+        tree: CategoryTree = cls.fetch()
+        if path:
+            tree.save(path)
+        return tree
+
+    def save(self, path: Path) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as fh:
+            json.dump(self.categories, fh)
+
+    def sorted(self, ids: Iterable[int]) -> list[dict[str, Any]]:
+        return [self.by_id[id] for id in sorted(set(ids), key=self.order.__getitem__)]
+
+    def named(self, name: str) -> list[dict[str, Any]]:
+        """categories with this exact name"""
+        return [self.by_id[id] for id in self.by_name.get(name, [])]
+
+    def subtree_ids(self, id: int) -> list[int]:
+        ids: list[int] = [id] if id in self.by_id else []
+        # breadth first, ids grows as we go
+        for parent in ids:
+            ids.extend(self.children.get(parent, []))
+        return ids
+
+    def subtree(self, id: int) -> list[dict[str, Any]]:
+        """a category and all its descendants"""
+        return self.sorted(self.subtree_ids(id))
+
+    def ancestors(self, id: int) -> list[dict[str, Any]]:
+        """a category's parents from the top level down, read from its path"""
+        path: list[int] = [int(p) for p in self.by_id[id]["path"].split("/") if p]
+        return [self.by_id[p] for p in path[:-1] if p in self.by_id]
+
+    def find(self, filter: dict[str, Any]) -> list[dict[str, Any]]:
+        """categories matching every key/value of `filter` and all their
+        children, the same results as get_mdl_categories(filter)"""
+        if list(filter) == ["name"]:
+            matches: list[dict[str, Any]] = self.named(filter["name"])
+        else:
+            matches = [
+                c
+                for c in self.categories
+                if all(str(c.get(k)) == str(v) for k, v in filter.items())
+            ]
+        return self.sorted(id for c in matches for id in self.subtree_ids(c["id"]))
+
+
 @click.command(help="Get Moodle category data by name.")
 @click.help_option("-h", "--help")
 @click.argument("name", type=str)
@@ -89,7 +155,28 @@ def get_mdl_categories(filter):
     "-d",
     help="Moodle domain URL (overrides .env)",
 )
-def main(name, token, domain):
+@click.option(
+    "--local",
+    is_flag=True,
+    help="Answer from an index of all categories instead of a filtered request",
+)
+@click.option(
+    "--index",
+    help="Save the category index to this JSON file and reuse it (implies --local)",
+    type=click.Path(dir_okay=False, path_type=Path),
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    help="Rebuild the saved --index from Moodle",
+)
+@click.option(
+    "--ancestors",
+    is_flag=True,
+    help="Print the parents of the named categories instead of their children (implies --local)",
+)
+@profile_options
+def main(name, token, domain, local, index, refresh, ancestors, profile, profile_json):
     """Get category data by name (e.g., '2022SP')."""
     global config
     if token:
@@ -97,7 +184,19 @@ def main(name, token, domain):
     if domain:
         config.url = domain + "/webservice/rest/server.php"
 
-    result = get_mdl_categories({"name": name})
+    with profiled(profile, profile_json):
+        if local or index or ancestors:
+            try:
+                tree = CategoryTree.load(index, refresh)
+            except MoodleError as e:
+                click.echo(f"Error: {e.message}", err=True)
+                exit(1)
+            if ancestors:
+                result = {c["id"]: tree.ancestors(c["id"]) for c in tree.named(name)}
+            else:
+                result = tree.find({"name": name})
+        else:
+            result = get_mdl_categories({"name": name})
     click.echo(json.dumps(result, indent=2))
 
 
@@ -1,13 +1,16 @@
+import csv
 import json
 import sys
 from pathlib import Path
+from typing import Any, Iterator
 
 import click
-import requests
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 import config
+from client import MoodleError, get_client
+from timing import profile_options, profiled
 
 # https://moodle.cca.edu/webservice/rest/server.php?wstoken=...&wsfunction=core_course_get_courses&moodlewsrestformat=json
 
@@ -17,16 +20,10 @@ def get_mdl_courses():
 
     returns: a list of course objects
     """
-    url: str = config.url
-    params: dict[str, str] = {
-        # found at https://moodle.cca.edu/admin/settings.php?section=webservicetokens
-        "wstoken": config.token,
-        "wsfunction": "core_course_get_courses",
-        "moodlewsrestformat": "json",
-    }
-
-    response: requests.Response = requests.get(url, params=params)
-    data = response.json()
+    try:
+        data = get_client(config.url, config.token).call("core_course_get_courses")
+    except MoodleError as e:
+        data = e.data
 
     if data and isinstance(data, list):
         for c in data:
@@ -54,6 +51,58 @@ def get_mdl_courses():
     return "Error: {}".format(data)
 
 
+def iter_mdl_courses(fields: list[str] | None = None) -> Iterator[dict[str, Any]]:
+    """stream the complete list of courses in Moodle, one course at a time
+
+    The full site response is tens of thousands of courses with summaries, so
+    rather than decoding it all at once we parse each course out of the
+    response body as it arrives.
+
+    `fields` is an optional list of course fields (e.g. ["id", "shortname"]) to
+    project each course dict down to.
+
+    raises: client.MoodleError if Moodle sends an exception
+    """
+    courses = get_client(config.url, config.token).stream("core_course_get_courses")
+    for course in courses:
+        if fields:
+            course = {f: course.get(f) for f in fields}
+        yield course
+
+
+def write_courses(
+    courses: Iterator[dict[str, Any]], output, format: str, fields: list[str] | None
+) -> int:
+    """write courses to output as NDJSON or CSV, one row at a time
+
+    returns: number of courses written
+    """
+    count: int = 0
+    if format == "ndjson":
+        for course in courses:
+            output.write(json.dumps(course) + "\n")
+            count += 1
+        return count
+
+    writer: csv.DictWriter | None = None
+    for course in courses:
+        if writer is None:
+            # without a projection use the first course's fields as columns
+            writer = csv.DictWriter(
+                output, fieldnames=fields or list(course.keys()), extrasaction="ignore"
+            )
+            writer.writeheader()
+        # nested values like courseformatoptions are JSON-encoded in their cell
+        writer.writerow(
+            {
+                k: json.dumps(v) if isinstance(v, (list, dict)) else v
+                for k, v in course.items()
+            }
+        )
+        count += 1
+    return count
+
+
 @click.command(help="Get the complete list of courses in Moodle.")
 @click.help_option("-h", "--help")
 @click.option(
@@ -61,6 +110,24 @@ def get_mdl_courses():
     is_flag=True,
     help="Output as formatted JSON",
 )
+@click.option(
+    "--format",
+    "-f",
+    "format",
+    type=click.Choice(["ndjson", "csv"]),
+    help="Stream courses as NDJSON or CSV with bounded memory",
+)
+@click.option(
+    "--fields",
+    help="Comma-separated course fields to output (e.g. id,shortname,category)",
+)
+@click.option(
+    "--output",
+    "-o",
+    default="-",
+    help="File to stream courses to (default: stdout)",
+    type=click.File("w"),
+)
 @click.option(
     "--token",
     "-t",
@@ -71,16 +138,30 @@ def get_mdl_courses():
     "-d",
     help="Moodle domain URL (overrides .env)",
 )
-def main(json_output, token, domain):
+@profile_options
+def main(json_output, format, fields, output, token, domain, profile, profile_json):
     """Get all courses from Moodle."""
     if token:
         config.token = token
     if domain:
         config.url = domain + "/webservice/rest/server.php"
 
-    result = get_mdl_courses()
-    if json_output and isinstance(result, list):
-        click.echo(json.dumps(result, indent=2))
+    with profiled(profile, profile_json):
+        if format:
+            field_list = [f.strip() for f in fields.split(",")] if fields else None
+            try:
+                count = write_courses(
+                    iter_mdl_courses(field_list), output, format, field_list
+                )
+            except MoodleError as e:
+                click.echo(f"Error: {e.message}", err=True)
+                exit(1)
+            click.echo(f"Found {count} total courses", err=True)
+            return
+
+        result = get_mdl_courses()
+        if json_output and isinstance(result, list):
+            click.echo(json.dumps(result, indent=2))
 
 
 if __name__ == "__main__":
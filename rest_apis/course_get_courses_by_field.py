@@ -1,15 +1,22 @@
 """Get Moodle course data from API."""
 
+import csv
 import json
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, Iterable
 
 import click
-import requests
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 import config
+from async_client import AsyncMoodleClient
+from cache import cache_options, use_cache
+from client import MoodleError, get_client
+from course_get_categories import CategoryTree
+from timing import profile_options, profiled
 
 # https://moodle.cca.edu/webservice/rest/server.php?wstoken=...&wsfunction=core_course_get_courses_by_field&moodlewsrestformat=json&field=shortname&value=EXCHG-3740-1-2019FA
 
@@ -38,36 +45,14 @@ def get_mdl_course(shortname):
 
         CERAM-1000-1-CERAM-2700-2-CERAM-3700-2-CRAFT-2700-3-2019FA
     """
-    url = config.url
-    params = {
-        # found at https://moodle.cca.edu/admin/settings.php?section=webservicetokens
-        "wstoken": config.token,
-        "wsfunction": "core_course_get_courses_by_field",
-        "moodlewsrestformat": "json",
-        # theoretically we can search using ID, a list of IDs, idnumber,
-        # or category but in reality shortname is only viable option
-        "field": "shortname",
-        "value": shortname,
-    }
-
-    response = requests.get(url, params=params)
-    data = response.json()
-    courses = data.get("courses")
-
-    if type(courses) is list:
-        if len(courses) > 0:
-            # theoretically this is always a single-entry array
-            return courses[0]
-        """
-        If no course matches the shortname, there's no "exception" in the response
-        and we receive a pair of empty arrays:
-        { courses: [ ], warnings: [ ] }
-
-        For now, we return empty string but Portal may want some specific
-        handling for this situation (which will definitely occur).
-        """
-        return ""
-    else:
+    try:
+        data = get_client(config.url, config.token).call(
+            "core_course_get_courses_by_field",
+            # theoretically we can search using ID, a list of IDs, idnumber,
+            # or category but in reality shortname is only viable option
+            {"field": "shortname", "value": shortname},
+        )
+    except MoodleError as e:
         """
         Moodle sends an HTTP 200 response back on errors with details in the JSON.
         Below are just a few examples I've run into.
@@ -86,13 +71,143 @@ def get_mdl_course(shortname):
         { exception: "webservice_access_exception", errorcode: "accessexception",
         message: "Access control exception" }
         """
-        return "Error: {}".format(data["message"])
-    return data
+        return "Error: {}".format(e.message)
+
+    courses = data.get("courses", [])
+    if len(courses) > 0:
+        # theoretically this is always a single-entry array
+        return courses[0]
+    """
+    If no course matches the shortname, there's no "exception" in the response
+    and we receive a pair of empty arrays:
+    { courses: [ ], warnings: [ ] }
+
+    For now, we return empty string but Portal may want some specific
+    handling for this situation (which will definitely occur).
+    """
+    return ""
+
+
+async def get_mdl_course_async(client: AsyncMoodleClient, shortname: str):
+    """get_mdl_course() on an async client, so many shortnames can be looked
+    up at once with asyncio.gather"""
+    try:
+        data = await client.call(
+            "core_course_get_courses_by_field",
+            {"field": "shortname", "value": shortname},
+        )
+    except MoodleError as e:
+        return "Error: {}".format(e.message)
+    courses = data.get("courses", [])
+    return courses[0] if courses else ""
+
+
+def get_category_courses(category: str | int) -> list[dict[str, Any]]:
+    """return the courses directly inside a category (not its children)"""
+    data = get_client(config.url, config.token).call(
+        "core_course_get_courses_by_field", {"field": "category", "value": category}
+    )
+    return data.get("courses", [])
+
+
+def term_category_ids(shortnames: Iterable[str]) -> list[int]:
+    """find the term categories, and all their children, for the terms at the
+    end of each shortname (e.g. 2019FA in EXCHG-3740-1-2019FA)"""
+    try:
+        # one request for every category rather than one per term
+        tree: CategoryTree = CategoryTree.fetch()
+    except MoodleError:
+        # these shortnames fall back to individual lookups
+        return []
+    ids: list[int] = []
+    for term in sorted({s.rsplit("-", 1)[-1] for s in shortnames}):
+        ids.extend(c["id"] for c in tree.find({"name": term}))
+    return ids
+
+
+def get_mdl_courses_by_shortname(
+    shortnames: Iterable[str],
+    categories: Iterable[str | int] | None = None,
+    concurrency: int = 8,
+) -> dict[str, Any]:
+    """resolve many shortnames to courses in as few requests as possible
+
+    Rather than one request per shortname, we fetch every course in the term
+    categories once (found from the shortnames' terms unless `categories` is
+    given) and index them by shortname. Only shortnames missing from that
+    index are looked up individually, `concurrency` at a time.
+
+    returns: dict of shortname to course dict, or "" for shortnames that don't
+    match a course (same as get_mdl_course), in the order given
+    """
+    # de-duplicate but preserve order
+    wanted: list[str] = list(dict.fromkeys(s.strip() for s in shortnames if s.strip()))
+    if categories is None:
+        categories = term_category_ids(wanted)
+
+    index: dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for courses in executor.map(get_category_courses, categories):
+            index.update((c["shortname"], c) for c in courses)
+
+        misses: list[str] = [s for s in wanted if s not in index]
+        for shortname, course in zip(misses, executor.map(get_mdl_course, misses)):
+            index[shortname] = course
+
+    return {s: index[s] for s in wanted}
+
+
+def write_mapping(mapping: dict[str, Any], output, format: str) -> None:
+    """write a shortname -> course ID mapping as CSV or JSON, unmatched
+    shortnames get an empty ID"""
+    ids: dict[str, Any] = {
+        s: c["id"] if isinstance(c, dict) else None for s, c in mapping.items()
+    }
+    if format == "json":
+        output.write(json.dumps(ids, indent=2) + "\n")
+        return
+    writer = csv.writer(output)
+    writer.writerow(["shortname", "id"])
+    writer.writerows((s, "" if id is None else id) for s, id in ids.items())
 
 
 @click.command(help="Get Moodle course data by shortname.")
 @click.help_option("-h", "--help")
-@click.argument("shortname")
+@click.argument("shortname", required=False)
+@click.option(
+    "--file",
+    "-f",
+    "shortnames_file",
+    help="Resolve every shortname in this file (one per line, - for stdin)",
+    type=click.File("r"),
+)
+@click.option(
+    "--category",
+    "-c",
+    multiple=True,
+    help="Category ID to index courses from in --file mode, repeatable (default: the shortnames' term categories)",
+)
+@click.option(
+    "--format",
+    "format",
+    default="csv",
+    type=click.Choice(["csv", "json"]),
+    help="Output format of the --file mode shortname to ID mapping (default: csv)",
+)
+@click.option(
+    "--output",
+    "-o",
+    default="-",
+    help="File to write the --file mode mapping to (default: stdout)",
+    type=click.File("w"),
+)
+@click.option(
+    "--concurrency",
+    "-n",
+    default=8,
+    help="Parallel requests in --file mode (default: 8)",
+    type=click.IntRange(min=1),
+)
 @click.option(
     "--json-output",
     is_flag=True,
@@ -108,18 +223,51 @@ def get_mdl_course(shortname):
     "-d",
     help="Moodle domain URL (overrides .env)",
 )
-def main(shortname, json_output, token, domain):
+@cache_options
+@profile_options
+def main(
+    shortname,
+    shortnames_file,
+    category,
+    format,
+    output,
+    concurrency,
+    json_output,
+    token,
+    domain,
+    cache_dir,
+    no_cache,
+    refresh,
+    profile,
+    profile_json,
+):
     """Get course data for a CCA section code like ANIMA-1000-1-2021SP."""
     if token:
         config.token = token
     if domain:
         config.url = domain + "/webservice/rest/server.php"
+    use_cache(
+        get_client(config.url, config.token),
+        cache_dir or config.conf.get("CACHE_DIR"),
+        no_cache,
+        refresh,
+    )
+
+    with profiled(profile, profile_json):
+        if shortnames_file:
+            mapping = get_mdl_courses_by_shortname(
+                shortnames_file, category or None, concurrency
+            )
+            write_mapping(mapping, output, format)
+            return
+        if not shortname:
+            raise click.UsageError("Provide a SHORTNAME or a --file of shortnames")
 
-    result = get_mdl_course(shortname)
-    if json_output:
-        click.echo(json.dumps(result, indent=2))
-    else:
-        click.echo(result)
+        result = get_mdl_course(shortname)
+        if json_output:
+            click.echo(json.dumps(result, indent=2))
+        else:
+            click.echo(result)
 
 
 if __name__ == "__main__":
@@ -1,44 +1,346 @@
 """Get users enrolled in a Moodle course."""
 
+import asyncio
 import json
 import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, AsyncIterator, Iterable, Iterator
 
 import click
-import requests
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 import config
+from async_client import AsyncMoodleClient
+from client import MoodleError, get_client
+from timing import profile_options, profiled
 
 # usage: python core_enrol_get_enrolled_users.py 3606
 # 3606 is Eric's staging test course
 # https://moodle.cca.edu/webservice/rest/server.php?wstoken=...&wsfunction=core_enrol_get_enrolled_users&moodlewsrestformat=json&courseid=...
 
 
-def get_enrolled_users(courseid: str):
-    """print enrolled users in a course"""
-    url: str = config.url
-    params: dict[str, str] = {
-        "courseid": courseid,
-        "moodlewsrestformat": "json",
-        "wsfunction": "core_enrol_get_enrolled_users",
-        # found at https://moodle.cca.edu/admin/settings.php?section=webservicetokens
-        "wstoken": config.token,
-    }
+def roster_options(
+    userfields: Iterable[str] | None = None,
+    onlyactive: bool = False,
+    limitfrom: int = 0,
+    limitnumber: int = 0,
+) -> list[dict[str, Any]]:
+    """core_enrol_get_enrolled_users options as a list of name/value dicts
 
-    response: requests.Response = requests.get(url, params=params)
-    # weirdly this gives not only all the profile and preferences for each user
-    # but also all their enrollments in _other_ courses
-    data = response.json()
+    Args:
+        userfields (Iterable[str]|None): only return these user fields (id is
+            always returned), e.g. ["username", "groups"]
+        onlyactive (bool): leave out suspended users and inactive enrollments
+        limitfrom (int): index of the first user to return
+        limitnumber (int): max users to return, 0 for all
+    """
+    options: list[dict[str, Any]] = []
+    if userfields:
+        options.append({"name": "userfields", "value": ",".join(userfields)})
+    if onlyactive:
+        options.append({"name": "onlyactive", "value": 1})
+    if limitnumber:
+        options.append({"name": "limitfrom", "value": limitfrom})
+        options.append({"name": "limitnumber", "value": limitnumber})
+    return options
 
-    # pretty print full data
-    return data
 
+def roster_params(
+    courseid: str,
+    userfields: Iterable[str] | None = None,
+    onlyactive: bool = False,
+    limitfrom: int = 0,
+    limitnumber: int = 0,
+) -> dict[str, Any]:
+    """core_enrol_get_enrolled_users params for a page of a course's roster,
+    see roster_options()"""
+    params: dict[str, Any] = {"courseid": courseid}
+    options = roster_options(userfields, onlyactive, limitfrom, limitnumber)
+    if options:
+        params["options"] = options
+    return params
 
-@click.command(help="Get users enrolled in a Moodle course.")
+
+def get_roster_page(
+    courseid: str,
+    userfields: Iterable[str] | None = None,
+    onlyactive: bool = False,
+    limitfrom: int = 0,
+    limitnumber: int = 0,
+) -> list[dict[str, Any]]:
+    return get_client(config.url, config.token).call(
+        "core_enrol_get_enrolled_users",
+        roster_params(courseid, userfields, onlyactive, limitfrom, limitnumber),
+    )
+
+
+async def get_roster_page_async(
+    client: AsyncMoodleClient,
+    courseid: str,
+    userfields: Iterable[str] | None = None,
+    onlyactive: bool = False,
+    limitfrom: int = 0,
+    limitnumber: int = 0,
+) -> list[dict[str, Any]]:
+    return await client.call(
+        "core_enrol_get_enrolled_users",
+        roster_params(courseid, userfields, onlyactive, limitfrom, limitnumber),
+    )
+
+
+def get_enrolled_users(
+    courseid: str,
+    userfields: Iterable[str] | None = None,
+    onlyactive: bool = False,
+    page_size: int = 0,
+    concurrency: int = 1,
+) -> list[dict[str, Any]]:
+    """list the users enrolled in a course
+
+    Without userfields, this gives not only all the profile and preferences
+    for each user but also all their enrollments in _other_ courses, so ask for
+    only the fields you need from large courses.
+
+    Args:
+        courseid (str): numeric course ID
+        userfields (Iterable[str]|None): user fields to return (default: all)
+        onlyactive (bool): only active enrollments
+        page_size (int): users per request, 0 for one request (default: 0)
+        concurrency (int): pages to fetch at once (default: 1)
+
+    Raises:
+        MoodleError: e.g. the course doesn't exist
+
+    Returns:
+        list[dict]: users in the order Moodle returns them
+    """
+    if not page_size:
+        return get_roster_page(courseid, userfields, onlyactive)
+
+    # we don't know how many pages there are so keep `concurrency` requests in
+    # flight and stop at the first short page
+    users: list[dict[str, Any]] = []
+    fields: list[str] | None = list(userfields) if userfields else None
+    concurrency = max(1, concurrency)
+    pending: deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        limitfrom: int = 0
+        while True:
+            while len(pending) < concurrency:
+                pending.append(
+                    executor.submit(
+                        get_roster_page,
+                        courseid,
+                        fields,
+                        onlyactive,
+                        limitfrom,
+                        page_size,
+                    )
+                )
+                limitfrom += page_size
+            page: list[dict[str, Any]] = pending.popleft().result()
+            users.extend(page)
+            if len(page) < page_size:
+                for future in pending:
+                    future.cancel()
+                return users
+
+
+async def get_enrolled_users_async(
+    client: AsyncMoodleClient,
+    courseid: str,
+    userfields: Iterable[str] | None = None,
+    onlyactive: bool = False,
+    page_size: int = 0,
+    concurrency: int = 1,
+) -> list[dict[str, Any]]:
+    """get_enrolled_users() on an async client, pages are requested
+    `concurrency` at a time until one comes back short"""
+    if not page_size:
+        return await get_roster_page_async(client, courseid, userfields, onlyactive)
+
+    users: list[dict[str, Any]] = []
+    fields: list[str] | None = list(userfields) if userfields else None
+    concurrency = max(1, concurrency)
+    limitfrom: int = 0
+    while True:
+        pages: list[list[dict[str, Any]]] = await asyncio.gather(
+            *(
+                get_roster_page_async(
+                    client,
+                    courseid,
+                    fields,
+                    onlyactive,
+                    limitfrom + n * page_size,
+                    page_size,
+                )
+                for n in range(concurrency)
+            )
+        )
+        limitfrom += concurrency * page_size
+        for page in pages:
+            users.extend(page)
+            if len(page) < page_size:
+                return users
+
+
+def project(user: dict[str, Any], fields: list[str] | None) -> dict[str, Any]:
+    """reduce a user to id and the requested fields, group and enrolled
+    course objects become lists of their names"""
+    record: dict[str, Any] = {"id": user.get("id")}
+    for field in fields or user.keys():
+        value: Any = user.get(field)
+        if field in ("groups", "roles", "enrolledcourses") and value:
+            value = [v.get("shortname") or v.get("name") for v in value]
+        record[field] = value
+    return record
+
+
+def iter_course_users(
+    courseids: Iterable[str],
+    userfields: list[str] | None = None,
+    onlyactive: bool = False,
+    page_size: int = 0,
+    concurrency: int = 4,
+) -> Iterator[dict[str, Any]]:
+    """stream compact user records from several courses, fetching `concurrency`
+    rosters at a time and yielding them in the order of `courseids`
+
+    Yields:
+        dict: {"courseid", "id", *userfields} for each enrolled user
+    """
+    concurrency = max(1, concurrency)
+    pending: deque[tuple[str, Future]] = deque()
+
+    def finish() -> Iterator[dict[str, Any]]:
+        courseid, future = pending.popleft()
+        for user in future.result():
+            yield {"courseid": courseid, **project(user, userfields)}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for courseid in courseids:
+            pending.append(
+                (
+                    courseid,
+                    executor.submit(
+                        get_enrolled_users, courseid, userfields, onlyactive, page_size
+                    ),
+                )
+            )
+            if len(pending) >= concurrency:
+                yield from finish()
+        while pending:
+            yield from finish()
+
+
+async def iter_course_users_async(
+    client: AsyncMoodleClient,
+    courseids: Iterable[str],
+    userfields: list[str] | None = None,
+    onlyactive: bool = False,
+    page_size: int = 0,
+    concurrency: int = 4,
+) -> AsyncIterator[dict[str, Any]]:
+    """iter_course_users() on an async client, with `concurrency` rosters
+    requested at a time as tasks instead of threads"""
+    concurrency = max(1, concurrency)
+    pending: deque[tuple[str, asyncio.Task]] = deque()
+    try:
+        for courseid in courseids:
+            pending.append(
+                (
+                    courseid,
+                    asyncio.ensure_future(
+                        get_enrolled_users_async(
+                            client, courseid, userfields, onlyactive, page_size
+                        )
+                    ),
+                )
+            )
+            if len(pending) < concurrency:
+                continue
+            courseid, task = pending.popleft()
+            for user in await task:
+                yield {"courseid": courseid, **project(user, userfields)}
+        while pending:
+            courseid, task = pending.popleft()
+            for user in await task:
+                yield {"courseid": courseid, **project(user, userfields)}
+    finally:
+        for _, task in pending:
+            task.cancel()
+
+
+async def echo_users_async(
+    courseids: list[str],
+    userfields: list[str] | None,
+    onlyactive: bool,
+    page_size: int,
+    concurrency: int,
+    format: str,
+) -> None:
+    """main() with an async client, `concurrency` is also its connection limit"""
+    async with AsyncMoodleClient(
+        config.url, config.token, max_connections=concurrency
+    ) as client:
+        if format == "json" and len(courseids) == 1:
+            result = await get_enrolled_users_async(
+                client, courseids[0], userfields, onlyactive, page_size, concurrency
+            )
+            click.echo(json.dumps(result, indent=4, sort_keys=True))
+            return
+        records = iter_course_users_async(
+            client, courseids, userfields, onlyactive, page_size, concurrency
+        )
+        if format == "json":
+            result = [record async for record in records]
+            click.echo(json.dumps(result, indent=4, sort_keys=True))
+            return
+        async for record in records:
+            click.echo(json.dumps(record, separators=(",", ":")))
+
+
+@click.command(help="Get users enrolled in Moodle courses.")
 @click.help_option("-h", "--help")
-@click.argument("courseid")
+@click.argument("courseids", nargs=-1, required=True)
+@click.option(
+    "--fields",
+    help="Comma-separated user fields to fetch (e.g. username,email,groups)",
+)
+@click.option(
+    "--only-active",
+    is_flag=True,
+    help="Leave out suspended users and inactive enrollments",
+)
+@click.option(
+    "--page-size",
+    default=0,
+    help="Users per request, 0 to fetch each roster at once (default: 0)",
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "--concurrency",
+    "-n",
+    default=4,
+    help="Number of courses (or pages of one course) to fetch at once (default: 4)",
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--format",
+    "format",
+    type=click.Choice(["json", "ndjson"]),
+    help="Pretty JSON list or one compact record per line (default: json for "
+    "one course, ndjson for several)",
+)
+@click.option(
+    "--async",
+    "use_async",
+    is_flag=True,
+    help="Make requests from an asyncio event loop instead of threads",
+)
 @click.option(
     "--token",
     "-t",
@@ -49,15 +351,60 @@ def get_enrolled_users(courseid: str):
     "-d",
     help="Moodle domain URL (overrides .env)",
 )
-def main(courseid, token, domain):
-    """Get enrolled users for a course by its numeric ID."""
+@profile_options
+def main(
+    courseids,
+    fields,
+    only_active,
+    page_size,
+    concurrency,
+    format,
+    use_async,
+    token,
+    domain,
+    profile,
+    profile_json,
+):
+    """Get enrolled users for courses by their numeric IDs."""
     if token:
         config.token = token
     if domain:
         config.url = domain + "/webservice/rest/server.php"
+    userfields = [f.strip() for f in fields.split(",")] if fields else None
+    format = format or ("json" if len(courseids) == 1 else "ndjson")
 
-    result = get_enrolled_users(courseid)
-    click.echo(json.dumps(result, indent=4, sort_keys=True))
+    with profiled(profile, profile_json):
+        try:
+            if use_async:
+                asyncio.run(
+                    echo_users_async(
+                        courseids,
+                        userfields,
+                        only_active,
+                        page_size,
+                        concurrency,
+                        format,
+                    )
+                )
+                return
+            if format == "json" and len(courseids) == 1:
+                result = get_enrolled_users(
+                    courseids[0], userfields, only_active, page_size, concurrency
+                )
+                # pretty print full data
+                click.echo(json.dumps(result, indent=4, sort_keys=True))
+                return
+            records = iter_course_users(
+                courseids, userfields, only_active, page_size, concurrency
+            )
+            if format == "json":
+                click.echo(json.dumps(list(records), indent=4, sort_keys=True))
+                return
+            for record in records:
+                click.echo(json.dumps(record, separators=(",", ":")))
+        except MoodleError as e:
+            click.echo(f"Error: {e.message}", err=True)
+            exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,293 @@
+import asyncio
+import gzip
+import json
+import ssl
+
+import pytest
+import requests
+
+import throttle
+from async_client import AsyncMoodleClient, ConnectionPool, ConnectTimeout, Response
+from client import MoodleError
+
+
+def fake_client(responses):
+    """client whose requests get the next of `responses`, (status, json) pairs"""
+    client = AsyncMoodleClient("https://moodle.example.edu", "abc")
+    queries = []
+
+    async def request(method, query, retry=True):
+        queries.append(query)
+        status, data = responses.pop(0)
+        return Response(status, {}, json.dumps(data).encode())
+
+    client.pool.request = request
+    return client, queries
+
+
+def test_async_call_retries(monkeypatch):
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(asyncio, "sleep", no_sleep)
+    busy = {"exception": "dml_read_exception", "errorcode": "dmlreadexception"}
+    client, queries = fake_client(
+        [(503, None), (429, None), (200, busy), (200, {"courses": []})]
+    )
+
+    async def call():
+        async with client:
+            return await client.call("core_course_get_courses_by_field", {"ids": [1]})
+
+    assert asyncio.run(call()) == {"courses": []}
+    assert queries[0]["ids[0]"] == 1
+    stats = client.stats()
+    assert stats["requests"] == 4
+    assert stats["server_errors"] == stats["throttled"] == stats["moodle_errors"] == 1
+    # each pushback halved the in-flight limit
+    assert stats["limit"] == 4
+    assert stats["in_flight"] == 0
+
+    client, _ = fake_client([(502, None)])
+    client.throttle.max_retries = 0
+    with pytest.raises(requests.HTTPError):
+        asyncio.run(client.call("core_course_get_courses"))
+
+
+def test_async_write_retries(monkeypatch):
+    """writes that aren't idempotent are only resent if they never connected"""
+
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(asyncio, "sleep", no_sleep)
+    client = AsyncMoodleClient("https://moodle.example.edu", "abc")
+    errors = [ConnectTimeout("timed out"), ConnectionResetError("reset")]
+
+    async def request(method, query, retry=True):
+        raise errors.pop(0)
+
+    client.pool.request = request
+    with pytest.raises(requests.ConnectionError, match="reset"):
+        asyncio.run(client.call("enrol_manual_enrol_users", {}, "POST", False))
+    assert not errors
+    assert client.stats()["connection_errors"] == 1
+
+
+def test_async_call_raises_moodle_error():
+    error = {"exception": "moodle_exception", "errorcode": "invalidtoken"}
+    client, _ = fake_client([(200, error)])
+    with pytest.raises(MoodleError) as e:
+        asyncio.run(client.call("core_course_get_courses"))
+    assert e.value.errorcode == "invalidtoken"
+
+
+def test_async_limiter():
+    limiter = throttle.AsyncAIMDLimiter(limit=2, max_limit=2)
+    order = []
+
+    async def request(n):
+        started = await limiter.acquire()
+        order.append(("start", n, limiter.in_flight))
+        await asyncio.sleep(0)
+        order.append(("end", n))
+        await limiter.release(started, congested=False)
+
+    async def main():
+        await asyncio.gather(*(request(n) for n in range(3)))
+
+    asyncio.run(main())
+    # the third request waits for a slot
+    assert order[:3] == [("start", 0, 1), ("start", 1, 2), ("end", 0)]
+    assert max(entry[2] for entry in order if entry[0] == "start") == 2
+
+
+def test_async_client_copies_throttle():
+    """the caller's throttle, which threads may be using, keeps its limiter"""
+    limits = throttle.Throttle(rate=0, max_limit=4, max_retries=1)
+    limiter = limits.limiter
+    client = AsyncMoodleClient("https://moodle.example.edu", "abc", throttle=limits)
+    assert limits.limiter is limiter
+    assert not isinstance(limiter, throttle.AsyncAIMDLimiter)
+    assert isinstance(client.throttle.limiter, throttle.AsyncAIMDLimiter)
+    assert client.throttle.limiter.max_limit == 4
+    assert client.throttle.max_retries == 1
+    assert client.throttle.bucket.rate == 0
+
+
+def test_connection_pool():
+    """chunked gzip responses, and a keep-alive connection the server closed"""
+    connections, request_lines = [], []
+
+    async def serve(reader, writer):
+        connections.append(writer)
+        head = await reader.readuntil(b"\r\n\r\n")
+        request_lines.append(head.split(b"\r\n")[0])
+        body = gzip.compress(json.dumps({"n": len(request_lines)}).encode())
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+            + b"".join(b"%x\r\n%s\r\n" % (len(c), c) for c in (body[:5], body[5:]))
+            + b"0\r\n\r\n"
+        )
+        await writer.drain()
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = ConnectionPool(f"http://127.0.0.1:{port}/webservice/rest/server.php")
+        first = await pool.request("GET", {"courseids[0]": 1})
+        second = await pool.request("GET", {"courseids[0]": 2})
+        await pool.close()
+        server.close()
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first.json() == {"n": 1} and second.json() == {"n": 2}
+    assert request_lines[0] == (
+        b"GET /webservice/rest/server.php?courseids%5B0%5D=1 HTTP/1.1"
+    )
+    assert len(connections) == 2
+
+
+def test_connection_pool_writes():
+    """a POST on a kept-alive connection the server closed is only resent if
+    it's safe to retry, the server may have acted on it"""
+    request_lines = []
+
+    async def serve(reader, writer):
+        # answer the first request, then close without answering the second
+        for _ in range(2):
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            request_lines.append(head.split(b"\r\n")[0])
+            if len(request_lines) % 2 == 0:
+                await reader.read(100)
+                break
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 4\r\n\r\n"ok"')
+            await writer.drain()
+        writer.close()
+
+    async def main(retry):
+        request_lines.clear()
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = ConnectionPool(f"http://127.0.0.1:{port}/")
+        try:
+            await pool.request("POST", {"n": 1}, retry)
+            return await pool.request("POST", {"n": 2}, retry)
+        finally:
+            await pool.close()
+            server.close()
+
+    with pytest.raises(EOFError):
+        asyncio.run(main(retry=False))
+    assert len(request_lines) == 2
+    assert asyncio.run(main(retry=True)).json() == "ok"
+    assert len(request_lines) == 3
+
+
+def serve(responses):
+    """run requests against a server that answers each connection's requests
+    with the next of `responses`, raw bytes, returns the responses or errors
+    and how many connections were opened"""
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        while responses:
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            writer.write(responses.pop(0))
+            await writer.drain()
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = ConnectionPool(f"http://127.0.0.1:{port}/webservice/rest/server.php")
+        results = []
+        for _ in range(len(responses)):
+            try:
+                results.append(await pool.request("GET", {}))
+            except EOFError as e:
+                results.append(e)
+        idle = len(pool.idle)
+        await pool.close()
+        for writer in connections:
+            writer.close()
+        server.close()
+        return results, idle
+
+    results, idle = asyncio.run(main())
+    return results, len(connections), idle
+
+
+def test_connection_pool_close():
+    """responses that close the connection, with or without a length"""
+    results, connections, idle = serve(
+        [
+            b'HTTP/1.1 200 OK\r\nContent-Length: 4\r\nConnection: close\r\n\r\n"ok"',
+            b'HTTP/1.1 200 OK\r\nContent-Length: 4\r\n\r\n"ok"',
+            b'HTTP/1.1 200 OK\r\nContent-Length: 4\r\n\r\n"ok"',
+        ]
+    )
+    assert [r.json() for r in results] == ["ok"] * 3
+    # the second connection was kept alive for the third request
+    assert connections == 2 and idle == 1
+
+    # HTTP/1.0 without a length, the body is the rest of the connection
+    async def until_close(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b'HTTP/1.0 200 OK\r\n\r\n{"n": 1}')
+        await writer.drain()
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(until_close, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        pool = ConnectionPool(f"http://127.0.0.1:{port}/")
+        response = await pool.request("POST", {"n": 1})
+        idle = len(pool.idle)
+        server.close()
+        return response, idle
+
+    response, idle = asyncio.run(main())
+    assert response.json() == {"n": 1} and idle == 0
+
+
+def test_connection_pool_malformed():
+    """garbage where a chunk size or status line belongs is a dropped
+    connection, like a body cut short"""
+    results, _, _ = serve(
+        [
+            b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n",
+            b"ICY 200 OK\r\n\r\n",
+        ]
+    )
+    assert [type(r) for r in results] == [EOFError, EOFError]
+    assert "chunk size" in str(results[0])
+
+
+def test_redirects_raise():
+    response = Response(301, {"location": "https://moodle.example.edu/"}, b"")
+    with pytest.raises(requests.HTTPError, match="redirects aren't followed"):
+        response.raise_for_status()
+
+
+def test_connection_pool_ca_bundle(monkeypatch):
+    cafiles = []
+    monkeypatch.setattr(
+        ssl, "create_default_context", lambda cafile=None: cafiles.append(cafile)
+    )
+    monkeypatch.delenv("REQUESTS_CA_BUNDLE", raising=False)
+    monkeypatch.delenv("CURL_CA_BUNDLE", raising=False)
+    ConnectionPool("https://moodle.example.edu/webservice/rest/server.php")
+    monkeypatch.setenv("REQUESTS_CA_BUNDLE", "/etc/ssl/campus.pem")
+    ConnectionPool("https://moodle.example.edu/webservice/rest/server.php")
+    ConnectionPool("http://localhost/webservice/rest/server.php")
+    assert cafiles == [None, "/etc/ssl/campus.pem"]
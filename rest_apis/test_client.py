@@ -0,0 +1,223 @@
+import json
+import os
+
+import pytest
+import requests
+
+import throttle
+from cache import ResponseCache
+from client import (
+    MoodleClient,
+    MoodleError,
+    get_client,
+    iter_json_array,
+    php_params,
+)
+
+
+def test_php_params():
+    assert php_params(
+        {
+            "courseids": [1, 2],
+            "criteria": [{"key": "name", "value": "2019SP"}],
+            "field": "id",
+        }
+    ) == {
+        "courseids[0]": 1,
+        "courseids[1]": 2,
+        "criteria[0][key]": "name",
+        "criteria[0][value]": "2019SP",
+        "field": "id",
+    }
+
+
+def test_client_params():
+    client = MoodleClient("https://moodle.example.edu", "abc")
+    assert client.params("core_course_get_courses", None) == {
+        "wstoken": "abc",
+        "wsfunction": "core_course_get_courses",
+        "moodlewsrestformat": "json",
+    }
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.content = json.dumps(data).encode()
+        self.status_code = status_code
+        self.headers = {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+    def close(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+def test_call_raises_moodle_error(monkeypatch):
+    client = MoodleClient("https://moodle.example.edu", "abc")
+    error = {
+        "exception": "webservice_access_exception",
+        "errorcode": "accessexception",
+        "message": "Access control exception",
+    }
+    monkeypatch.setattr(
+        client.session, "get", lambda *args, **kwargs: FakeResponse(error)
+    )
+    with pytest.raises(MoodleError) as e:
+        client.call("core_course_get_courses")
+    assert e.value.errorcode == "accessexception"
+    assert e.value.message == "Access control exception"
+
+
+def test_call_retries(monkeypatch):
+    monkeypatch.setattr(throttle.time, "sleep", lambda seconds: None)
+    client = MoodleClient("https://moodle.example.edu", "abc")
+    busy = {"exception": "dml_read_exception", "errorcode": "dmlreadexception"}
+    responses = [
+        FakeResponse(None, 503),
+        FakeResponse(None, 429),
+        FakeResponse(busy),
+        FakeResponse({"courses": []}),
+    ]
+    monkeypatch.setattr(client.session, "get", lambda *args, **kwargs: responses.pop(0))
+    assert client.call("core_course_get_courses") == {"courses": []}
+    stats = client.throttle.stats()
+    assert stats["requests"] == 4
+    assert stats["retries"] == 3
+    assert stats["server_errors"] == stats["throttled"] == stats["moodle_errors"] == 1
+    # each pushback halved the in-flight limit
+    assert stats["limit"] == 4
+
+    client.throttle.max_retries = 1
+    responses = [FakeResponse(None, 502), FakeResponse(None, 502)]
+    with pytest.raises(requests.HTTPError):
+        client.call("core_course_get_courses")
+    assert client.throttle.stats()["gave_up"] == 1
+
+
+def test_call_without_retry(monkeypatch):
+    monkeypatch.setattr(throttle.time, "sleep", lambda seconds: None)
+    client = MoodleClient("https://moodle.example.edu", "abc")
+    responses = [FakeResponse(None, 429), FakeResponse(None, 503)]
+    monkeypatch.setattr(
+        client.session, "post", lambda *args, **kwargs: responses.pop(0)
+    )
+    # a 503 may have come after Moodle created the groups, so it isn't resent
+    with pytest.raises(requests.HTTPError):
+        client.call("core_group_create_groups", {"groups": []}, "POST", retry=False)
+    assert client.throttle.stats()["retries"] == 1
+
+    def timeout(*args, **kwargs):
+        raise requests.ReadTimeout("read timed out")
+
+    monkeypatch.setattr(client.session, "post", timeout)
+    with pytest.raises(requests.ReadTimeout):
+        client.call("core_group_create_groups", {"groups": []}, "POST", retry=False)
+    assert client.throttle.stats()["retries"] == 1
+
+
+def test_send_releases_slot_on_any_error(monkeypatch):
+    client = MoodleClient("https://moodle.example.edu", "abc")
+
+    def invalid(*args, **kwargs):
+        raise requests.exceptions.InvalidURL("no host")
+
+    monkeypatch.setattr(client.session, "get", invalid)
+    for _ in range(client.throttle.limiter.max_limit + 1):
+        with pytest.raises(requests.exceptions.InvalidURL):
+            client.call("core_course_get_courses")
+    assert client.throttle.limiter.in_flight == 0
+    # errors that aren't Moodle pushing back don't shrink the limit
+    assert client.throttle.stats()["limit"] == client.throttle.limiter.max_limit
+
+
+def test_aimd_limiter():
+    limiter = throttle.AIMDLimiter(limit=8, max_limit=8)
+    first, second = limiter.acquire(), limiter.acquire()
+    limiter.release(first, congested=True)
+    # already halved for requests sent before that decrease
+    limiter.release(second, congested=True)
+    assert limiter.limit == 4
+    for _ in range(4):
+        limiter.release(limiter.acquire(), congested=False)
+    assert 4.9 < limiter.limit < 5
+
+
+def test_token_bucket(monkeypatch):
+    waits = []
+    monkeypatch.setattr(throttle.time, "sleep", waits.append)
+    bucket = throttle.TokenBucket(rate=10, burst=2)
+    assert [bucket.acquire() for _ in range(4)] == [0, 0, waits[0], waits[1]]
+    assert 0.09 < waits[0] < 0.1 and 0.19 < waits[1] < 0.2
+
+
+def test_get_client_is_shared():
+    assert get_client("https://a.edu", "x") is get_client("https://a.edu", "x")
+    assert get_client("https://a.edu", "x") is not get_client("https://b.edu", "x")
+
+
+def test_cache_hit_skips_network(monkeypatch, tmp_path):
+    client = MoodleClient(
+        "https://moodle.example.edu", "abc", cache=ResponseCache(tmp_path)
+    )
+    calls = []
+
+    def fake_get(*args, **kwargs):
+        calls.append(kwargs["params"])
+        return FakeResponse({"courses": []})
+
+    monkeypatch.setattr(client.session, "get", fake_get)
+    for _ in range(3):
+        assert client.call("core_course_get_courses") == {"courses": []}
+    assert len(calls) == 1
+    # a different token shares the same cache entry
+    client.token = "xyz"
+    client.call("core_course_get_courses")
+    assert len(calls) == 1
+    client.refresh = True
+    client.call("core_course_get_courses")
+    assert len(calls) == 2
+
+
+def test_cache_ttl_and_eviction(tmp_path):
+    cache = ResponseCache(tmp_path, ttls={"fresh": 60, "stale": -1}, max_bytes=200)
+    cache.set("a", "x" * 50)
+    assert cache.get("a", "stale") == (False, None)
+    cache.set("a", "x" * 50)
+    cache.set("b", "y" * 50)
+    os.utime(cache.path("a"), (0, 0))
+    assert cache.get("b", "fresh") == (True, "y" * 50)
+    # adding c pushes us over the cap, a is least recently used
+    cache.set("c", "z" * 50)
+    assert cache.get("a", "fresh") == (False, None)
+    assert cache.get("b", "fresh")[0]
+    assert cache.get("c", "fresh")[0]
+
+
+def chunked(text: str, size: int):
+    data = text.encode()
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_iter_json_array(size):
+    items = [
+        {"id": 1, "shortname": "ANIMA-1000-1-2021SP", "summary": "<p>café [x]</p>"},
+        {"id": 22, "shortname": "", "summary": '{"}'},
+        123,
+        [1, 2],
+    ]
+    text = " [\n" + ",\n ".join(json.dumps(i, ensure_ascii=False) for i in items) + "]"
+    assert list(iter_json_array(chunked(text, size))) == items
+    assert list(iter_json_array(chunked("[]", size))) == []
+
+
+def test_iter_json_array_exception():
+    error = {"exception": "moodle_exception", "errorcode": "x", "message": "nope"}
+    with pytest.raises(MoodleError):
+        list(iter_json_array(chunked(json.dumps(error), 4)))
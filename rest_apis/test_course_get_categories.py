@@ -0,0 +1,35 @@
+from course_get_categories import CategoryTree
+
+categories = [
+    {"id": 1, "name": "2021SP", "parent": 0, "path": "/1"},
+    {"id": 2, "name": "ANIMA", "parent": 1, "path": "/1/2"},
+    {"id": 3, "name": "2021FA", "parent": 0, "path": "/3"},
+    {"id": 4, "name": "Studio", "parent": 2, "path": "/1/2/4"},
+    {"id": 5, "name": "ANIMA", "parent": 3, "path": "/3/5"},
+]
+
+
+def test_category_tree():
+    tree = CategoryTree(categories)
+    assert [c["id"] for c in tree.named("ANIMA")] == [2, 5]
+    assert [c["id"] for c in tree.subtree(1)] == [1, 2, 4]
+    assert tree.subtree(99) == []
+    assert [c["id"] for c in tree.ancestors(4)] == [1, 2]
+    assert [c["id"] for c in tree.find({"name": "2021SP"})] == [1, 2, 4]
+    assert [c["id"] for c in tree.find({"name": "ANIMA", "parent": 3})] == [5]
+
+
+def test_category_tree_persistence(tmp_path, monkeypatch):
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return CategoryTree(categories)
+
+    monkeypatch.setattr(CategoryTree, "fetch", fetch)
+    path = tmp_path / "categories.json"
+    CategoryTree.load(path)
+    assert [c["id"] for c in CategoryTree.load(path).subtree(3)] == [3, 5]
+    assert len(fetches) == 1
+    CategoryTree.load(path, refresh=True)
+    assert len(fetches) == 2
@@ -0,0 +1,35 @@
+import course_get_courses_by_field as cgcbf
+
+
+def test_get_mdl_courses_by_shortname(monkeypatch):
+    lookups = []
+
+    def fake_get_mdl_course(shortname):
+        lookups.append(shortname)
+        return (
+            {"id": 99, "shortname": shortname} if shortname.startswith("LATE") else ""
+        )
+
+    monkeypatch.setattr(cgcbf, "term_category_ids", lambda shortnames: [1, 2])
+    monkeypatch.setattr(
+        cgcbf,
+        "get_category_courses",
+        lambda category: [{"id": category, "shortname": f"ANIMA-100{category}-2021SP"}],
+    )
+    monkeypatch.setattr(cgcbf, "get_mdl_course", fake_get_mdl_course)
+
+    mapping = cgcbf.get_mdl_courses_by_shortname(
+        ["ANIMA-1002-2021SP", "LATE-1-2021SP", "ANIMA-1001-2021SP", "NOPE-2021SP"]
+        + ["ANIMA-1002-2021SP"]
+    )
+    # only shortnames missing from the category index are looked up
+    assert lookups == ["LATE-1-2021SP", "NOPE-2021SP"]
+    assert list(mapping) == [
+        "ANIMA-1002-2021SP",
+        "LATE-1-2021SP",
+        "ANIMA-1001-2021SP",
+        "NOPE-2021SP",
+    ]
+    assert mapping["ANIMA-1002-2021SP"]["id"] == 2
+    assert mapping["LATE-1-2021SP"]["id"] == 99
+    assert mapping["NOPE-2021SP"] == ""
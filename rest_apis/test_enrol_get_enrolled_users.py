@@ -0,0 +1,54 @@
+import enrol_get_enrolled_users as egeu
+
+
+def fake_roster(courseids, size):
+    calls = []
+
+    def get_roster_page(
+        courseid, userfields=None, onlyactive=False, limitfrom=0, limitnumber=0
+    ):
+        calls.append((courseid, limitfrom, limitnumber))
+        users = [
+            {
+                "id": int(courseid) * 1000 + i,
+                "username": f"u{i}",
+                "email": f"u{i}@cca.edu",
+                "groups": [{"id": 1, "name": "Fall 2025"}],
+            }
+            for i in range(size[courseid])
+        ]
+        return users[limitfrom : limitfrom + limitnumber] if limitnumber else users
+
+    return calls, get_roster_page
+
+
+def test_roster_options():
+    assert egeu.roster_options() == []
+    assert egeu.roster_options(["username", "groups"], True, 20, 10) == [
+        {"name": "userfields", "value": "username,groups"},
+        {"name": "onlyactive", "value": 1},
+        {"name": "limitfrom", "value": 20},
+        {"name": "limitnumber", "value": 10},
+    ]
+
+
+def test_paging(monkeypatch):
+    calls, page = fake_roster(["1"], {"1": 25})
+    monkeypatch.setattr(egeu, "get_roster_page", page)
+    users = egeu.get_enrolled_users("1", page_size=10, concurrency=2)
+    assert [u["id"] for u in users] == list(range(1000, 1025))
+    # the page after the short one may already have been requested
+    assert sorted(calls)[:3] == [("1", 0, 10), ("1", 10, 10), ("1", 20, 10)]
+
+
+def test_iter_course_users(monkeypatch):
+    calls, page = fake_roster(["1", "2", "3"], {"1": 2, "2": 0, "3": 1})
+    monkeypatch.setattr(egeu, "get_roster_page", page)
+    records = list(egeu.iter_course_users(["1", "2", "3"], ["username", "groups"]))
+    assert records == [
+        {"courseid": "1", "id": 1000, "username": "u0", "groups": ["Fall 2025"]},
+        {"courseid": "1", "id": 1001, "username": "u1", "groups": ["Fall 2025"]},
+        {"courseid": "3", "id": 3000, "username": "u0", "groups": ["Fall 2025"]},
+    ]
+    # one unpaged request per course, the empty course included
+    assert sorted(calls) == [("1", 0, 0), ("2", 0, 0), ("3", 0, 0)]
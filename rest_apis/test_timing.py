@@ -0,0 +1,41 @@
+import json
+
+from timing import Timings, percentile, profiled, timings
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) == 0
+    assert percentile([3.0], 99) == 3
+
+
+def test_summary():
+    t = Timings()
+    for ms in range(1, 21):
+        t.request("core_course_get_courses", ms / 1000, 100)
+    t.decoded("core_course_get_courses", 0.5)
+    with t.timer("write_csv"):
+        pass
+    with t.timer("write_csv"):
+        pass
+    summary = t.summary()
+    courses = summary["requests"]["core_course_get_courses"]
+    assert courses["count"] == 20
+    assert courses["bytes"] == 2000
+    assert courses["p50"] == 0.01
+    assert courses["p95"] == 0.019
+    assert courses["decode"] == 0.5
+    assert summary["timers"]["write_csv"]["count"] == 2
+    assert "core_course_get_courses" in t.report()
+
+
+def test_profiled_dumps_json(tmp_path, capsys):
+    timings.reset()
+    with profiled(False, tmp_path / "profile.json"):
+        timings.request("core_enrol_get_enrolled_users", 0.1, 10)
+    saved = json.loads((tmp_path / "profile.json").read_text())
+    assert saved["requests"]["core_enrol_get_enrolled_users"]["count"] == 1
+    assert "core_enrol_get_enrolled_users" in capsys.readouterr().err
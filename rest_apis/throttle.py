@@ -0,0 +1,318 @@
+"""Keep our web service calls from overloading Moodle.
+
+Every request made by a MoodleClient passes through its Throttle, which
+
+- spaces requests out with a token bucket (a steady rate plus short bursts)
+- caps requests in flight with an AIMD limit: it grows by one request per
+  window of successes and halves when Moodle slows down or pushes back
+- retries 5xx and 429 responses, dropped connections, and Moodle's transient
+  HTTP 200 exception payloads with jittered exponential backoff
+
+Its counters are exposed with Throttle.stats() for tuning the defaults below.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any
+
+# requests per second, and how many can be sent at once after being idle
+RATE: float = 20.0
+BURST: int = 16
+# bounds of the in-flight request limit
+MIN_LIMIT: int = 1
+MAX_LIMIT: int = 16
+# a request is congested if it's this many times slower than the fastest
+# response we've seen from its wsfunction, and slower than SLOW seconds
+LATENCY_FACTOR: float = 4.0
+SLOW: float = 1.0
+MAX_RETRIES: int = 5
+# seconds, backoff delays are drawn from [0, min(CAP, BASE * 2**attempt)]
+BACKOFF_BASE: float = 0.5
+BACKOFF_CAP: float = 30.0
+# Moodle exceptions that are worth retrying: database hiccups and maintenance
+TRANSIENT_ERRORS: set[str] = {
+    "dbconnectionfailed",
+    "dmlreadexception",
+    "dmlwriteexception",
+    "dmltransactionexception",
+    "sitemaintenance",
+}
+
+
+def is_transient(data: dict[str, Any]) -> bool:
+    """is this Moodle exception payload likely to succeed if we try again?"""
+    return data.get("errorcode") in TRANSIENT_ERRORS
+
+
+def backoff(
+    attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP
+) -> float:
+    """seconds to wait before retry number `attempt` (0-based), "full jitter"
+    so that threads which failed together don't retry together"""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class TokenBucket:
+    """block callers so that no more than `rate` requests per second start,
+    after allowing an initial burst of `burst` requests
+
+    Args:
+        rate (float): tokens added per second, 0 for no limit
+        burst (int): most tokens the bucket holds
+    """
+
+    def __init__(self, rate: float = RATE, burst: int = BURST):
+        self.rate: float = rate
+        self.burst: int = max(1, burst)
+        self.tokens: float = self.burst
+        self.updated: float = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """take a token, sleeping until one is available
+
+        Returns:
+            float: seconds spent waiting
+        """
+        wait: float = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def reserve(self) -> float:
+        """take a token without waiting for it, for callers that sleep on
+        their own (e.g. with asyncio.sleep)
+
+        Returns:
+            float: seconds to wait before using the token
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now: float = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # take the token now, going into debt, so waiters queue up in order
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class AIMDLimiter:
+    """additive increase, multiplicative decrease limit on requests in flight
+
+    Args:
+        limit (int): starting limit
+        min_limit (int): the limit never drops below this
+        max_limit (int): the limit never grows past this
+    """
+
+    def __init__(
+        self,
+        limit: int = MAX_LIMIT,
+        min_limit: int = MIN_LIMIT,
+        max_limit: int = MAX_LIMIT,
+    ):
+        self.min_limit: int = max(1, min_limit)
+        self.max_limit: int = max(self.min_limit, max_limit)
+        self.limit: float = min(max(limit, self.min_limit), self.max_limit)
+        self.in_flight: int = 0
+        self.decreased: float = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> float:
+        """wait for a free slot under the limit
+
+        Returns:
+            float: monotonic time the slot was acquired, pass it to release()
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started: float, congested: bool) -> None:
+        """give back a slot, adjusting the limit by how its request went
+
+        Args:
+            started (float): value returned by acquire()
+            congested (bool): the request was slow, throttled, or failed
+        """
+        with self.condition:
+            self.adjust(started, congested)
+            self.condition.notify_all()
+
+    def adjust(self, started: float, congested: bool) -> None:
+        """free a slot and grow or shrink the limit, holding the condition"""
+        self.in_flight -= 1
+        if congested:
+            # requests sent before the last decrease were already counted
+            if started >= self.decreased:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self.decreased = time.monotonic()
+        else:
+            # about +1 per limit's worth of successful requests
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class AsyncAIMDLimiter(AIMDLimiter):
+    """AIMDLimiter for coroutines, which wait for a slot without blocking
+    their event loop"""
+
+    def __init__(
+        self,
+        limit: int = MAX_LIMIT,
+        min_limit: int = MIN_LIMIT,
+        max_limit: int = MAX_LIMIT,
+    ):
+        super().__init__(limit, min_limit, max_limit)
+        self.condition = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            return time.monotonic()
+
+    async def release(self, started: float, congested: bool) -> None:
+        async with self.condition:
+            self.adjust(started, congested)
+            # wake only as many waiters as there are free slots, there can be
+            # thousands of tasks waiting
+            self.condition.notify(max(0, int(self.limit) - self.in_flight))
+
+
+class Throttle:
+    """rate limit, concurrency limit, and retry policy shared by one client
+
+    Args:
+        rate (float): requests per second, 0 for no limit (default: RATE)
+        burst (int): requests that can start at once (default: BURST)
+        min_limit (int): lowest in-flight limit (default: MIN_LIMIT)
+        max_limit (int): highest in-flight limit (default: MAX_LIMIT)
+        max_retries (int): retries per request before giving up (default: MAX_RETRIES)
+        latency_factor (float): slowdown over a wsfunction's fastest response
+        that counts as congestion (default: LATENCY_FACTOR)
+    """
+
+    def __init__(
+        self,
+        rate: float = RATE,
+        burst: int = BURST,
+        min_limit: int = MIN_LIMIT,
+        max_limit: int = MAX_LIMIT,
+        max_retries: int = MAX_RETRIES,
+        latency_factor: float = LATENCY_FACTOR,
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AIMDLimiter(max_limit, min_limit, max_limit)
+        self.max_retries: int = max_retries
+        self.latency_factor: float = latency_factor
+        # fastest response seen per wsfunction
+        self.baselines: dict[str, float] = {}
+        self.counters: Counter[str] = Counter()
+        self.lock = threading.Lock()
+
+    def copy(self) -> "Throttle":
+        """a throttle with the same rate, limits, and retry policy, and none of
+        this one's tokens, requests in flight, or counters"""
+        return Throttle(
+            self.bucket.rate,
+            self.bucket.burst,
+            self.limiter.min_limit,
+            self.limiter.max_limit,
+            self.max_retries,
+            self.latency_factor,
+        )
+
+    def count(self, name: str, n: float = 1) -> None:
+        with self.lock:
+            self.counters[name] += n
+
+    def acquire(self) -> float:
+        """wait for the rate and in-flight limits, returns a start time"""
+        wait: float = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return self.limiter.acquire()
+
+    def reserve(self) -> float:
+        """take a rate limit token, returns seconds to wait before using it"""
+        wait: float = self.bucket.reserve()
+        if wait:
+            self.count("rate_limited")
+            self.count("rate_wait_seconds", wait)
+        return wait
+
+    def release(self, wsfunction: str, started: float, failed: bool) -> None:
+        """record how a request went
+
+        Args:
+            wsfunction (str): function the request called
+            started (float): value returned by acquire()
+            failed (bool): Moodle pushed back (5xx, 429, dropped connection)
+        """
+        slow: bool = self.slow(wsfunction, started)
+        self.limiter.release(started, failed or slow)
+
+    def slow(self, wsfunction: str, started: float) -> bool:
+        """count a finished request, is it slow enough to count as congestion?"""
+        latency: float = time.monotonic() - started
+        with self.lock:
+            self.counters["requests"] += 1
+            baseline: float = min(self.baselines.get(wsfunction, latency), latency)
+            self.baselines[wsfunction] = baseline
+            slow: bool = latency > max(SLOW, baseline * self.latency_factor)
+            if slow:
+                self.counters["slow"] += 1
+        return slow
+
+    def retry(self, attempt: int, reason: str, retry_after: str | None = None) -> bool:
+        """sleep before retrying a failed request
+
+        Args:
+            attempt (int): retries already made for this request
+            reason (str): counter to increment, e.g. "server_errors"
+            retry_after (str|None): Retry-After header of a 429 or 503
+
+        Returns:
+            bool: False if the request is out of retries and should fail
+        """
+        delay: float | None = self.retry_delay(attempt, reason, retry_after)
+        if delay is None:
+            return False
+        time.sleep(delay)
+        return True
+
+    def retry_delay(
+        self, attempt: int, reason: str, retry_after: str | None = None
+    ) -> float | None:
+        """count a failed request and pick how long to wait before retrying it,
+        same arguments as retry()
+
+        Returns:
+            float|None: seconds to wait, None if out of retries
+        """
+        self.count(reason)
+        if attempt >= self.max_retries:
+            self.count("gave_up")
+            return None
+        delay: float = backoff(attempt)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        self.count("retries")
+        self.count("backoff_seconds", delay)
+        return delay
+
+    def stats(self) -> dict[str, Any]:
+        """counters plus the current in-flight limit"""
+        with self.lock:
+            stats: dict[str, Any] = dict(self.counters)
+        stats["limit"] = int(self.limiter.limit)
+        stats["in_flight"] = self.limiter.in_flight
+        return stats
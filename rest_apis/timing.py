@@ -0,0 +1,164 @@
+"""Lightweight instrumentation of where a run spends its time.
+
+The shared client records each request's latency and size, and the time spent
+decoding its JSON, per wsfunction. Scripts wrap their own work (CSV writing,
+enrollment generation) in named timers. Recording is always on since it's only
+a few clock reads per request; `--profile` prints the summary when the run is
+over and `--profile-json FILE` also saves it for comparing runs.
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+import click
+
+
+def percentile(values: list[float], p: float) -> float:
+    """nearest-rank percentile of already sorted values"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+def human_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+
+class Timings:
+    """thread-safe collection of request measurements and named timers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.bytes: dict[str, int] = defaultdict(int)
+        self.decode: dict[str, float] = defaultdict(float)
+        self.timers: dict[str, list[float]] = defaultdict(lambda: [0, 0.0])
+
+    def request(self, wsfunction: str, seconds: float, size: int) -> None:
+        """record one HTTP request (retries are separate requests)"""
+        with self.lock:
+            self.latencies[wsfunction].append(seconds)
+            self.bytes[wsfunction] += size
+
+    def decoded(self, wsfunction: str, seconds: float) -> None:
+        """record time spent parsing a response's JSON"""
+        with self.lock:
+            self.decode[wsfunction] += seconds
+
+    def streamed(self, wsfunction: str, seconds: float, size: int) -> None:
+        """record a streamed body, downloaded and decoded together"""
+        with self.lock:
+            self.bytes[wsfunction] += size
+            self.decode[wsfunction] += seconds
+
+    def add(self, name: str, seconds: float) -> None:
+        with self.lock:
+            timer: list[float] = self.timers[name]
+            timer[0] += 1
+            timer[1] += seconds
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """time the enclosed block, accumulating under `name`"""
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.latencies.clear()
+            self.bytes.clear()
+            self.decode.clear()
+            self.timers.clear()
+
+    def summary(self) -> dict[str, Any]:
+        """JSON-serializable summary, times in seconds"""
+        with self.lock:
+            requests: dict[str, Any] = {}
+            for wsfunction, latencies in self.latencies.items():
+                ordered: list[float] = sorted(latencies)
+                requests[wsfunction] = {
+                    "count": len(ordered),
+                    "bytes": self.bytes[wsfunction],
+                    "total": sum(ordered),
+                    "p50": percentile(ordered, 50),
+                    "p95": percentile(ordered, 95),
+                    "p99": percentile(ordered, 99),
+                    "decode": self.decode[wsfunction],
+                }
+            timers: dict[str, Any] = {
+                name: {"count": int(count), "total": total}
+                for name, (count, total) in self.timers.items()
+            }
+        return {"requests": requests, "timers": timers}
+
+    def report(self) -> str:
+        """summary formatted as plain text tables"""
+        summary: dict[str, Any] = self.summary()
+        lines: list[str] = []
+        if summary["requests"]:
+            lines.append(
+                f"{'wsfunction':<40} {'calls':>6} {'bytes':>9} {'p50':>8} "
+                f"{'p95':>8} {'p99':>8} {'decode':>8}"
+            )
+            for wsfunction, r in summary["requests"].items():
+                lines.append(
+                    f"{wsfunction:<40} {r['count']:>6} {human_bytes(r['bytes']):>9} "
+                    f"{r['p50'] * 1000:>6.1f}ms {r['p95'] * 1000:>6.1f}ms "
+                    f"{r['p99'] * 1000:>6.1f}ms {r['decode'] * 1000:>6.1f}ms"
+                )
+        if summary["timers"]:
+            if lines:
+                lines.append("")
+            lines.append(f"{'timer':<40} {'calls':>6} {'total':>9} {'mean':>8}")
+            for name, t in summary["timers"].items():
+                lines.append(
+                    f"{name:<40} {t['count']:>6} {t['total']:>8.3f}s "
+                    f"{t['total'] / t['count'] * 1000:>6.2f}ms"
+                )
+        return "\n".join(lines) or "Nothing was timed"
+
+
+# shared by the client and every script in the process
+timings = Timings()
+
+
+def profile_options(fn):
+    """add --profile and --profile-json options to a click command"""
+    fn = click.option(
+        "--profile-json",
+        help="Also save the profile summary to this JSON file",
+        type=click.Path(dir_okay=False, path_type=Path),
+    )(fn)
+    fn = click.option(
+        "--profile",
+        is_flag=True,
+        help="Print request latency and timer summary when done",
+    )(fn)
+    return fn
+
+
+@contextmanager
+def profiled(profile: bool, profile_json: Path | None) -> Iterator[None]:
+    """report the timings of the enclosed block per the profile_options values,
+    even if it fails partway"""
+    try:
+        yield
+    finally:
+        if profile or profile_json:
+            print(timings.report(), file=sys.stderr)
+        if profile_json:
+            with open(profile_json, "w") as fh:
+                json.dump(timings.summary(), fh, indent=2)